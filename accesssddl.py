@@ -0,0 +1,210 @@
+﻿#-*- coding: utf-8 -*-
+'''Usage:
+	python accesssddl.py --sid <SID> [--sid <SID> ...] [--claims F] [--namespace NS] <dumpfile|->
+
+Effective access of a set of SIDs (a user and its groups) on parsed DACLs.
+The dump is read like 'readsddl.py --bulk' input and one line
+	path<TAB>granted mask<TAB>rights
+is printed per descriptor.
+
+DACL evaluation follows Windows: ACEs are walked in order and the first ACE
+mentioning a bit decides it, so a canonical DACL denies before it allows.
+Inherit-only ACEs are skipped, generic rights are mapped to the rights of the
+namespace (C_FILE_GENERIC_* for files), the owner gets READ_CONTROL and
+WRITE_DAC unless an OWNER RIGHTS ACE is present. A missing DACL or a NULL
+DACL grants everything. Callback allow ACEs are ignored, callback deny ACEs
+apply, unless claims are given (--claims, a JSON file, see condsddl.py): then
+a callback allow ACE applies when its condition is TRUE and a callback deny
+ACE unless it is FALSE.
+
+Descriptors are evaluated once per distinct value; with NumPy the distinct
+DACLs are evaluated together as arrays of masks and type codes.'''
+
+import sys
+
+import readsddl as rs
+import canonsddl, cachesddl
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+ALLOW_TYPES  = {rs.SDDL_TYPE[k][2] for k in ('A', 'OA')}
+CALLBACK_ALLOW_TYPES = {rs.SDDL_TYPE[k][2] for k in ('XA', 'ZA')}
+DENY_TYPES   = {rs.SDDL_TYPE[k][2] for k in ('D', 'OD', 'XD')}
+OBJECT_TYPES = {rs.SDDL_TYPE[k][2] for k in ('OA', 'OD', 'ZA')}
+INHERIT_ONLY = rs.SDDL_FLAGS["IO"][2]
+OWNER_RIGHTS = ('OW', 'S-1-3-4')
+OWNER_IMPLICIT = rs.C_READ_CONTROL | rs.C_WRITE_DAC
+
+ACE_SKIP, ACE_ALLOW, ACE_DENY = 0, 1, 2
+
+FULL_ACCESS = {
+	"file"     : rs.C_FILE_ALL_ACCESS,
+	"registry" : rs.C_KEY_ALL_ACCESS,
+}
+
+# ================================================== Single descriptor:
+
+class AccessEvaluator(object):
+	def __init__(self, sids, namespace='file', use_numpy=None, descriptors=None, claims=None):
+		self.sids = {canonsddl.SID_ALIASES.get(s, s) for s in sids}
+		self.claims = claims							# condsddl.Claims or None
+		self.namespace = namespace
+		self.full = FULL_ACCESS.get(namespace, 0xFFFFFFFF)
+		self.use_numpy = np is not None if use_numpy is None else use_numpy and np is not None
+		self.descriptors = descriptors if descriptors is not None else cachesddl.DescriptorCache()
+		self.masks = {}								# distinct item -> granted mask
+
+	def _kind(self, ace):
+		if ace.flags & INHERIT_ONLY or canonsddl._sid(ace.sid) not in self.sids:
+			return ACE_SKIP
+		if ace.type in OBJECT_TYPES and ace.object_guid:		# applies to a property set only
+			return ACE_SKIP
+		if ace.condition and self.claims is not None:
+			import condsddl
+			if not condsddl.ace_applies(ace, self.claims):
+				return ACE_SKIP
+			if ace.type in CALLBACK_ALLOW_TYPES:
+				return ACE_ALLOW
+		if ace.type in ALLOW_TYPES:
+			return ACE_ALLOW
+		if ace.type in DENY_TYPES:
+			return ACE_DENY
+		return ACE_SKIP
+
+	def _owner(self, sd):
+		if canonsddl._sid(sd.owner) not in self.sids:
+			return 0
+		for ace in sd.dacl.aces:
+			if ace.sid in OWNER_RIGHTS:
+				return 0
+		return OWNER_IMPLICIT
+
+	def evaluate(self, sd):
+		if isinstance(sd, str):
+			sd = self.descriptors.parse(sd)
+		if sd.dacl is None or sd.dacl.aces is None:
+			return self.full
+		granted = decided = 0
+		for ace in sd.dacl.aces:
+			kind = self._kind(ace)
+			if kind == ACE_SKIP:
+				continue
+			mask = canonsddl.map_generic(ace.mask, self.namespace)
+			if kind == ACE_ALLOW:
+				granted |= mask & ~decided
+			decided |= mask
+		return granted | self._owner(sd)				# whatever the DACL denies
+
+	# ---------------------------------- Batches
+
+	def _evaluate_arrays(self, descriptors):
+		width = max(len(sd.dacl.aces) for sd in descriptors)
+		n = len(descriptors)
+		masks = np.zeros((n, width), dtype=np.uint32)
+		kinds = np.zeros((n, width), dtype=np.uint8)
+		for i, sd in enumerate(descriptors):
+			for j, ace in enumerate(sd.dacl.aces):
+				kind = self._kind(ace)
+				if kind != ACE_SKIP:
+					kinds[i, j] = kind
+					masks[i, j] = canonsddl.map_generic(ace.mask, self.namespace)
+		granted = np.zeros(n, dtype=np.uint32)
+		decided = np.zeros(n, dtype=np.uint32)
+		for j in range(width):						# one vector step per ACE position
+			m = np.where(kinds[:, j] != ACE_SKIP, masks[:, j], 0).astype(np.uint32)
+			granted |= np.where(kinds[:, j] == ACE_ALLOW, m & ~decided, 0).astype(np.uint32)
+			decided |= m
+		owner = np.array([self._owner(sd) for sd in descriptors], dtype=np.uint32)
+		return (granted | owner).tolist()
+
+	def evaluate_many(self, items):
+		'''Granted masks for SDDL strings or Descriptors, in order. Each distinct
+		item is parsed and evaluated once (and remembered across calls).'''
+		cache = self.masks
+		todo = {}
+		for item in items:
+			if item not in cache and item not in todo:
+				todo[item] = self.descriptors.parse(item) if isinstance(item, str) else item
+		new = {}
+		full, arrays = [], []
+		for item, sd in todo.items():
+			if sd.dacl is None or sd.dacl.aces is None or not sd.dacl.aces:
+				full.append(item)
+			else:
+				arrays.append(item)
+		for item in full:
+			new[item] = self.evaluate(todo[item])
+		if arrays and self.use_numpy:
+			new.update(zip(arrays, self._evaluate_arrays([todo[i] for i in arrays])))
+		else:
+			for item in arrays:
+				new[item] = self.evaluate(todo[item])
+		result = [new[item] if item in new else cache[item] for item in items]
+		if len(cache) + len(new) > self.descriptors.maxsize:
+			cache.clear()
+		cache.update(new)
+		return result
+
+def effective_access(sd, sids, namespace='file', claims=None):
+	return AccessEvaluator(sids, namespace, claims=claims).evaluate(sd)
+
+# ================================================== MAIN PROGRAM
+
+def main(argv):
+	import argparse, streamsddl
+	ap = argparse.ArgumentParser(add_help=False)
+	ap.add_argument('source', nargs='?')
+	ap.add_argument('--sid', action='append', default=[])
+	ap.add_argument('--claims')
+	ap.add_argument('--namespace', choices=list(rs.MASK_NAMESPACES), default='file')
+	ap.add_argument('--batch', type=int, default=65536)
+	args = ap.parse_args(argv[1:])
+	if args.source is None or not args.sid:
+		print(__doc__)
+		sys.exit(0)
+	claims = None
+	if args.claims:
+		import json, condsddl
+		try:
+			with open(args.claims) as fp:
+				claims = condsddl.Claims.from_dict(json.load(fp))
+		except (IOError, ValueError) as e:
+			print("ERROR: Cannot read claims: ", e, file=sys.stderr)
+			sys.exit(1)
+	evaluator = AccessEvaluator(args.sid, args.namespace, claims=claims)
+	stats = streamsddl.Stats()
+	write = sys.stdout.write
+	try:
+		records = streamsddl.read_records(streamsddl.iter_lines(args.source), stats)
+		batch = []
+		for rec in records:
+			batch.append(rec)
+			if len(batch) >= args.batch:
+				_flush(evaluator, batch, write, stats)
+				batch = []
+		_flush(evaluator, batch, write, stats)
+	except IOError as e:
+		print("ERROR: Cannot read dump: ", e, file=sys.stderr)
+		sys.exit(1)
+	print(stats.summary(), file=sys.stderr)
+
+def _flush(evaluator, batch, write, stats):
+	good = []
+	for lineno, path, sddl in batch:
+		try:
+			if sddl not in evaluator.masks:
+				evaluator.descriptors.parse(sddl)
+			good.append((path, sddl))
+		except rs.SDDLError as e:
+			stats.errors += 1
+			print("ERROR: line {}: {}".format(lineno, e), file=sys.stderr)
+	masks = evaluator.evaluate_many([sddl for path, sddl in good])
+	for (path, sddl), mask in zip(good, masks):
+		write('{}\t0x{:08x}\t{}\n'.format(path, mask, rs.rights_names(mask, evaluator.namespace)))
+	stats.records += len(good)
+
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,362 @@
+﻿#-*- coding: utf-8 -*-
+'''Usage:
+	python benchsddl.py [count]
+	python benchsddl.py --scaling [lines]
+	python benchsddl.py --suite [--count N] [--dup R] [--seed S] [--json F] [--compare F]
+	python benchsddl.py --daemon [--clients 1,4,16] [--requests N] [--batch N] [--op OP]
+
+Compare the legacy print-driven parse_sddl() with the structured
+parse_descriptor() API of readsddl on a fixed sample of descriptors.
+Printing stages write to os.devnull. The same descriptors are also encoded
+as binary self-relative descriptors and decoded with binsddl, against the
+text round trip through descriptor_to_string() and parse_descriptor().
+
+With --scaling a temporary dump of the given number of lines is parsed by
+streamsddl.run_parallel() with 1, 2, 4 ... up to os.cpu_count() workers.
+
+--suite runs every stage over a synthetic corpus from gensddl.py (the same
+seed gives the same corpus) with cold caches: parse_descriptor, parse_sddl,
+decode_mask of every ACE mask, show_file_sddl from a recorded dump, the
+binary decoder, every rendersddl format on parsed records and the streaming
+bulk parser. Each stage reports throughput,
+per-ACE latency percentiles and, in a second pass under tracemalloc, peak
+memory. --json writes the results for later runs to --compare against.
+
+--daemon starts daemonsddl.py on a temporary socket and sends --requests
+requests of --batch corpus descriptors each from 1, 4, 16 ... concurrent
+clients (threads with one connection each), reporting requests/s, items/s
+and request latency percentiles, next to the cost of one readsddl.py process
+per descriptor.'''
+
+import os, sys, re, json, time, platform, tempfile, tracemalloc
+from contextlib import redirect_stdout
+
+import readsddl as rs
+
+DOMAIN  = 'S-1-5-21-3623811015-3361044348-30300820'
+SAMPLES = [
+	'D:AI(A;ID;0x1301bf;;;AU)(A;ID;FA;;;SY)(A;ID;FA;;;BA)(A;ID;0x1301bf;;;BU)',
+	'D:PAI(A;OICI;FA;;;SY)(A;OICI;FA;;;BA)(A;OICIIO;GA;;;CO)(A;OICI;0x1200a9;;;BU)(A;CI;LCSWRPWP;;;BU)',
+	'D:AI(D;;SD;;;WD)(A;ID;FA;;;S-1-5-21-3623811015-3361044348-30300820-1013)(A;OICIID;FR;;;DU)',
+	'D:P(A;;KA;;;BA)(A;;KR;;;BU)(A;CIIO;GA;;;CO)',
+]
+
+# ---------------------------------- Baseline implementation (as shipped before parse_descriptor)
+
+def legacy_parse_sddl(sddl):
+	sddls = sddl.replace(')','').split('(')
+	for i in range(len(sddls)):
+		dl = sddls[i]
+		if i == 0:
+			dacl, flags = dl.split(':')
+			print("  {} :: ".format(dl), end='')
+			m = 0
+			if re.match('^P', flags):
+				print('SDDL_PROTECTED', end='')
+				flags = flags[1::]
+				m += 1
+			if re.match('AR', flags):
+				if m != 0: print(', ', end='')
+				m += 1
+				print('SDDL_AUTO_INHERIT_REQ', end='')
+			if re.match('AI', flags):
+				if m != 0: print(', ', end='')
+				m += 1
+				print('SDDL_AUTO_INHERITED', end='')
+			if m != 0:
+				print()
+		else:
+			type, flags, rights, guid, iguid, sid = dl.split(';')
+			print("  {:20}".format(dl))
+			if len(sid) > 0:
+				if sid in rs.SDDL_SIDS:
+					sidname = rs.SDDL_SIDS[sid]
+				else:
+					sidname = '<<sid>>'
+				print('    {:30}'.format(sidname), end='')
+			print('{:25} '.format(rs.SDDL_TYPE[type][0]), end='')
+			fl = ''
+			if len(flags) > 0:
+				for i in range(0, len(flags), 2):
+					if len(fl) > 0: fl += '|'
+					fl += rs.SDDL_FLAGS[flags[i:i+2]][0]
+			print('{:35} '.format(fl), end='')
+			if len(rights) > 0:
+				if rights in rs.SDDL_RIGHTS:
+					r = rs.SDDL_RIGHTS[rights][0]
+				elif re.match('0x[0-9A-F]',rights):
+					toint = int(rights, 16)
+					r = ''
+					for g in rs.SDDL_CMPST_RIGHTS:
+						mask = rs.SDDL_RIGHTS[g][2]
+						if (toint & mask) == mask:
+							toint -= mask
+							if len(r) > 0:
+								r += '|'
+							r += rs.SDDL_RIGHTS[g][0]
+					while toint > 0:
+						for v in rs.SDDL_RIGHTS.values():
+							if (toint & v[2]) == v[2]:
+								toint -= v[2]
+								if len(r) > 0:
+									r += '|'
+								r += v[0]
+				else:
+					r = 'non standard'
+				print('{:16}'.format(r), end='')
+			print()
+
+# ---------------------------------- Runner
+
+def bench(func, count, samples=SAMPLES):
+	t0 = time.perf_counter()
+	for i in range(count):
+		for s in samples:
+			func(s)
+	return time.perf_counter() - t0
+
+def report(name, dt, count):
+	aces = sum(s.count('(') for s in SAMPLES)
+	n = count * len(SAMPLES)
+	print("{:32} {:12.0f} desc/s {:10.3f} us/ace".format(name, n / dt, dt * 1e6 / (count * aces)))
+
+def scaling(lines):
+	import streamsddl
+	with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+		for i in range(lines):
+			f.write('C:\\Share\\dir{}\\file{}.txt "{}"\n'.format(i % 100, i, SAMPLES[i % len(SAMPLES)]))
+		path = f.name
+	try:
+		cores = os.cpu_count() or 1
+		counts = sorted({1, cores} | {1 << i for i in range(cores.bit_length()) if 1 << i <= cores})
+		base = None
+		for workers in counts:
+			t0 = time.perf_counter()
+			with open(os.devnull, 'w') as null:
+				streamsddl.run_parallel(path, null, 'tsv', workers=workers, chunk_size=1 << 20)
+			dt = time.perf_counter() - t0
+			base = base or dt
+			print("{:2} workers {:12.0f} lines/s {:8.2f} x".format(workers, lines / dt, base / dt))
+	finally:
+		os.remove(path)
+
+# ---------------------------------- Suite over a synthetic corpus
+
+PERCENTILES = (50, 90, 99)
+
+def reset_caches():
+	'''Empty the memo caches of readsddl and rendersddl (not the lookup tables).'''
+	for cache in (rs._FLAGS_CACHE, rs._RIGHTS_CACHE):
+		cache.clear()
+		cache[''] = 0
+	for cache in (rs._FLAGS_TEXT, rs._FLAGS_NAMES):
+		cache.clear()
+	for decoder in rs._MASK_DECODERS.values():
+		decoder.decode.cache_clear()
+	import rendersddl
+	rendersddl._ACE_TEXT.clear()
+	rs._HUMAN_RENDERERS.clear()
+
+def render_stage(fmt):
+	'''A fresh renderer per pass, so that both passes start cold.'''
+	import rendersddl
+	r = rendersddl.renderer(fmt)
+	return lambda rec: r.format(*rec)
+
+def percentiles(values):
+	values = sorted(values)
+	if not values:
+		return None
+	return {"p{}".format(p): round(values[min(len(values) - 1, len(values) * p // 100)], 3) for p in PERCENTILES}
+
+def run_stage(make, items, weights):
+	'''Time the function returned by make() over items (one call per item,
+	weights = ACEs per item), then measure peak memory in a second pass.'''
+	reset_caches()
+	func = make()
+	clock = time.perf_counter_ns
+	latency = []
+	t0 = time.perf_counter()
+	for item, aces in zip(items, weights):
+		t = clock()
+		func(item)
+		latency.append((clock() - t) / 1e3 / max(aces, 1))
+	dt = time.perf_counter() - t0
+	reset_caches()
+	func = make()
+	tracemalloc.start()
+	for item in items:
+		func(item)
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return dt, latency, peak
+
+def stage_result(items, aces, dt, latency, peak):
+	return {
+		"items": items, "aces": aces, "seconds": round(dt, 4),
+		"items_per_s": round(items / dt), "aces_per_s": round(aces / dt),
+		"ace_us": percentiles(latency), "peak_kb": round(peak / 1024),
+	}
+
+def suite(count, dup=0.9, seed=1):
+	import gensddl, binsddl, sourcesddl, streamsddl, rendersddl
+	corpus = list(gensddl.generate(count, dup, seed))
+	sds = [rs.parse_descriptor(s) for s in corpus]
+	weights = [len(sd.dacl.aces or ()) + (len(sd.sacl.aces or ()) if sd.sacl else 0) for sd in sds]
+	masks = [ace.mask for sd in sds for ace in sd.dacl.aces or ()]
+	blobs = [binsddl.encode_descriptor(sd, gensddl.DOMAIN) for sd in sds]
+	sids  = binsddl.SidTable(gensddl.DOMAIN)
+	results = {}
+
+	with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as null:
+		dump = os.path.join(tmp, 'corpus.txt')
+		with open(dump, 'w', encoding='utf-8') as f:
+			gensddl.write_corpus(f, corpus, 'tsv')
+		source = sourcesddl.DumpSource(dump)
+		paths = [path for path, sddl in source.entries.values()]
+		stages = [
+			('parse_descriptor', lambda: rs.parse_descriptor, corpus, weights),
+			('parse_sddl', lambda: rs.parse_sddl, corpus, weights),
+			('decode_mask', lambda: lambda m: rs.decode_mask(m, 'file'), masks, [1] * len(masks)),
+			('show_file_sddl', lambda: lambda p: rs.show_file_sddl(p, 'any', source), paths, weights),
+			('binary decode_descriptor', lambda: lambda b: binsddl.decode_descriptor(b, 0, sids), blobs, weights),
+		]
+		records = list(zip(paths, corpus, sds))
+		for fmt in ('human', 'jsonl', 'csv', 'tsv'):			# rendering only, descriptors already parsed
+			stages.append(('render ' + fmt, lambda fmt=fmt: render_stage(fmt), records, weights))
+		for name, func, items, w in stages:
+			with redirect_stdout(null):
+				dt, latency, peak = run_stage(func, items, w)
+			results[name] = stage_result(len(items), sum(w), dt, latency, peak)
+
+		reset_caches()
+		t0 = time.perf_counter()
+		stats = streamsddl.run(dump, null, 'jsonl')
+		dt = time.perf_counter() - t0
+		reset_caches()
+		tracemalloc.start()
+		streamsddl.run(dump, null, 'jsonl')
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+		results['bulk jsonl'] = stage_result(stats.records, stats.aces, dt, [], peak)
+
+	return {
+		"version": 1,
+		"python": platform.python_version(),
+		"platform": platform.platform(),
+		"corpus": {"count": count, "dup": dup, "seed": seed, "distinct": len(set(corpus))},
+		"stages": results,
+	}
+
+def print_suite(result, baseline=None):
+	print("{:26} {:>12} {:>12} {:>9} {:>9} {:>9} {:>10}".format('stage', 'items/s', 'ACEs/s', 'p50 us', 'p90 us', 'p99 us', 'peak KB'))
+	for name, r in result["stages"].items():
+		p = r["ace_us"] or {}
+		line = "{:26} {:12} {:12} {:>9} {:>9} {:>9} {:10}".format(name, r["items_per_s"], r["aces_per_s"],
+			p.get("p50", '-'), p.get("p90", '-'), p.get("p99", '-'), r["peak_kb"])
+		old = (baseline or {}).get("stages", {}).get(name)
+		if old:
+			line += "  {:6.2f} x".format(r["aces_per_s"] / max(old["aces_per_s"], 1))
+		print(line)
+
+# ---------------------------------- Daemon throughput
+
+def daemon(clients=(1, 4, 16), requests=2000, batch=16, op='parse', count=20000, seed=1):
+	import gensddl, daemonsddl, socket, subprocess, threading
+	corpus = list(gensddl.generate(count, 0.9, seed))
+	items = corpus if op != 'decode_mask' else [ace.mask for s in corpus[:1000] for ace in rs.parse_descriptor(s).dacl.aces]
+	params = {"sids": ['WD', 'AU', 'BU']} if op == 'access' else {}
+	t0 = time.perf_counter()
+	subprocess.run([sys.executable, rs.__file__, '/S:' + corpus[0]], stdout=subprocess.DEVNULL)
+	print("one readsddl.py process per descriptor: {:.1f} ms".format((time.perf_counter() - t0) * 1e3))
+	with tempfile.TemporaryDirectory() as tmp:
+		if hasattr(socket, 'AF_UNIX'):
+			path, port = os.path.join(tmp, 'bench.sock'), None
+			where = ['--socket', path]
+		else:
+			path, port = None, daemonsddl.DEFAULT_PORT
+			where = ['--port', str(port)]
+		proc = subprocess.Popen([sys.executable, daemonsddl.__file__, '--serve'] + where, stderr=subprocess.PIPE)
+		try:
+			proc.stderr.readline()					# "Serving on ..." once listening
+			print("{:8} {:>12} {:>12} {:>9} {:>9} {:>9}".format('clients', 'requests/s', 'items/s', 'p50 us', 'p90 us', 'p99 us'))
+			for n in clients:
+				latency = []
+				def client(k, per_client=max(requests // n, 1)):
+					clock = time.perf_counter_ns
+					mine = []
+					with daemonsddl.Client(path, port) as c:
+						for i in range(per_client):
+							start = ((k * per_client + i) * batch) % max(len(items) - batch, 1)
+							t = clock()
+							c.call(op, items[start:start + batch], **params)
+							mine.append((clock() - t) / 1e3)
+					latency.extend(mine)
+				threads = [threading.Thread(target=client, args=(k,)) for k in range(n)]
+				t0 = time.perf_counter()
+				for t in threads:
+					t.start()
+				for t in threads:
+					t.join()
+				dt = time.perf_counter() - t0
+				p = percentiles(latency) or {}
+				print("{:8} {:12.0f} {:12.0f} {:>9} {:>9} {:>9}".format(n, len(latency) / dt, len(latency) * batch / dt,
+					p.get("p50", '-'), p.get("p90", '-'), p.get("p99", '-')))
+		finally:
+			proc.terminate()
+			proc.wait()
+
+def main(argv):
+	if len(argv) > 1 and argv[1] == '--scaling':
+		scaling(int(argv[2]) if len(argv) > 2 else 200000)
+		return
+	if len(argv) > 1 and argv[1] == '--suite':
+		import argparse
+		ap = argparse.ArgumentParser(add_help=False)
+		ap.add_argument('--count', type=int, default=20000)
+		ap.add_argument('--dup', type=float, default=0.9)
+		ap.add_argument('--seed', type=int, default=1)
+		ap.add_argument('--json')
+		ap.add_argument('--compare')
+		args = ap.parse_args(argv[2:])
+		baseline = None
+		if args.compare:
+			with open(args.compare) as f:
+				baseline = json.load(f)
+		result = suite(args.count, args.dup, args.seed)
+		print_suite(result, baseline)
+		if args.json:
+			with open(args.json, 'w') as f:
+				json.dump(result, f, indent=1)
+		return
+	if len(argv) > 1 and argv[1] == '--daemon':
+		import argparse
+		ap = argparse.ArgumentParser(add_help=False)
+		ap.add_argument('--clients', default='1,4,16')
+		ap.add_argument('--requests', type=int, default=2000)
+		ap.add_argument('--batch', type=int, default=16)
+		ap.add_argument('--op', choices=['parse', 'decode_mask', 'canonicalize', 'access'], default='parse')
+		args = ap.parse_args(argv[2:])
+		daemon([int(n) for n in args.clients.split(',')], args.requests, args.batch, args.op)
+		return
+	count = int(argv[1]) if len(argv) > 1 else 20000
+	with open(os.devnull, 'w') as null, redirect_stdout(null):
+		legacy = bench(legacy_parse_sddl, count)
+		render = bench(rs.parse_sddl, count)
+	parse = bench(rs.parse_descriptor, count)
+
+	import binsddl
+	sids  = binsddl.SidTable(DOMAIN)
+	blobs = [binsddl.encode_descriptor(rs.parse_descriptor(s), DOMAIN) for s in SAMPLES]
+	binary = bench(lambda b: binsddl.decode_descriptor(b, 0, sids), count, blobs)
+	trip   = bench(lambda b: rs.parse_descriptor(rs.descriptor_to_string(binsddl.decode_descriptor(b, 0, sids)[0])), count, blobs)
+
+	report('legacy parse_sddl', legacy, count)
+	report('parse_sddl', render, count)
+	report('parse_descriptor', parse, count)
+	report('binary decode_descriptor', binary, count)
+	report('binary -> SDDL -> parse', trip, count)
+	print("{:32} {:12.2f} x (parse only), {:.2f} x (parse and print)".format('speedup vs legacy', legacy / parse, legacy / render))
+
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,376 @@
+﻿#-*- coding: utf-8 -*-
+'''Usage:
+	python binsddl.py [--domain S-1-5-21-x-y-z] <blobfile>
+
+Decode binary self-relative SECURITY_DESCRIPTORs (backup exports, AD
+ntSecurityDescriptor values, GetFileSecurity buffers) straight into the
+readsddl Descriptor / Acl / Ace tuples, without the SDDL text round trip.
+The blob file may hold several descriptors back to back; it is memory-mapped
+and read through memoryview / struct only. One SDDL string is printed per
+descriptor, so the output can be piped into 'readsddl.py --bulk -'.
+
+Well known SIDs are shown as their SDDL aliases; with --domain the domain
+relative ones (DA, DU, ...) are recognised too. The application data of
+callback ACEs (conditional expression bytecode, 'artx') is decoded back into
+the SDDL condition text, that of RA ACEs into the resource attribute; other
+application data is an error rather than dropped. No Windows runtime needed.'''
+
+import sys, mmap, struct
+from sys import intern
+
+import readsddl as rs
+
+SE_DACL_PRESENT = 0x0004
+SE_SACL_PRESENT = 0x0010
+SE_SELF_RELATIVE = 0x8000
+SACL_SHIFT      = 1						# SE_SACL_xxx control bits are the SE_DACL_xxx ones << 1
+
+ACE_OBJECT_TYPE_PRESENT           = 0x1
+ACE_INHERITED_OBJECT_TYPE_PRESENT = 0x2
+OBJECT_ACE_TYPES = {rs.SDDL_TYPE[k][2] for k in ('OA', 'OD', 'OU', 'OL', 'ZA')}
+CALLBACK_ACE_TYPES = {rs.SDDL_TYPE[k][2] for k in ('XA', 'XD', 'ZA', 'XU')}
+RESOURCE_ATTRIBUTE = rs.SDDL_TYPE['RA'][2]
+
+_SD_HEADER  = struct.Struct('<BBHIIII')		# Revision, Sbz1, Control, OffsetOwner, OffsetGroup, OffsetSacl, OffsetDacl
+_ACL_HEADER = struct.Struct('<BBHHH')		# AclRevision, Sbz1, AclSize, AceCount, Sbz2
+_ACE_HEADER = struct.Struct('<BBHI')		# AceType, AceFlags, AceSize, Mask
+_GUID       = struct.Struct('<IHH8s')
+_U32        = struct.Struct('<I')
+_LITERAL    = struct.Struct('<qBB')			# value, sign, base
+_CLAIM      = struct.Struct('<IHHII')		# Name, ValueType, Reserved, Flags, ValueCount
+
+# ================================================== SIDs and GUIDs:
+
+class SidTable(object):
+	'''Binary SID -> SDDL alias or S-1-... string, cached by the raw bytes.'''
+
+	def __init__(self, domain=None):
+		self.aliases = {v: k for k, v in rs.SDDL_SID_VALUES.items()}
+		if domain:
+			for k, rid in rs.SDDL_DOMAIN_RIDS.items():
+				self.aliases['{}-{}'.format(domain, rid)] = k
+		self.cache = {}
+
+	def decode(self, mv, off):
+		count = mv[off + 1]
+		end = off + 8 + 4 * count
+		raw = bytes(mv[off:end])
+		sid = self.cache.get(raw)
+		if sid is None:
+			auth = int.from_bytes(raw[2:8], 'big')
+			subs = struct.unpack_from('<{}I'.format(count), raw, 8)
+			text = 'S-{}-{}'.format(raw[0], auth if auth < 1 << 32 else '0x{:012x}'.format(auth))
+			if subs:
+				text += '-' + '-'.join(map(str, subs))
+			sid = self.cache[raw] = intern(self.aliases.get(text, text))
+		return sid, end
+
+_GUIDS = {}
+
+def decode_guid(mv, off):
+	raw = bytes(mv[off:off+16])
+	guid = _GUIDS.get(raw)
+	if guid is None:
+		d1, d2, d3, d4 = _GUID.unpack(raw)
+		guid = intern('{:08x}-{:04x}-{:04x}-{}-{}'.format(d1, d2, d3, d4[:2].hex(), d4[2:].hex()))
+		if len(_GUIDS) < rs._CACHE_LIMIT:
+			_GUIDS[raw] = guid
+	return guid
+
+# ================================================== Conditional expressions and resource attributes:
+# [MS-DTYP] 2.4.4.17: the expression is stored in postfix order, operands
+# before their operator, and is rebuilt here as parenthesized infix text.
+
+CONDITION_MAGIC = b'artx'
+
+_BINARY_OPS = {
+	0x80: '==', 0x81: '!=', 0x82: '<', 0x83: '<=', 0x84: '>', 0x85: '>=',
+	0x86: 'Contains', 0x88: 'Any_of', 0x8e: 'Not_Contains', 0x8f: 'Not_Any_of',
+	0xa0: '&&', 0xa1: '||',
+}
+_UNARY_OPS = {
+	0x87: 'Exists', 0x8d: 'Not_Exists',
+	0x89: 'Member_of', 0x8a: 'Device_Member_of', 0x8b: 'Member_of_Any', 0x8c: 'Device_Member_of_Any',
+	0x90: 'Not_Member_of', 0x91: 'Not_Device_Member_of', 0x92: 'Not_Member_of_Any', 0x93: 'Not_Device_Member_of_Any',
+	0xa2: '!',
+}
+_ATTRIBUTE_PREFIX = {0xf8: '', 0xf9: '@User.', 0xfa: '@Resource.', 0xfb: '@Device.'}
+_INTEGER_FORMAT = {1: '0{:o}', 2: '{}', 3: '0x{:x}'}		# octal, decimal, hexadecimal
+_CLAIM_TYPES = {1: 'TI', 2: 'TU', 3: 'TS', 5: 'TD', 6: 'TB', 0x10: 'TX'}
+
+def _utf16(data, off, size):
+	return data[off:off + size].decode('utf-16-le', 'replace')
+
+def _operands(data, pos, end, sids):
+	'''Decode the operand tokens in data[pos:end], return (texts, end).'''
+	out = []
+	while pos < end:
+		token = data[pos]
+		pos += 1
+		if 0x01 <= token <= 0x04:				# int8 .. int64, all stored as 8 bytes
+			value, sign, base = _LITERAL.unpack_from(data, pos)
+			pos += _LITERAL.size
+			out.append(('-' if value < 0 else '') + _INTEGER_FORMAT.get(base, '{}').format(abs(value)))
+			continue
+		if token not in (0x10, 0x18, 0x50, 0x51):
+			raise rs.SDDLError("Invalid conditional expression token 0x{:02x}".format(token))
+		size = _U32.unpack_from(data, pos)[0]
+		pos += 4
+		if pos + size > len(data):
+			raise rs.SDDLError("Truncated conditional expression")
+		if token == 0x10:						# Unicode string
+			out.append('"{}"'.format(_utf16(data, pos, size)))
+		elif token == 0x18:						# octet string
+			out.append('#' + data[pos:pos + size].hex())
+		elif token == 0x50:						# composite
+			out.append('{' + ', '.join(_operands(data, pos, pos + size, sids)[0]) + '}')
+		else:									# SID
+			out.append('SID({})'.format(sids.decode(memoryview(data), pos)[0]))
+		pos += size
+	return out, pos
+
+def decode_condition(data, sids=None):
+	'''SDDL text of the conditional expression bytecode of a callback ACE.'''
+	sids = sids or _default_sids
+	data = bytes(data)
+	if not data.strip(b'\0'):
+		return ''
+	if not data.startswith(CONDITION_MAGIC):
+		raise rs.SDDLError("Unsupported callback ACE application data")
+	stack = []
+	pos, end = len(CONDITION_MAGIC), len(data)
+	try:
+		while pos < end:
+			token = data[pos]
+			if token == 0:							# padding
+				pos += 1
+			elif token in _BINARY_OPS:
+				right, left = stack.pop(), stack.pop()
+				stack.append('({} {} {})'.format(left, _BINARY_OPS[token], right))
+				pos += 1
+			elif token in _UNARY_OPS:
+				op = _UNARY_OPS[token]
+				stack.append('({}{}{})'.format(op, '' if op == '!' else ' ', stack.pop()))
+				pos += 1
+			elif token in _ATTRIBUTE_PREFIX:
+				size = _U32.unpack_from(data, pos + 1)[0]
+				stack.append(_ATTRIBUTE_PREFIX[token] + _utf16(data, pos + 5, size))
+				pos += 5 + size
+			else:
+				values, pos = _operands(data, pos, pos + 1, sids)
+				stack.extend(values)
+	except IndexError:
+		raise rs.SDDLError("Invalid conditional expression")
+	if len(stack) != 1:
+		raise rs.SDDLError("Invalid conditional expression")
+	text = stack[0]
+	return text if text.startswith('(') else '(' + text + ')'
+
+def _utf16z(data, off):
+	end = off
+	while data[end:end + 2] != b'\0\0':
+		if end >= len(data):
+			raise rs.SDDLError("Truncated resource attribute")
+		end += 2
+	return data[off:end].decode('utf-16-le', 'replace')
+
+def decode_resource_attribute(data, sids=None):
+	'''SDDL text ("name",type,flags,values...) of the CLAIM_SECURITY_ATTRIBUTE_RELATIVE_V1 of an RA ACE.'''
+	sids = sids or _default_sids
+	data = bytes(data)
+	name, vtype, reserved, flags, count = _CLAIM.unpack_from(data, 0)
+	code = _CLAIM_TYPES.get(vtype)
+	if code is None:
+		raise rs.SDDLError("Unsupported resource attribute type 0x{:x}".format(vtype))
+	values = []
+	for off in struct.unpack_from('<{}I'.format(count), data, _CLAIM.size):
+		if vtype == 1:
+			values.append(str(struct.unpack_from('<q', data, off)[0]))
+		elif vtype in (2, 6):
+			values.append(str(struct.unpack_from('<Q', data, off)[0]))
+		elif vtype == 3:
+			values.append('"{}"'.format(_utf16z(data, off)))
+		elif vtype == 5:
+			values.append('SID({})'.format(sids.decode(memoryview(data), off + 4)[0]))
+		else:
+			size = _U32.unpack_from(data, off)[0]
+			values.append('#' + data[off + 4:off + 4 + size].hex())
+	return '("{}",{},0x{:x},{})'.format(_utf16z(data, name), code, flags, ','.join(values))
+
+# ================================================== Descriptors:
+
+def _decode_acl(mv, off, control, sids):
+	rev, sbz, size, count, sbz2 = _ACL_HEADER.unpack_from(mv, off)
+	end = off + size
+	pos = off + 8
+	aces = []
+	for i in range(count):
+		atype, aflags, asize, mask = _ACE_HEADER.unpack_from(mv, pos)
+		if atype not in rs.ACE_TYPE_NAMES:
+			raise rs.SDDLError("Unsupported ACE type 0x{:02x} at offset {}".format(atype, pos))
+		p = pos + 8
+		guid = iguid = ''
+		if atype in OBJECT_ACE_TYPES:
+			oflags = _U32.unpack_from(mv, p)[0]
+			p += 4
+			if oflags & ACE_OBJECT_TYPE_PRESENT:
+				guid = decode_guid(mv, p)
+				p += 16
+			if oflags & ACE_INHERITED_OBJECT_TYPE_PRESENT:
+				iguid = decode_guid(mv, p)
+				p += 16
+		sid, p = sids.decode(mv, p)
+		if asize < 8 or pos + asize > end:
+			raise rs.SDDLError("Invalid ACE size at offset {}".format(pos))
+		condition = ''
+		if atype in CALLBACK_ACE_TYPES and p < pos + asize:		# application data after the SID
+			condition = decode_condition(mv[p:pos + asize], sids)
+		elif atype == RESOURCE_ATTRIBUTE:
+			condition = decode_resource_attribute(mv[p:pos + asize], sids)
+		aces.append(rs.Ace(atype, aflags, mask, guid, iguid, sid, condition))
+		pos += asize
+	flags = 0
+	for v in rs.SDDL_ACL_FLAGS.values():
+		if control & v[2]:
+			flags |= v[2]
+	return rs.Acl(flags, tuple(aces)), end
+
+def decode_descriptor(buf, offset=0, sids=None):
+	'''Decode one self-relative descriptor at offset, return (Descriptor, end offset).'''
+	mv = buf if isinstance(buf, memoryview) else memoryview(buf)
+	if sids is None:
+		sids = _default_sids
+	try:
+		rev, sbz, control, o_owner, o_group, o_sacl, o_dacl = _SD_HEADER.unpack_from(mv, offset)
+		if rev != 1:
+			raise rs.SDDLError("Invalid descriptor revision {} at offset {}".format(rev, offset))
+		if not control & SE_SELF_RELATIVE:
+			raise rs.SDDLError("Descriptor at offset {} is not self-relative".format(offset))
+		end = offset + _SD_HEADER.size
+		owner = group = dacl = sacl = None
+		if o_owner:
+			owner, e = sids.decode(mv, offset + o_owner)
+			end = max(end, e)
+		if o_group:
+			group, e = sids.decode(mv, offset + o_group)
+			end = max(end, e)
+		if control & SE_DACL_PRESENT:
+			if o_dacl:
+				dacl, e = _decode_acl(mv, offset + o_dacl, control, sids)
+				end = max(end, e)
+			else:
+				dacl = rs.Acl(0, None)			# NULL DACL
+		if control & SE_SACL_PRESENT:
+			if o_sacl:
+				sacl, e = _decode_acl(mv, offset + o_sacl, control >> SACL_SHIFT, sids)
+				end = max(end, e)
+			else:
+				sacl = rs.Acl(0, None)
+	except (struct.error, IndexError):
+		raise rs.SDDLError("Truncated descriptor at offset {}".format(offset))
+	return rs.Descriptor(owner, group, dacl, sacl), end
+
+_default_sids = SidTable()
+
+def iter_descriptors(buf, sids=None):
+	'''Decode descriptors stored back to back (zero padding between them is skipped).'''
+	mv = buf if isinstance(buf, memoryview) else memoryview(buf)
+	pos, size = 0, len(mv)
+	while pos < size:
+		if mv[pos] == 0:
+			pos += 1
+			continue
+		sd, pos = decode_descriptor(mv, pos, sids)
+		yield sd
+
+def decode_file(path, sids=None):
+	with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+		mv = memoryview(mm)
+		try:
+			yield from iter_descriptors(mv, sids)
+		finally:
+			mv.release()
+
+# ================================================== Encoding (the reverse, for exports and benchmarks):
+
+def encode_sid(sid, domain=None):
+	text = rs.SDDL_SID_VALUES.get(sid)
+	if text is None:
+		if sid in rs.SDDL_DOMAIN_RIDS and domain:
+			text = '{}-{}'.format(domain, rs.SDDL_DOMAIN_RIDS[sid])
+		elif sid.startswith('S-'):
+			text = sid
+		else:
+			raise rs.SDDLError("Cannot encode SID {} without a domain".format(sid))
+	parts = text.split('-')
+	auth = int(parts[2], 0)
+	subs = [int(p) for p in parts[3:]]
+	return struct.pack('<BB', int(parts[1]), len(subs)) + auth.to_bytes(6, 'big') + struct.pack('<{}I'.format(len(subs)), *subs)
+
+def encode_guid(guid):
+	d = guid.split('-')
+	return _GUID.pack(int(d[0], 16), int(d[1], 16), int(d[2], 16), bytes.fromhex(d[3] + d[4]))
+
+def _encode_acl(acl, domain):
+	body = []
+	for ace in acl.aces or ():
+		if ace.condition:
+			raise rs.SDDLError("Cannot encode the condition of ACE ({})".format(rs.ace_to_string(ace)))
+		extra = b''
+		if ace.type in OBJECT_ACE_TYPES:
+			oflags = (ACE_OBJECT_TYPE_PRESENT if ace.object_guid else 0) | (ACE_INHERITED_OBJECT_TYPE_PRESENT if ace.inherit_object_guid else 0)
+			extra = _U32.pack(oflags)
+			if ace.object_guid:
+				extra += encode_guid(ace.object_guid)
+			if ace.inherit_object_guid:
+				extra += encode_guid(ace.inherit_object_guid)
+		extra += encode_sid(ace.sid, domain)
+		extra += b'\0' * (-len(extra) % 4)
+		body.append(_ACE_HEADER.pack(ace.type, ace.flags, 8 + len(extra), ace.mask) + extra)
+	data = b''.join(body)
+	rev = 4 if any(ace.type in OBJECT_ACE_TYPES for ace in acl.aces or ()) else 2
+	return _ACL_HEADER.pack(rev, 0, 8 + len(data), len(body), 0) + data
+
+def encode_descriptor(sd, domain=None):
+	control = SE_SELF_RELATIVE
+	parts, offsets = [], {}
+	pos = _SD_HEADER.size
+	for name, acl, present, shift in (('sacl', sd.sacl, SE_SACL_PRESENT, SACL_SHIFT), ('dacl', sd.dacl, SE_DACL_PRESENT, 0)):
+		if acl is None:
+			continue
+		control |= present | (acl.flags << shift)
+		if acl.aces is not None:
+			data = _encode_acl(acl, domain)
+			offsets[name] = pos
+			parts.append(data)
+			pos += len(data)
+	for name, sid in (('owner', sd.owner), ('group', sd.group)):
+		if sid is not None:
+			data = encode_sid(sid, domain)
+			offsets[name] = pos
+			parts.append(data)
+			pos += len(data)
+	header = _SD_HEADER.pack(1, 0, control, offsets.get('owner', 0), offsets.get('group', 0),
+		offsets.get('sacl', 0), offsets.get('dacl', 0))
+	return header + b''.join(parts)
+
+# ================================================== MAIN PROGRAM
+
+def main(argv):
+	args = argv[1:]
+	domain = None
+	if len(args) > 2 and args[0] == '--domain':
+		domain, args = args[1], args[2:]
+	if len(args) != 1:
+		print(__doc__)
+		sys.exit(0)
+	sids = SidTable(domain)
+	try:
+		for sd in decode_file(args[0], sids):
+			print(rs.descriptor_to_string(sd))
+	except (IOError, ValueError) as e:				# SDDLError, empty file
+		print("ERROR: {}".format(e), file=sys.stderr)
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,79 @@
+﻿#-*- coding: utf-8 -*-
+'''Descriptor level cache: each distinct SDDL string is parsed once per run.
+
+On real volumes almost every file carries one of a few hundred inherited
+descriptors, so the cache maps the raw SDDL string to its parsed Descriptor
+(access masks of those descriptors are decoded through the LRU cache of
+readsddl.decode_mask). Memory is bounded by an LRU policy and hits, misses
+and evictions are counted. The cache can be saved to a file and loaded
+again, so repeated scans of the same share start warm.'''
+
+import os, pickle
+from collections import OrderedDict
+
+import readsddl as rs
+
+CACHE_SIZE    = 4096
+CACHE_VERSION = 2						# 2: Ace gained the condition field
+
+class DescriptorCache(object):
+	def __init__(self, maxsize=CACHE_SIZE, path=None, track=False):
+		self.maxsize   = maxsize
+		self.path      = path
+		self.entries   = OrderedDict()
+		self.hits      = 0
+		self.misses    = 0
+		self.evictions = 0
+		self.new       = [] if track else None		# SDDL strings parsed since creation
+		if path and os.path.exists(path):
+			self.load(path)
+
+	def __len__(self):
+		return len(self.entries)
+
+	def __contains__(self, sddl):
+		return sddl in self.entries
+
+	def parse(self, sddl):
+		entries = self.entries
+		sd = entries.get(sddl)
+		if sd is not None:
+			self.hits += 1
+			entries.move_to_end(sddl)
+			return sd
+		self.misses += 1
+		sd = rs.parse_descriptor(sddl)				# invalid strings raise and are not cached
+		entries[sddl] = sd
+		if self.new is not None:
+			self.new.append(sddl)
+		if len(entries) > self.maxsize:
+			entries.popitem(last=False)
+			self.evictions += 1
+		return sd
+
+	def counters(self):
+		return {
+			"hits"      : self.hits,
+			"misses"    : self.misses,
+			"evictions" : self.evictions,
+			"size"      : len(self.entries),
+		}
+
+	def load(self, path):
+		try:
+			with open(path, 'rb') as f:
+				version, items = pickle.load(f)
+		except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+			return False
+		if version != CACHE_VERSION:
+			return False
+		for sddl, sd in items[-self.maxsize:]:
+			self.entries[sddl] = sd
+		return True
+
+	def save(self, path=None):
+		path = path or self.path
+		tmp = path + '.tmp'
+		with open(tmp, 'wb') as f:
+			pickle.dump((CACHE_VERSION, list(self.entries.items())), f, pickle.HIGHEST_PROTOCOL)
+		os.replace(tmp, path)
@@ -0,0 +1,191 @@
+﻿#-*- coding: utf-8 -*-
+'''Usage:
+	python canonsddl.py [--namespace NS] <SDDL>            canonical form and digest
+	python canonsddl.py [--namespace NS] <SDDL> <SDDL>     semantic diff
+
+Canonical form of a security descriptor, so that equivalent policies compare
+equal whatever way they were written:
+	- well known SIDs as SDDL aliases, GUIDs in lower case
+	- generic rights of effective ACEs mapped to the rights of the namespace
+	  (GA/GR/GW/GX -> FA/FR/FW/FX for files, KA/KR/KW/KX for registry keys)
+	- ACEs with an empty mask dropped, explicit allow / deny ACEs differing
+	  only by mask merged, other ACEs only when they are next to each other
+	- explicit deny ACEs, then explicit allow ACEs, each sorted; then the
+	  other explicit ACEs and the inherited ones, in their original order
+	  (the order of inherited ACEs decides access, it is kept)
+	- masks written as a composite right (FA, KR ...) when exact, hex otherwise
+The digest is a 16 byte BLAKE2b of the canonical SDDL string. diff_many()
+compares descriptor pairs by digest first and only diffs mismatches.'''
+
+import sys, hashlib
+from collections import namedtuple
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+import readsddl as rs
+
+CACHE_SIZE = 4096
+
+GENERIC_MAPPING = {		# GENERIC_ALL, GENERIC_READ, GENERIC_WRITE, GENERIC_EXECUTE
+	"file"     : tuple(rs.SDDL_RIGHTS[k][2] for k in ('FA', 'FR', 'FW', 'FX')),
+	"registry" : tuple(rs.SDDL_RIGHTS[k][2] for k in ('KA', 'KR', 'KW', 'KX')),
+}
+GENERIC_BITS = tuple(rs.SDDL_RIGHTS[k][2] for k in ('GA', 'GR', 'GW', 'GX'))
+GENERIC_ANY  = GENERIC_BITS[0] | GENERIC_BITS[1] | GENERIC_BITS[2] | GENERIC_BITS[3]
+
+INHERIT_ONLY = rs.SDDL_FLAGS["IO"][2]
+INHERITED    = rs.SDDL_FLAGS["ID"][2]
+DENY_TYPES   = {rs.SDDL_TYPE[k][2] for k in ('D', 'OD', 'XD')}
+ALLOW_TYPES  = {rs.SDDL_TYPE[k][2] for k in ('A', 'OA', 'XA', 'ZA')}
+
+SID_ALIASES  = {v: k for k, v in rs.SDDL_SID_VALUES.items()}
+
+AclDiff        = namedtuple('AclDiff',        'flags added removed')		# flags: (old, new) or None
+DescriptorDiff = namedtuple('DescriptorDiff', 'owner group dacl sacl')		# owner/group: (old, new) or None
+
+# ================================================== Canonical form:
+
+def map_generic(mask, namespace='file'):
+	mapping = GENERIC_MAPPING.get(namespace)
+	if mapping is None or not mask & GENERIC_ANY:
+		return mask
+	for bit, specific in zip(GENERIC_BITS, mapping):
+		if mask & bit:
+			mask = (mask & ~bit) | specific
+	return mask
+
+def _sid(sid):
+	return SID_ALIASES.get(sid, sid) if sid is not None else None
+
+def _merge_adjacent(ordered, key, mask):
+	if ordered and ordered[-1][0] == key:
+		ordered[-1][1] |= mask
+	else:
+		ordered.append([key, mask])
+
+def canonical_acl(acl, namespace='file'):
+	if acl is None or acl.aces is None:
+		return acl
+	deny, allow = {}, {}						# explicit ACEs, order free
+	other, inherited = [], []					# [key, mask] in order
+	for ace in acl.aces:
+		mask = ace.mask
+		if not ace.flags & INHERIT_ONLY:			# inherit-only ACEs keep generic rights
+			mask = map_generic(mask, namespace)
+		if not mask:
+			continue
+		key = (ace.type, ace.flags, ace.object_guid.lower(), ace.inherit_object_guid.lower(), _sid(ace.sid), ace.condition)
+		if ace.flags & INHERITED:
+			_merge_adjacent(inherited, key, mask)
+		elif ace.type in DENY_TYPES:
+			deny[key] = deny.get(key, 0) | mask
+		elif ace.type in ALLOW_TYPES:
+			allow[key] = allow.get(key, 0) | mask
+		else:
+			_merge_adjacent(other, key, mask)
+	aces = [rs.Ace(k[0], k[1], m, k[2], k[3], k[4], k[5]) for k, m in sorted(deny.items())]
+	aces += [rs.Ace(k[0], k[1], m, k[2], k[3], k[4], k[5]) for k, m in sorted(allow.items())]
+	aces += [rs.Ace(k[0], k[1], m, k[2], k[3], k[4], k[5]) for k, m in other + inherited]
+	return rs.Acl(acl.flags, tuple(aces))
+
+@lru_cache(maxsize=CACHE_SIZE)
+def canonicalize(sd, namespace='file'):
+	return rs.Descriptor(_sid(sd.owner), _sid(sd.group),
+		canonical_acl(sd.dacl, namespace), canonical_acl(sd.sacl, namespace))
+
+def canonical_string(sd, namespace='file'):
+	return rs.descriptor_to_string(canonicalize(sd, namespace))
+
+def digest(sd, namespace='file'):
+	return hashlib.blake2b(canonical_string(sd, namespace).encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+@lru_cache(maxsize=CACHE_SIZE)
+def digest_sddl(sddl, namespace='file'):
+	return digest(rs.parse_descriptor(sddl), namespace)
+
+def _descriptor(sd):
+	return rs.parse_descriptor(sd) if isinstance(sd, str) else sd
+
+def _digest(sd, namespace):
+	return digest_sddl(sd, namespace) if isinstance(sd, str) else digest(sd, namespace)
+
+# ================================================== Semantic diff:
+
+def diff_acl(a, b):
+	'''Added and removed ACEs of two canonical ACLs, in ACL order; a moved ACE
+	(inherited ACEs in another order) is both removed and added.'''
+	if a == b:
+		return None
+	old = a.aces or () if a is not None else ()
+	new = b.aces or () if b is not None else ()
+	added, removed = [], []
+	for op, i1, i2, j1, j2 in SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+		if op != 'equal':
+			removed.extend(old[i1:i2])
+			added.extend(new[j1:j2])
+	fa = rs.acl_flags_to_string(a) if a is not None else None
+	fb = rs.acl_flags_to_string(b) if b is not None else None
+	return AclDiff((fa, fb) if fa != fb else None, tuple(added), tuple(removed))
+
+def diff(a, b, namespace='file'):
+	'''Semantic difference of two descriptors (SDDL strings or Descriptors), None if equivalent.'''
+	a = canonicalize(_descriptor(a), namespace)
+	b = canonicalize(_descriptor(b), namespace)
+	if a == b:
+		return None
+	return DescriptorDiff(
+		(a.owner, b.owner) if a.owner != b.owner else None,
+		(a.group, b.group) if a.group != b.group else None,
+		diff_acl(a.dacl, b.dacl),
+		diff_acl(a.sacl, b.sacl))
+
+def diff_many(pairs, namespace='file'):
+	'''Yield (index, DescriptorDiff) for the pairs that are not equivalent.'''
+	for i, (a, b) in enumerate(pairs):
+		if a == b or _digest(a, namespace) == _digest(b, namespace):
+			continue
+		d = diff(a, b, namespace)
+		if d is not None:
+			yield i, d
+
+def format_diff(d):
+	lines = []
+	for tag, change in (('O', d.owner), ('G', d.group)):
+		if change is not None:
+			lines.append("  {}: {} -> {}".format(tag, change[0], change[1]))
+	for tag, acl in (('D', d.dacl), ('S', d.sacl)):
+		if acl is None:
+			continue
+		if acl.flags is not None:
+			old, new = ('(absent)' if f is None else f or '(none)' for f in acl.flags)
+			lines.append("  {}: flags {} -> {}".format(tag, old, new))
+		for ace in acl.removed:
+			lines.append("- {}:({})".format(tag, rs.ace_to_string(ace)))
+		for ace in acl.added:
+			lines.append("+ {}:({})".format(tag, rs.ace_to_string(ace)))
+	return '\n'.join(lines)
+
+# ================================================== MAIN PROGRAM
+
+def main(argv):
+	args = argv[1:]
+	namespace = 'file'
+	if len(args) > 1 and args[0] == '--namespace':
+		namespace, args = args[1], args[2:]
+	if len(args) not in (1, 2):
+		print(__doc__)
+		sys.exit(0)
+	try:
+		if len(args) == 1:
+			sd = rs.parse_descriptor(args[0])
+			print(canonical_string(sd, namespace))
+			print(digest(sd, namespace).hex())
+		else:
+			d = diff(args[0], args[1], namespace)
+			print("equivalent" if d is None else format_diff(d))
+	except rs.SDDLError as e:
+		print("ERROR: {}".format(e))
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main(sys.argv)
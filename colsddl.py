@@ -0,0 +1,246 @@
+﻿#-*- coding: utf-8 -*-
+'''Usage:
+	python colsddl.py [--append] [--chunk-rows N] <outdir> <dumpfile|->
+
+Columnar export of parsed ACEs. One row per ACE, every column is a flat
+little-endian array in its own file, so analytics jobs can np.memmap them
+and filter hundreds of millions of ACEs without parsing SDDL again:
+
+	path_id.u4   index into paths.txt
+	acl.u1       0 = DACL, 1 = SACL
+	type.u1      ACE type code (SDDL_TYPE)
+	flags.u1     ACE flags (SDDL_FLAGS)
+	mask.u4      access mask
+	sid_id.u4    index into sids.txt
+	guid_id.u4   object_guid, index into guids.txt (0 = none)
+	iguid_id.u4  inherit_object_guid, index into guids.txt (0 = none)
+
+paths.txt, sids.txt and guids.txt hold one string per line, meta.json the
+row count. Rows are buffered and appended in chunks, so exports of any size
+run in bounded memory; --append continues an existing export.'''
+
+import os, sys, json, mmap
+from array import array
+
+COLUMNS = [				# name, array typecode, numpy dtype
+	("path_id",  'I', '<u4'),
+	("acl",      'B', 'u1'),
+	("type",     'B', 'u1'),
+	("flags",    'B', 'u1'),
+	("mask",     'I', '<u4'),
+	("sid_id",   'I', '<u4'),
+	("guid_id",  'I', '<u4'),
+	("iguid_id", 'I', '<u4'),
+]
+FILE_EXT = {'I': '.u4', 'B': '.u1'}
+CHUNK_ROWS = 1 << 20
+ENCODE_CACHE = 4096
+VERSION = 1
+
+# ================================================== Writer:
+
+class StringTable(object):
+	'''Append-only string dictionary backed by a text file, one entry per line.
+	Without dedup (paths) the existing entries are only counted, not loaded.'''
+
+	def __init__(self, path, first=None, dedup=True):
+		self.path = path
+		self.ids = {}
+		self.count = 0
+		if os.path.exists(path):
+			if dedup:
+				with open(path, encoding='utf-8') as f:
+					for i, line in enumerate(f):
+						self.ids.setdefault(line.rstrip('\n'), i)
+						self.count = i + 1
+			else:
+				with open(path, 'rb') as f:
+					for block in iter(lambda: f.read(1 << 20), b''):
+						self.count += block.count(b'\n')
+		self.f = open(path, 'a', encoding='utf-8')
+		if first is not None and self.count == 0:
+			self.add(first)
+
+	def add(self, text):
+		i = self.ids.get(text)
+		if i is None:
+			i = self.ids[text] = self.count
+			self.count += 1
+			self.f.write(text.replace('\n', ' ') + '\n')
+		return i
+
+	def append(self, text):						# no dedup (paths)
+		self.f.write(text.replace('\n', ' ') + '\n')
+		self.count += 1
+		return self.count - 1
+
+	def close(self):
+		self.f.close()
+
+class ColumnWriter(object):
+	def __init__(self, outdir, append=False, chunk_rows=CHUNK_ROWS):
+		os.makedirs(outdir, exist_ok=True)
+		self.outdir = outdir
+		self.chunk_rows = chunk_rows
+		self.rows = 0
+		meta = os.path.join(outdir, 'meta.json')
+		if append and os.path.exists(meta):
+			with open(meta) as f:
+				self.rows = json.load(f)["rows"]
+		else:
+			for name in ('paths.txt', 'sids.txt', 'guids.txt') + tuple(name + FILE_EXT[code] for name, code, dtype in COLUMNS):
+				if os.path.exists(os.path.join(outdir, name)):
+					os.remove(os.path.join(outdir, name))
+		self.paths = StringTable(os.path.join(outdir, 'paths.txt'), dedup=False)
+		self.sids  = StringTable(os.path.join(outdir, 'sids.txt'))
+		self.guids = StringTable(os.path.join(outdir, 'guids.txt'), first='')
+		self.files = [open(os.path.join(outdir, name + FILE_EXT[code]), 'ab') for name, code, dtype in COLUMNS]
+		self.buffers = [array(code) for name, code, dtype in COLUMNS]
+		self.encoded = {}
+		self._truncate()
+
+	def _truncate(self):
+		# drop rows written after the last meta.json update (interrupted export)
+		for f, (name, code, dtype) in zip(self.files, COLUMNS):
+			size = self.rows * array(code).itemsize
+			if f.tell() != size:
+				f.truncate(size)
+				f.seek(size)
+
+	def _encode(self, sd):
+		cols = [array(code) for name, code, dtype in COLUMNS[1:]]
+		acl_c, type_c, flags_c, mask_c, sid_c, guid_c, iguid_c = cols
+		for acl_id, acl in ((0, sd.dacl), (1, sd.sacl)):
+			if acl is None or not acl.aces:
+				continue
+			for ace in acl.aces:
+				acl_c.append(acl_id)
+				type_c.append(ace.type)
+				flags_c.append(ace.flags)
+				mask_c.append(ace.mask)
+				sid_c.append(self.sids.add(ace.sid))
+				guid_c.append(self.guids.add(ace.object_guid))
+				iguid_c.append(self.guids.add(ace.inherit_object_guid))
+		return cols
+
+	def add(self, path, sd, key=None):
+		'''Append the ACEs of one descriptor; key (the raw SDDL) lets distinct
+		descriptors be encoded once.'''
+		cols = self.encoded.get(key) if key is not None else None
+		if cols is None:
+			cols = self._encode(sd)
+			if key is not None:
+				if len(self.encoded) >= ENCODE_CACHE:
+					self.encoded.clear()
+				self.encoded[key] = cols
+		n = len(cols[0])
+		path_id = self.paths.append(path)
+		if n == 0:
+			return 0
+		self.buffers[0].extend(array('I', [path_id]) * n)
+		for buf, col in zip(self.buffers[1:], cols):
+			buf.extend(col)
+		if len(self.buffers[0]) >= self.chunk_rows:
+			self.flush()
+		return n
+
+	def flush(self):
+		for f, buf in zip(self.files, self.buffers):
+			if sys.byteorder == 'big':
+				buf.byteswap()
+			buf.tofile(f)
+			f.flush()
+		self.rows += len(self.buffers[0])
+		self.buffers = [array(code) for name, code, dtype in COLUMNS]
+		for table in (self.paths, self.sids, self.guids):
+			table.f.flush()
+		with open(os.path.join(self.outdir, 'meta.json'), 'w') as f:
+			json.dump({"version": VERSION, "rows": self.rows,
+				"columns": {name: dtype for name, code, dtype in COLUMNS}}, f)
+
+	def close(self):
+		self.flush()
+		for f in self.files:
+			f.close()
+		for table in (self.paths, self.sids, self.guids):
+			table.close()
+
+# ================================================== Reader:
+
+class ColumnReader(object):
+	'''Columns as np.memmap arrays when NumPy is installed, memoryviews over
+	mmap otherwise. String dictionaries are loaded on first use.'''
+
+	def __init__(self, outdir):
+		self.outdir = outdir
+		with open(os.path.join(outdir, 'meta.json')) as f:
+			self.meta = json.load(f)
+		self.rows = self.meta["rows"]
+		self._columns = {}
+		self._tables = {}
+		self._maps = []
+
+	def column(self, name):
+		col = self._columns.get(name)
+		if col is None:
+			code, dtype = [(c, d) for n, c, d in COLUMNS if n == name][0]
+			path = os.path.join(self.outdir, name + FILE_EXT[code])
+			try:
+				import numpy as np
+				col = np.memmap(path, dtype=dtype, mode='r', shape=(self.rows,)) if self.rows else np.zeros(0, dtype)
+			except ImportError:
+				with open(path, 'rb') as f:
+					mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.rows else b''
+				self._maps.append(mm)
+				col = memoryview(mm)[:self.rows * array(code).itemsize].cast(code)
+			self._columns[name] = col
+		return col
+
+	def __getattr__(self, name):
+		if any(n == name for n, c, d in COLUMNS):
+			return self.column(name)
+		raise AttributeError(name)
+
+	def table(self, name):
+		t = self._tables.get(name)
+		if t is None:
+			with open(os.path.join(self.outdir, name + '.txt'), encoding='utf-8') as f:
+				t = self._tables[name] = [line.rstrip('\n') for line in f]
+		return t
+
+	def lookup(self, name, text):
+		'''Id of a string in the sids / guids / paths dictionary, None if absent.'''
+		try:
+			return self.table(name).index(text)
+		except ValueError:
+			return None
+
+# ================================================== MAIN PROGRAM
+
+def main(argv):
+	import argparse, streamsddl, cachesddl
+	ap = argparse.ArgumentParser(add_help=False)
+	ap.add_argument('outdir', nargs='?')
+	ap.add_argument('source', nargs='?')
+	ap.add_argument('--append', action='store_true')
+	ap.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+	args = ap.parse_args(argv[1:])
+	if args.source is None:
+		print(__doc__)
+		sys.exit(0)
+	stats = streamsddl.Stats()
+	writer = ColumnWriter(args.outdir, args.append, args.chunk_rows)
+	try:
+		records = streamsddl.read_records(streamsddl.iter_lines(args.source), stats)
+		for path, sddl, sd in streamsddl.parse_records(records, stats, cache=cachesddl.DescriptorCache()):
+			writer.add(path, sd, sddl)
+	except IOError as e:
+		print("ERROR: Cannot read dump: ", e, file=sys.stderr)
+		sys.exit(1)
+	finally:
+		writer.close()
+	print(stats.summary(), file=sys.stderr)
+	print("{} rows in {}".format(writer.rows, args.outdir), file=sys.stderr)
+
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,381 @@
+﻿#-*- coding: utf-8 -*-
+'''Usage:
+	python condsddl.py "<condition>" [<claims.json> ...]
+
+Conditional ACE expressions (the 7th field of XA, XD, ZA and XU ACEs, Dynamic
+Access Control), for example:
+
+	(XA;;FA;;;WD;((@User.Department == "Eng") && (Member_of {SID(BA)})))
+
+compile_condition() parses an expression once, cached by its text, into a
+tree of closures; evaluating it for a claim set is plain function calls, no
+parsing and no AST walk. Results are three-valued: True, False or None
+(UNKNOWN, e.g. a missing attribute). An allow callback ACE applies when its
+condition is True, a deny one unless it is False.
+
+Supported: @User. / @Device. / @Resource. attributes and local ones without
+prefix, integers, "strings", SID(...) and {composite, values}, the relational
+operators == != < <= > >=, Contains, Any_of, Not_Contains, Not_Any_of,
+Member_of, Not_Member_of, Member_of_Any, Not_Member_of_Any and the Device_
+variants, Exists, Not_Exists, !, && and ||. Strings and attribute names
+compare case insensitively.
+
+A claims file is JSON: {"user": {...}, "device": {...}, "resource": {...},
+"local": {...}, "sids": [...], "device_sids": [...]}.'''
+
+import re, sys
+from functools import lru_cache
+
+import readsddl as rs
+import canonsddl
+
+CACHE_SIZE = 4096
+
+# ================================================== Claim sets:
+
+def _value(v):
+	if isinstance(v, bool):
+		return int(v)
+	if isinstance(v, str):
+		return v.lower()
+	return v
+
+def _claims(attrs):
+	claims = {}
+	for name, values in (attrs or {}).items():
+		if not isinstance(values, (list, tuple, set, frozenset)):
+			values = (values,)
+		claims[name.lower()] = tuple(_value(v) for v in values)
+	return claims
+
+class Claims(object):
+	'''User, device, resource and local claims plus the SIDs of the user token
+	(and of the device), normalised once so that they can be evaluated against
+	any number of conditions.'''
+
+	def __init__(self, user=None, device=None, resource=None, local=None, sids=(), device_sids=()):
+		self.attrs = {
+			"user"     : _claims(user),
+			"device"   : _claims(device),
+			"resource" : _claims(resource),
+			"local"    : _claims(local),
+		}
+		self.sids = frozenset(canonsddl._sid(s) for s in sids)
+		self.device_sids = frozenset(canonsddl._sid(s) for s in device_sids)
+
+	@classmethod
+	def from_dict(cls, d):
+		'''Claims of a JSON object {"user": {name: value(s)}, ..., "sids": [...]}.'''
+		if not isinstance(d, dict):
+			raise rs.SDDLError("Claims must be a JSON object")
+		for key in ("user", "device", "resource", "local"):
+			if not isinstance(d.get(key) or {}, dict):
+				raise rs.SDDLError("{} claims must be a JSON object".format(key))
+		for key in ("sids", "device_sids"):
+			sids = d.get(key, ())
+			if isinstance(sids, str) or not all(isinstance(s, str) for s in sids):
+				raise rs.SDDLError("{} must be a list of SID strings".format(key))
+		return cls(d.get("user"), d.get("device"), d.get("resource"), d.get("local"),
+			d.get("sids", ()), d.get("device_sids", ()))
+
+# ================================================== Tokenizer:
+
+_TOKEN = re.compile(r'''
+	\s*(?:
+		(?P<op>==|!=|<=|>=|<|>|&&|\|\||!|\(|\)|\{|\}|,)
+		| (?P<string>"[^"]*")
+		| (?P<sid>SID\(\s*(?P<sidval>[^)\s]+)\s*\))
+		| (?P<int>[+-]?(?:0[xX][0-9a-fA-F]+|\d+))
+		| (?P<attr>@(?:User|Device|Resource)\.[^\s()=!<>&|,{}"]+)
+		| (?P<word>[A-Za-z_][^\s()=!<>&|,{}"]*)
+	)''', re.VERBOSE | re.IGNORECASE)
+
+ATTR_PREFIX = {"@user.": "user", "@device.": "device", "@resource.": "resource"}
+
+def tokenize(text):
+	pos, end = 0, len(text)
+	tokens = []
+	while pos < end:
+		m = _TOKEN.match(text, pos)
+		if m is None or m.end() == pos:
+			if text[pos:].strip():
+				raise rs.SDDLError("Invalid condition at {}: {}".format(pos, text))
+			break
+		pos = m.end()
+		kind = m.lastgroup if m.lastgroup != 'sidval' else 'sid'
+		if kind == 'op':
+			tokens.append(('op', m.group('op')))
+		elif kind == 'string':
+			tokens.append(('value', m.group('string')[1:-1].lower()))
+		elif kind == 'sid':
+			tokens.append(('value', canonsddl._sid(m.group('sidval').upper())))
+		elif kind == 'int':
+			v = m.group('int')
+			sign = -1 if v[0] == '-' else 1
+			v = v.lstrip('+-')
+			tokens.append(('value', sign * (int(v, 16) if v[:2].lower() == '0x' else int(v, 8) if len(v) > 1 and v[0] == '0' else int(v))))
+		elif kind == 'attr':
+			a = m.group('attr')
+			prefix, _, name = a.partition('.')
+			tokens.append(('attr', (ATTR_PREFIX[prefix.lower() + '.'], name.lower())))
+		else:
+			tokens.append(('word', m.group('word')))
+	return tokens
+
+# ================================================== Compiler:
+# Every node compiles into a function of a Claims object returning True,
+# False or None (UNKNOWN).
+
+def _not(f):
+	def node(c):
+		r = f(c)
+		return None if r is None else not r
+	return node
+
+def _and(fs):
+	def node(c):
+		unknown = False
+		for f in fs:
+			r = f(c)
+			if r is False:
+				return False
+			if r is None:
+				unknown = True
+		return None if unknown else True
+	return node
+
+def _or(fs):
+	def node(c):
+		unknown = False
+		for f in fs:
+			r = f(c)
+			if r is True:
+				return True
+			if r is None:
+				unknown = True
+		return None if unknown else False
+	return node
+
+def _getter(operand):
+	kind, value = operand
+	if kind == 'attr':
+		source, name = value
+		return lambda c: c.attrs[source].get(name)
+	values = value if isinstance(value, tuple) else (value,)
+	return lambda c: values
+
+def _compare(op):
+	return {
+		'==' : lambda a, b: a == b,
+		'!=' : lambda a, b: a != b,
+		'<'  : lambda a, b: a < b,
+		'<=' : lambda a, b: a <= b,
+		'>'  : lambda a, b: a > b,
+		'>=' : lambda a, b: a >= b,
+	}[op]
+
+def _relational(lhs, op, rhs):
+	get_a, get_b, cmp = _getter(lhs), _getter(rhs), _compare(op)
+	def node(c):
+		a, b = get_a(c), get_b(c)
+		if a is None or b is None:
+			return None
+		if len(a) == 1 and len(b) == 1:
+			a, b = a[0], b[0]
+			if isinstance(a, str) != isinstance(b, str):
+				return None
+		elif op in ('==', '!='):
+			a, b = sorted(map(str, a)), sorted(map(str, b))
+		else:
+			return None
+		return cmp(a, b)
+	return node
+
+def _set_op(lhs, op, rhs):
+	get_a, get_b = _getter(lhs), _getter(rhs)
+	any_of = op.endswith('any_of')
+	negate = op.startswith('not_')
+	def node(c):
+		a, b = get_a(c), get_b(c)
+		if a is None or b is None:
+			return None
+		r = not set(a).isdisjoint(b) if any_of else set(b) <= set(a)
+		return not r if negate else r
+	return node
+
+def _member_of(op, sids):
+	sids = frozenset(sids)
+	device = 'device_' in op
+	any_of = op.endswith('_any')
+	negate = op.startswith('not_')
+	def node(c):
+		token = c.device_sids if device else c.sids
+		r = not token.isdisjoint(sids) if any_of else sids <= token
+		return not r if negate else r
+	return node
+
+def _exists(attr, negate):
+	source, name = attr
+	def node(c):
+		r = name in c.attrs[source]
+		return not r if negate else r
+	return node
+
+def _truth(attr):
+	get = _getter(('attr', attr))
+	def node(c):
+		v = get(c)
+		if v is None:
+			return None
+		return any(bool(x) for x in v)
+	return node
+
+RELATIONAL = {'==', '!=', '<', '<=', '>', '>='}
+SET_OPS    = {'contains', 'any_of', 'not_contains', 'not_any_of'}
+MEMBER_OPS = {p + 'member_of' + s for p in ('', 'not_', 'device_', 'not_device_') for s in ('', '_any')}
+
+class _Parser(object):
+	def __init__(self, text):
+		self.text = text
+		self.tokens = tokenize(text)
+		self.pos = 0
+
+	def error(self, what):
+		raise rs.SDDLError("Invalid condition, {}: {}".format(what, self.text))
+
+	def peek(self):
+		return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+	def take(self, kind=None, value=None):
+		tok = self.peek()
+		if tok[0] is None or kind is not None and tok[0] != kind or value is not None and tok[1] != value:
+			self.error("expected {}".format(value or kind))
+		self.pos += 1
+		return tok
+
+	def parse(self):
+		node = self.expr()
+		if self.pos != len(self.tokens):
+			self.error("unexpected {}".format(self.peek()[1]))
+		return node
+
+	def expr(self):
+		fs = [self.conjunction()]
+		while self.peek() == ('op', '||'):
+			self.pos += 1
+			fs.append(self.conjunction())
+		return fs[0] if len(fs) == 1 else _or(fs)
+
+	def conjunction(self):
+		fs = [self.unary()]
+		while self.peek() == ('op', '&&'):
+			self.pos += 1
+			fs.append(self.unary())
+		return fs[0] if len(fs) == 1 else _and(fs)
+
+	def unary(self):
+		if self.peek() == ('op', '!'):
+			self.pos += 1
+			return _not(self.unary())
+		return self.primary()
+
+	def operand(self):
+		kind, value = self.peek()
+		if kind in ('attr', 'value'):
+			self.pos += 1
+			return kind, value
+		if (kind, value) == ('op', '{'):
+			self.pos += 1
+			values = []
+			while self.peek() != ('op', '}'):
+				if values:
+					self.take('op', ',')
+				values.append(self.take('value')[1])
+			self.pos += 1
+			return 'value', tuple(values)
+		self.error("expected an operand")
+
+	def primary(self):
+		kind, value = self.peek()
+		if (kind, value) == ('op', '('):
+			self.pos += 1
+			node = self.expr()
+			self.take('op', ')')
+			return node
+		if kind == 'word':
+			word = value.lower()
+			self.pos += 1
+			if word in ('exists', 'not_exists'):
+				return _exists(self.take('attr')[1], word == 'not_exists')
+			if word in MEMBER_OPS:
+				operand = self.operand()
+				if operand[0] != 'value':
+					self.error("{} needs SIDs".format(value))
+				sids = operand[1] if isinstance(operand[1], tuple) else (operand[1],)
+				return _member_of(word, sids)
+			kind, value = 'attr', ('local', word)			# local attribute without prefix
+		elif kind == 'attr':
+			self.pos += 1
+		else:
+			self.error("expected an expression")
+		lhs = (kind, value)
+		k, op = self.peek()
+		if k == 'op' and op in RELATIONAL:
+			self.pos += 1
+			return _relational(lhs, op, self.operand())
+		if k == 'word' and op.lower() in SET_OPS:
+			self.pos += 1
+			return _set_op(lhs, op.lower(), self.operand())
+		return _truth(value)
+
+@lru_cache(maxsize=CACHE_SIZE)
+def compile_condition(text):
+	'''Callable(Claims) -> True / False / None of a conditional expression.'''
+	return _Parser(text).parse()
+
+def evaluate(text, claims):
+	return compile_condition(text)(claims)
+
+def evaluate_batch(conditions, claim_sets):
+	'''Results of every condition for every claim set: one row per condition.
+	Each distinct condition is compiled once.'''
+	claim_sets = list(claim_sets)
+	rows = []
+	for text in conditions:
+		f = compile_condition(text)
+		rows.append([f(c) for c in claim_sets])
+	return rows
+
+def ace_applies(ace, claims):
+	'''Whether a callback ACE takes part in access checks for claims: allow
+	ACEs need a True condition, deny ACEs anything but False.'''
+	if not ace.condition:
+		return True
+	r = compile_condition(ace.condition)(claims)
+	if ace.type == rs.SDDL_TYPE["XD"][2]:
+		return r is not False
+	return r is True
+
+# ================================================== MAIN PROGRAM
+
+def main(argv):
+	import json
+	if len(argv) < 2:
+		print(__doc__)
+		sys.exit(0)
+	try:
+		f = compile_condition(argv[1])
+		claim_sets = []
+		for path in argv[2:]:
+			with open(path) as fp:
+				claim_sets.append((path, Claims.from_dict(json.load(fp))))
+		print("compiled: {}".format(argv[1]))
+		for path, claims in claim_sets:
+			r = f(claims)
+			print("{}: {}".format(path, 'UNKNOWN' if r is None else 'TRUE' if r else 'FALSE'))
+	except (IOError, ValueError) as e:					# SDDLError, JSON errors
+		print("ERROR: {}".format(e), file=sys.stderr)
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main(sys.argv)
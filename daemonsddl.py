@@ -0,0 +1,311 @@
+﻿#-*- coding: utf-8 -*-
+'''Usage:
+	python daemonsddl.py --serve [--socket P | --port N] [--cache-size N]
+	python daemonsddl.py [--socket P | --port N] <op> [item ...] [--sid S ...] [--namespace NS]
+
+Long-running parse service: the tables, the descriptor cache and the mask
+decoders stay warm in one process, and callers send batches of items over a
+local socket instead of starting an interpreter per descriptor. The server
+runs on asyncio, on a Unix socket (default, mode 0600) or on a localhost TCP
+port (--port, and always on Windows).
+
+The protocol is JSON Lines, one request and one response per line; a client
+may send several requests before reading the responses, which come back in
+order:
+
+	{"id": 1, "op": "parse", "items": ["D:AI(A;ID;FA;;;SY)"], "namespace": "file"}
+	{"id": 1, "results": [{"owner": null, "group": null, "dacl": {...}, "sacl": null}]}
+
+	parse         SDDL -> the readsddl --format jsonl fields
+	decode_mask   mask (int or "0x..." string) -> {"rights": [...], "residual": n}
+	canonicalize  SDDL -> {"canonical": SDDL, "digest": hex}
+	access        SDDL -> {"mask": n, "rights": "..."} for "sids" (and "claims")
+	stats         counters of the service
+
+An item that fails gets {"error": "..."} in its place; a request that
+cannot be read gets {"id": ..., "error": "..."}. Client is the thin
+synchronous client; the command line is a client too.'''
+
+import os, sys, json, socket, asyncio, tempfile, time
+from collections import OrderedDict
+
+import readsddl as rs
+import cachesddl, canonsddl, rendersddl
+
+DEFAULT_PORT   = 47011
+EVALUATORS     = 64
+LINE_LIMIT     = 64 << 20
+
+def default_socket():
+	uid = os.getuid() if hasattr(os, 'getuid') else 0
+	return os.path.join(tempfile.gettempdir(), 'readsddl-{}.sock'.format(uid))
+
+# ================================================== Service:
+
+class SddlService(object):
+	'''Request handler of the daemon, usable in process as well.'''
+
+	def __init__(self, cache_size=cachesddl.CACHE_SIZE):
+		self.descriptors = cachesddl.DescriptorCache(cache_size)
+		self.evaluators = OrderedDict()				# (sids, namespace, claims) -> AccessEvaluator
+		self.started = time.time()
+		self.requests = 0
+		self.items = 0
+		self.errors = 0
+		self.ops = {
+			"parse"        : self.parse,
+			"decode_mask"  : self.decode_mask,
+			"canonicalize" : self.canonicalize,
+			"access"       : self.access,
+		}
+
+	# Every op takes the parameters of a request and returns the function
+	# applied to each of its items.
+
+	def parse(self, namespace='any', **params):
+		parse = self.descriptors.parse
+		def item(sddl):
+			sd = parse(sddl)
+			return {
+				"owner" : sd.owner,
+				"group" : sd.group,
+				"dacl"  : rendersddl.acl_to_dict(sd.dacl, namespace),
+				"sacl"  : rendersddl.acl_to_dict(sd.sacl, namespace),
+			}
+		return item
+
+	def decode_mask(self, namespace='any', **params):
+		decode = rs.mask_decoder(namespace).decode
+		def item(mask):
+			names, residual = decode(rs.rights_to_mask(mask) if isinstance(mask, str) else mask)
+			return {"rights": names, "residual": residual}
+		return item
+
+	def canonicalize(self, namespace='file', **params):
+		parse = self.descriptors.parse
+		def item(sddl):
+			return {"canonical": canonsddl.canonical_string(parse(sddl), namespace), "digest": canonsddl.digest_sddl(sddl, namespace).hex()}
+		return item
+
+	def evaluator(self, sids, namespace, claims):
+		import accesssddl
+		key = (tuple(sorted(sids)), namespace, json.dumps(claims, sort_keys=True) if claims else None)
+		evaluator = self.evaluators.get(key)
+		if evaluator is None:
+			if claims:
+				import condsddl
+				claims = condsddl.Claims.from_dict(claims)
+			evaluator = accesssddl.AccessEvaluator(sids, namespace, descriptors=self.descriptors, claims=claims or None)
+			self.evaluators[key] = evaluator
+			if len(self.evaluators) > EVALUATORS:
+				self.evaluators.popitem(last=False)
+		else:
+			self.evaluators.move_to_end(key)
+		return evaluator
+
+	def access(self, namespace='file', sids=(), claims=None, **params):
+		if not sids:
+			raise rs.SDDLError("access needs sids")
+		if not isinstance(sids, list) or not all(isinstance(s, str) for s in sids):
+			raise rs.SDDLError("sids must be a list of SID strings")
+		if claims is not None and not isinstance(claims, dict):
+			raise rs.SDDLError("claims must be a JSON object")
+		evaluate = self.evaluator(sids, namespace, claims).evaluate
+		def item(sddl):
+			mask = evaluate(sddl)
+			return {"mask": mask, "rights": rs.rights_names(mask, namespace)}
+		return item
+
+	def stats(self):
+		return {
+			"uptime"    : round(time.time() - self.started, 3),
+			"requests"  : self.requests,
+			"items"     : self.items,
+			"errors"    : self.errors,
+			"cache"     : self.descriptors.counters(),
+			"evaluators": len(self.evaluators),
+		}
+
+	def handle(self, request):
+		self.requests += 1
+		rid = request.get("id") if isinstance(request, dict) else None
+		try:
+			if not isinstance(request, dict):
+				raise rs.SDDLError("A request is a JSON object")
+			op = request.get("op")
+			if op == "stats":
+				return {"id": rid, "results": self.stats()}
+			make = self.ops.get(op)
+			if make is None:
+				raise rs.SDDLError("Unknown op: {}".format(op))
+			params = {k: v for k, v in request.items() if k not in ("id", "op", "items")}
+			if params.get("namespace", 'any') not in rs.MASK_NAMESPACES:
+				raise rs.SDDLError("Unknown access mask namespace: {}".format(params["namespace"]))
+			items = request.get("items", ())
+			if not isinstance(items, (list, tuple)):
+				raise rs.SDDLError("items must be a list")
+			func = make(**params)
+			results = []
+			for item in items:
+				try:
+					results.append(func(item))
+				except Exception as e:					# a bad item
+					self.errors += 1
+					results.append({"error": str(e) or type(e).__name__})
+			self.items += len(items)
+			return {"id": rid, "results": results}
+		except Exception as e:						# bad parameters too, never the connection
+			self.errors += 1
+			return {"id": rid, "error": str(e) or type(e).__name__}
+
+	def handle_line(self, line):
+		try:
+			request = json.loads(line)
+		except ValueError as e:
+			self.errors += 1
+			return {"id": None, "error": "Invalid JSON: {}".format(e)}
+		return self.handle(request)
+
+# ================================================== Server:
+
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+async def _serve_client(service, reader, writer):
+	try:
+		while True:
+			line = await reader.readline()
+			if not line:
+				break
+			if not line.strip():
+				continue
+			writer.write(_encode(service.handle_line(line)).encode('utf-8') + b'\n')
+			await writer.drain()
+	except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+		pass
+	finally:
+		writer.close()
+
+async def serve(service, path=None, port=None, ready=None):
+	'''Serve until cancelled, on a Unix socket or on localhost:port.'''
+	handler = lambda r, w: _serve_client(service, r, w)
+	if port is not None or not hasattr(asyncio, 'start_unix_server'):
+		server = await asyncio.start_server(handler, '127.0.0.1', port or DEFAULT_PORT, limit=LINE_LIMIT)
+	else:
+		if os.path.exists(path):
+			os.remove(path)
+		server = await asyncio.start_unix_server(handler, path, limit=LINE_LIMIT)
+		os.chmod(path, 0o600)
+	if ready is not None:
+		ready()
+	try:
+		async with server:
+			await server.serve_forever()
+	finally:
+		if port is None and path and os.path.exists(path):
+			os.remove(path)
+
+# ================================================== Client:
+
+class Client(object):
+	'''Blocking client of the daemon: Client() for the default socket,
+	Client(path) or Client(port=N).'''
+
+	def __init__(self, path=None, port=None, timeout=30):
+		if port is not None or not hasattr(socket, 'AF_UNIX'):
+			self.sock = socket.create_connection(('127.0.0.1', port or DEFAULT_PORT), timeout)
+			self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		else:
+			self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			self.sock.settimeout(timeout)
+			self.sock.connect(path or default_socket())
+		self.file = self.sock.makefile('rb')
+		self.next_id = 0
+
+	def close(self):
+		self.file.close()
+		self.sock.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def send(self, op, items=(), **params):
+		self.next_id += 1
+		request = dict(params, id=self.next_id, op=op, items=list(items))
+		self.sock.sendall(_encode(request).encode('utf-8') + b'\n')
+		return self.next_id
+
+	def receive(self):
+		line = self.file.readline()
+		if not line:
+			raise IOError("Connection closed by the daemon")
+		response = json.loads(line)
+		if "error" in response:
+			raise rs.SDDLError(response["error"])
+		return response["results"]
+
+	def call(self, op, items=(), **params):
+		self.send(op, items, **params)
+		return self.receive()
+
+	def parse(self, sddls, namespace='any'):
+		return self.call("parse", sddls, namespace=namespace)
+
+	def decode_mask(self, masks, namespace='any'):
+		return self.call("decode_mask", masks, namespace=namespace)
+
+	def canonicalize(self, sddls, namespace='file'):
+		return self.call("canonicalize", sddls, namespace=namespace)
+
+	def access(self, sddls, sids, namespace='file', claims=None):
+		return self.call("access", sddls, sids=list(sids), namespace=namespace, claims=claims)
+
+	def stats(self):
+		return self.call("stats")
+
+# ================================================== MAIN PROGRAM
+
+def main(argv):
+	import argparse
+	ap = argparse.ArgumentParser(add_help=False)
+	ap.add_argument('op', nargs='?')
+	ap.add_argument('items', nargs='*')
+	ap.add_argument('--serve', action='store_true')
+	ap.add_argument('--socket')
+	ap.add_argument('--port', type=int)
+	ap.add_argument('--cache-size', type=int, default=cachesddl.CACHE_SIZE)
+	ap.add_argument('--sid', action='append', default=[])
+	ap.add_argument('--namespace', choices=list(rs.MASK_NAMESPACES))
+	args = ap.parse_args(argv[1:])
+	if args.serve:
+		path = args.socket or default_socket()
+		where = 'localhost:{}'.format(args.port or DEFAULT_PORT) if args.port or not hasattr(asyncio, 'start_unix_server') else path
+		ready = lambda: print("Serving on {}".format(where), file=sys.stderr, flush=True)
+		try:
+			asyncio.run(serve(SddlService(args.cache_size), path, args.port, ready))
+		except KeyboardInterrupt:
+			pass
+		except OSError as e:
+			print("ERROR: {}".format(e), file=sys.stderr)
+			sys.exit(1)
+		return
+	if args.op is None:
+		print(__doc__)
+		sys.exit(0)
+	params = {}
+	if args.namespace:
+		params["namespace"] = args.namespace
+	if args.sid:
+		params["sids"] = args.sid
+	try:
+		with Client(args.socket, args.port) as client:
+			for result in client.call(args.op, args.items, **params) if args.op != 'stats' else [client.stats()]:
+				print(json.dumps(result, ensure_ascii=False))
+	except (OSError, rs.SDDLError) as e:
+		print("ERROR: {}".format(e), file=sys.stderr)
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,136 @@
+﻿#-*- coding: utf-8 -*-
+'''Usage:
+	python gensddl.py [--count N] [--dup R] [--aces MIN-MAX] [--object R] [--sacl R] [--seed S]
+	                  [--format cacls|tsv|sddl|binary] [--out F]
+
+Synthetic SDDL corpus generator for benchmarks. Descriptors are built from
+the readsddl tables: ACE types (SDDL_TYPE), flag combinations (SDDL_FLAGS),
+composite, concatenated and hexadecimal rights (SDDL_RIGHTS), well known
+SIDs (SDDL_SIDS), explicit domain SIDs and object GUIDs.
+
+	--count N      descriptors to write (default: 100000)
+	--dup R        share of descriptors repeating an earlier one (default: 0.9)
+	--aces MIN-MAX ACEs per DACL (default: 2-8)
+	--object R     share of object ACEs with GUIDs (default: 0.05)
+	--sacl R       share of descriptors with a SACL (default: 0.05)
+	--seed S       random seed, the same arguments give the same corpus (default: 1)
+	--format F     cacls ('path "SDDL"', default), tsv, sddl, or binary
+	               self-relative descriptors back to back (see binsddl.py)'''
+
+import sys, random
+
+import readsddl as rs
+
+DOMAIN = 'S-1-5-21-3623811015-3361044348-30300820'
+
+ACE_TYPES   = [('A', 80), ('D', 10)]						# OA / OD are drawn with --object
+ACE_FLAGS   = [('', 20), ('ID', 35), ('OICIID', 25), ('OICI', 8), ('CIIO', 3), ('OICIIO', 3), ('CI', 2), ('OI', 2), ('OICINP', 1), ('CIIOID', 1)]
+AUDIT_FLAGS = ['SA', 'FA', 'SAFA', 'OICISA', 'OICIFA']
+ACL_FLAGS   = [('', 10), ('AI', 60), ('PAI', 25), ('P', 5)]
+RIGHTS      = [('FA', 30), ('FR', 10), ('FX', 5), ('FW', 3), ('KA', 3), ('KR', 3), ('GA', 5), ('GR', 3),
+	('0x1301bf', 15), ('0x1200a9', 10), ('0x1f01ff', 3), ('LCSWRPWP', 2), ('CCDCLCSWRPWPDTLOCRSDRCWDWO', 2), ('SD', 1)]
+OBJECT_GUIDS = 64
+
+def _weighted(table):
+	values = [v for v, w in table]
+	weights = [w for v, w in table]
+	return values, weights
+
+class CorpusGenerator(object):
+	def __init__(self, seed=1, aces=(2, 8), object_ratio=0.05, sacl_ratio=0.05, domain=DOMAIN):
+		self.rng = random.Random(seed)
+		self.aces = aces
+		self.object_ratio = object_ratio
+		self.sacl_ratio = sacl_ratio
+		self.domain = domain
+		self.well_known = list(rs.SDDL_SIDS)
+		self.accounts = ['{}-{}'.format(domain, 1000 + i) for i in range(200)]
+		self.guids = ['{:08x}-{:04x}-{:04x}-{:04x}-{:012x}'.format(self.rng.getrandbits(32), self.rng.getrandbits(16),
+			self.rng.getrandbits(16), self.rng.getrandbits(16), self.rng.getrandbits(48)) for i in range(OBJECT_GUIDS)]
+		self.types, self.type_w = _weighted(ACE_TYPES)
+		self.flags, self.flags_w = _weighted(ACE_FLAGS)
+		self.acl_flags, self.acl_flags_w = _weighted(ACL_FLAGS)
+		self.rights, self.rights_w = _weighted(RIGHTS)
+
+	def ace(self):
+		rng = self.rng
+		atype = rng.choices(self.types, self.type_w)[0]
+		guid = iguid = ''
+		if rng.random() < self.object_ratio:
+			atype = 'O' + atype
+			guid = rng.choice(self.guids)
+			if rng.random() < 0.3:
+				iguid = rng.choice(self.guids)
+		sid = rng.choice(self.well_known) if rng.random() < 0.7 else rng.choice(self.accounts)
+		return '({};{};{};{};{};{})'.format(atype, rng.choices(self.flags, self.flags_w)[0],
+			rng.choices(self.rights, self.rights_w)[0], guid, iguid, sid)
+
+	def descriptor(self):
+		rng = self.rng
+		parts = []
+		if rng.random() < 0.5:
+			parts.append('O:{}G:{}'.format(rng.choice(('BA', 'SY', self.accounts[0])), rng.choice(('SY', 'DU', 'BA'))))
+		parts.append('D:' + rng.choices(self.acl_flags, self.acl_flags_w)[0])
+		parts.extend(self.ace() for i in range(rng.randint(*self.aces)))
+		if rng.random() < self.sacl_ratio:
+			parts.append('S:AI(AU;{};FA;;;WD)'.format(rng.choice(AUDIT_FLAGS)))
+		return ''.join(parts)
+
+	def corpus(self, count, dup=0.9):
+		'''Yield count SDDL strings, about a share dup of them repeating earlier ones.'''
+		rng = self.rng
+		seen = []
+		for i in range(count):
+			if seen and rng.random() < dup:
+				yield rng.choice(seen)
+			else:
+				sddl = self.descriptor()
+				seen.append(sddl)
+				yield sddl
+
+def generate(count, dup=0.9, seed=1, **options):
+	return CorpusGenerator(seed, **options).corpus(count, dup)
+
+def write_corpus(out, sddls, fmt='cacls', domain=DOMAIN):
+	if fmt == 'binary':
+		import binsddl
+		for sddl in sddls:
+			out.write(binsddl.encode_descriptor(rs.parse_descriptor(sddl), domain))
+		return
+	line = {'cacls': 'C:\\Share\\d{}\\f{}.txt "{}"\n', 'tsv': 'C:\\Share\\d{}\\f{}.txt\t{}\n', 'sddl': '{2}\n'}[fmt]
+	for i, sddl in enumerate(sddls):
+		out.write(line.format(i % 1000, i, sddl))
+
+# ================================================== MAIN PROGRAM
+
+def main(argv):
+	import argparse
+	ap = argparse.ArgumentParser(add_help=False)
+	ap.add_argument('--count', type=int, default=100000)
+	ap.add_argument('--dup', type=float, default=0.9)
+	ap.add_argument('--aces', default='2-8')
+	ap.add_argument('--object', type=float, default=0.05)
+	ap.add_argument('--sacl', type=float, default=0.05)
+	ap.add_argument('--seed', type=int, default=1)
+	ap.add_argument('--format', choices=['cacls', 'tsv', 'sddl', 'binary'], default='cacls')
+	ap.add_argument('--out')
+	ap.add_argument('-h', '--help', action='store_true')
+	args = ap.parse_args(argv[1:])
+	if args.help:
+		print(__doc__)
+		sys.exit(0)
+	lo, _, hi = args.aces.partition('-')
+	sddls = generate(args.count, args.dup, args.seed, aces=(int(lo), int(hi or lo)),
+		object_ratio=args.object, sacl_ratio=args.sacl)
+	if args.format == 'binary':
+		out = open(args.out, 'wb') if args.out else sys.stdout.buffer
+	else:
+		out = open(args.out, 'w', encoding='utf-8') if args.out else sys.stdout
+	try:
+		write_corpus(out, sddls, args.format)
+	finally:
+		if args.out:
+			out.close()
+
+if __name__ == '__main__':
+	main(sys.argv)
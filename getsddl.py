@@ -1,9 +1,12 @@
 ﻿#-*- coding: utf-8 -*-
 '''Usage:
-	python getsddl.py <file | folder>'''
+	python getsddl.py <file | folder>
+
+Set SDDL_PROFILE to time the GetFileSecurity call (see profsddl.py).'''
 
 import sys	
 import win32security	as w32s
+import profsddl
 
 # ---------------------------------- Some global constants
 
@@ -19,14 +22,16 @@ SDDL_REVISION_1 = 1
 def Usage():
 	print(__doc__)
 	sys.exit(0)
-	
-if len(sys.argv) < 2:	
-	Usage()
-else:
-	PATH = sys.argv[1]
-	
-sd = w32s.GetFileSecurity (PATH, w32s.DACL_SECURITY_INFORMATION)
-
-security_information = OWNER_SEC_INF | GROUP_SEC_INF | DACL_SEC_INF | SACL_SEC_INF
-ststr = w32s.ConvertSecurityDescriptorToStringSecurityDescriptor(sd, SDDL_REVISION_1, security_information)  
-print(ststr)
+
+def get_sddl(path):
+	sd = w32s.GetFileSecurity (path, w32s.DACL_SECURITY_INFORMATION)
+	security_information = OWNER_SEC_INF | GROUP_SEC_INF | DACL_SEC_INF | SACL_SEC_INF
+	return w32s.ConvertSecurityDescriptorToStringSecurityDescriptor(sd, SDDL_REVISION_1, security_information)
+
+if __name__ == '__main__':
+	if len(sys.argv) < 2:
+		Usage()
+	profsddl.enable_from_env()
+	with profsddl.stage('GetFileSecurity'):
+		sddl = get_sddl(sys.argv[1])
+	print(sddl)
@@ -0,0 +1,112 @@
+﻿#-*- coding: utf-8 -*-
+'''Usage:
+	python guidsddl.py <GUID> [<GUID> ...]
+	python guidsddl.py --build <schema.ldf> [<extended-rights.ldf> ...] > forest.tsv
+
+Names of the GUIDs of object ACEs (OA, OD, OU, OL, ZA): schema classes and
+attributes (schemaIDGUID), property sets, extended rights and validated
+writes (rightsGuid). The prebuilt index guidsddl.tsv next to this module
+holds the well known ones and is read on the first lookup only, so runs
+without object ACEs never load it. The files listed in the SDDL_GUIDS
+environment variable (separated by os.pathsep) are loaded after it; --build
+makes such a file from LDIF exports of the schema and Extended-Rights
+containers of a forest, e.g.
+
+	ldifde -f schema.ldf -d CN=Schema,CN=Configuration,DC=... -l schemaIDGUID,lDAPDisplayName
+	ldifde -f rights.ldf -d CN=Extended-Rights,CN=Configuration,DC=... -l rightsGuid,cn,validAccesses
+
+Index lines are GUID<TAB>kind<TAB>name; a GUID listed twice (an attribute
+and the validated write on it) gets both names.'''
+
+import os, sys, uuid
+
+GUID_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'guidsddl.tsv')
+GUID_ENV  = 'SDDL_GUIDS'
+
+RIGHT_KINDS = {0x8: 'validated-write', 0x30: 'property-set', 0x100: 'extended-right'}	# validAccesses
+
+_index = None
+
+def load(path, index=None):
+	'''Add the entries of an index file to index (default: the loaded index).'''
+	if index is None:
+		index = guid_index()
+	with open(path, encoding='utf-8-sig') as f:
+		for line in f:
+			if line.startswith('#') or not line.strip():
+				continue
+			guid, kind, name = line.rstrip('\r\n').split('\t')[:3]
+			guid = guid.lower()
+			old = index.get(guid)
+			if old is not None and old[1] != name:
+				name = '{} / {}'.format(old[1], name)
+				kind = old[0]
+			index[guid] = (kind, name)
+	return index
+
+def guid_index():
+	global _index
+	if _index is None:
+		_index = {}
+		if os.path.exists(GUID_FILE):
+			load(GUID_FILE, _index)
+		for path in filter(None, os.environ.get(GUID_ENV, '').split(os.pathsep)):
+			load(path, _index)
+	return _index
+
+def guid_entry(guid):
+	'''(kind, name) of a GUID, None if unknown.'''
+	return guid_index().get(guid.lower())
+
+def guid_name(guid):
+	entry = guid_index().get(guid.lower())
+	return entry[1] if entry is not None else None
+
+# ================================================== Building from the schema:
+
+def schema_entries(lines):
+	'''Yield (guid, kind, name) of the classes, attributes and control access
+	rights of LDIF entries (text lines).'''
+	import ingestsddl
+	keep = ('schemaidguid', 'ldapdisplayname', 'objectclass', 'rightsguid', 'cn', 'validaccesses')
+	for lineno, entry in ingestsddl.ldif_entries(lines, keep):
+		name = (entry.get('ldapdisplayname') or entry.get('cn') or [None])[0]
+		if name is None:
+			continue
+		if isinstance(name, bytes):
+			name = name.decode('utf-8', 'replace')
+		guid = entry.get('schemaidguid')
+		if guid:
+			raw = guid[0]
+			guid = str(uuid.UUID(bytes_le=raw)) if isinstance(raw, bytes) else raw.strip('{}').lower()
+			classes = {c.lower() for c in entry.get('objectclass', ()) if isinstance(c, str)}
+			yield guid, 'class' if 'classschema' in classes else 'attribute', name
+		guid = entry.get('rightsguid')
+		if guid:
+			access = int(entry.get('validaccesses', ['256'])[0])
+			yield guid[0].strip('{}').lower(), RIGHT_KINDS.get(access, 'extended-right'), name
+
+# ================================================== MAIN PROGRAM
+
+def main(argv):
+	if len(argv) < 2:
+		print(__doc__)
+		sys.exit(0)
+	try:
+		if argv[1] == '--build':
+			import ingestsddl
+			write = sys.stdout.write
+			for path in argv[2:]:
+				with ingestsddl.open_text(path) as f:
+					for guid, kind, name in schema_entries(f):
+						write('{}\t{}\t{}\n'.format(guid, kind, name))
+			return
+		for guid in argv[1:]:
+			entry = guid_entry(guid)
+			print('{}\t{}\t{}'.format(guid.lower(), *(entry or ('', ''))))
+	except (IOError, ValueError) as e:
+		print("ERROR: {}".format(e), file=sys.stderr)
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,235 @@
+﻿#-*- coding: utf-8 -*-
+'''Usage:
+	python indexsddl.py <index.db> --update <dumpfile|-> [--full] [--namespace NS]
+	python indexsddl.py <index.db> --sid <SID> [--sid <SID> ...] [--right <RIGHT>] [--deny] [--conditional]
+	python indexsddl.py <index.db> --stats
+
+Persistent inverted index (SQLite) from SIDs and rights to the paths granting
+them, for audit questions like "where has Everyone write access":
+
+	python indexsddl.py share.db --sid WD --sid AU --right FW
+
+Every distinct descriptor (by canonsddl digest) is stored once with one row
+per SID and ACE kind (allow / deny) holding the union of the masks of its
+effective ACEs, generic rights mapped to the namespace. Paths point to their
+descriptor, so a query is one indexed lookup on the SID plus a join.
+
+--update merges a new dump: only paths whose descriptor digest changed are
+written. With --full the dump is a complete snapshot and indexed paths
+missing from it are removed. SIDs are given as aliases (WD, BA) or S-1-...
+strings, rights as SDDL abbreviations (FW, WD, GA, 0x...) or decoded names of
+the namespace (WRITE_DATA, DELETE ...); all bits of the right must be
+granted.
+
+Callback ACEs (XA, ZA, XD) only apply when their condition holds, so they are
+stored as conditional grants and left out of queries unless --conditional
+is given; their rows are then marked 'conditional'. Object ACEs with an
+object type GUID grant a property (set) or child class only and are not
+indexed, as in accesssddl.py.'''
+
+import sys, sqlite3
+
+import readsddl as rs
+import canonsddl, cachesddl
+
+ALLOW_TYPES  = {rs.SDDL_TYPE[k][2] for k in ('A', 'OA')}
+DENY_TYPES   = {rs.SDDL_TYPE[k][2] for k in ('D', 'OD')}
+CALLBACK_ALLOW_TYPES = {rs.SDDL_TYPE[k][2] for k in ('XA', 'ZA')}
+CALLBACK_DENY_TYPES  = {rs.SDDL_TYPE[k][2] for k in ('XD',)}
+OBJECT_TYPES = {rs.SDDL_TYPE[k][2] for k in ('OA', 'OD', 'ZA')}
+INHERIT_ONLY = rs.SDDL_FLAGS["IO"][2]
+
+KIND_ALLOW, KIND_DENY = 1, 2
+KIND_CONDITIONAL = 4							# or-ed into the kind of callback ACEs
+BATCH = 10000
+SCHEMA_VERSION = 2
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS descriptors (id INTEGER PRIMARY KEY, digest BLOB UNIQUE, sddl TEXT);
+CREATE TABLE IF NOT EXISTS paths (id INTEGER PRIMARY KEY, path TEXT UNIQUE, digest BLOB, sd_id INTEGER);
+CREATE TABLE IF NOT EXISTS grants (sd_id INTEGER, sid TEXT, kind INTEGER, mask INTEGER);
+CREATE INDEX IF NOT EXISTS grants_sid ON grants (sid, kind);
+CREATE INDEX IF NOT EXISTS paths_sd ON paths (sd_id);
+'''
+
+# ================================================== Index:
+
+def right_mask(right, namespace='file'):
+	'''Access bits of a right given as an SDDL abbreviation, a number or a decoded name.'''
+	names = dict(rs.MASK_NAMESPACES[namespace][1])
+	names.update(rs.STANDARD_RIGHTS)
+	if right.upper() in names:
+		return names[right.upper()]
+	try:
+		return canonsddl.map_generic(rs.rights_to_mask(right), namespace)
+	except rs.SDDLError:
+		raise rs.SDDLError("Unknown right: {}".format(right))
+
+def descriptor_grants(sd, namespace='file'):
+	'''{(sid, kind): mask} of the effective ACEs of a DACL.'''
+	grants = {}
+	if sd.dacl is None or not sd.dacl.aces:
+		return grants
+	for ace in sd.dacl.aces:
+		if ace.flags & INHERIT_ONLY or ace.type in OBJECT_TYPES and ace.object_guid:
+			continue
+		if ace.type in ALLOW_TYPES:
+			kind = KIND_ALLOW
+		elif ace.type in DENY_TYPES:
+			kind = KIND_DENY
+		elif ace.type in CALLBACK_ALLOW_TYPES:
+			kind = KIND_ALLOW | KIND_CONDITIONAL
+		elif ace.type in CALLBACK_DENY_TYPES:
+			kind = KIND_DENY | KIND_CONDITIONAL
+		else:
+			continue
+		key = (canonsddl._sid(ace.sid), kind)
+		grants[key] = grants.get(key, 0) | canonsddl.map_generic(ace.mask, namespace)
+	return grants
+
+class SddlIndex(object):
+	def __init__(self, path, namespace=None):
+		self.db = sqlite3.connect(path)
+		self.db.executescript(SCHEMA)
+		meta = dict(self.db.execute('SELECT key, value FROM meta'))
+		if not meta:
+			meta = {"version": str(SCHEMA_VERSION), "namespace": namespace or 'file'}
+			self.db.executemany('INSERT INTO meta VALUES (?, ?)', meta.items())
+			self.db.commit()
+		elif meta["version"] != str(SCHEMA_VERSION):
+			raise rs.SDDLError("Unsupported index version {}".format(meta["version"]))
+		elif namespace is not None and namespace != meta["namespace"]:
+			raise rs.SDDLError("Index was built for namespace {}".format(meta["namespace"]))
+		self.namespace = meta["namespace"]
+		self.descriptors = cachesddl.DescriptorCache()
+		self.sd_ids = {}							# digest -> descriptors.id, filled on demand
+
+	def close(self):
+		self.db.close()
+
+	def _sd_id(self, digest, sddl, sd):
+		sd_id = self.sd_ids.get(digest)
+		if sd_id is None:
+			row = self.db.execute('SELECT id FROM descriptors WHERE digest = ?', (digest,)).fetchone()
+			if row is not None:
+				sd_id = row[0]
+			else:
+				sd_id = self.db.execute('INSERT INTO descriptors (digest, sddl) VALUES (?, ?)', (digest, sddl)).lastrowid
+				self.db.executemany('INSERT INTO grants VALUES (?, ?, ?, ?)',
+					((sd_id, sid, kind, mask) for (sid, kind), mask in descriptor_grants(sd, self.namespace).items()))
+			if len(self.sd_ids) >= self.descriptors.maxsize:
+				self.sd_ids.clear()
+			self.sd_ids[digest] = sd_id
+		return sd_id
+
+	def _apply(self, batch, counters):
+		known = {}
+		for i in range(0, len(batch), 500):			# SQLite host parameter limit
+			part = [path for path, sddl, digest, sd in batch[i:i+500]]
+			known.update(self.db.execute('SELECT path, digest FROM paths WHERE path IN ({})'.format(
+				','.join('?' * len(part))), part))
+		for path, sddl, digest, sd in batch:
+			old = known.get(path)
+			if old == digest:
+				counters["unchanged"] += 1
+				continue
+			sd_id = self._sd_id(digest, sddl, sd)
+			if old is None:
+				self.db.execute('INSERT INTO paths (path, digest, sd_id) VALUES (?, ?, ?)', (path, digest, sd_id))
+				counters["added"] += 1
+			else:
+				self.db.execute('UPDATE paths SET digest = ?, sd_id = ? WHERE path = ?', (digest, sd_id, path))
+				counters["changed"] += 1
+			known[path] = digest
+
+	def update(self, records, full=False):
+		'''Merge (path, sddl, Descriptor) records; return counters of added,
+		changed, unchanged and (full snapshots only) removed paths.'''
+		counters = dict(added=0, changed=0, unchanged=0, removed=0)
+		if full:
+			self.db.execute('CREATE TEMP TABLE IF NOT EXISTS seen (path TEXT PRIMARY KEY)')
+			self.db.execute('DELETE FROM seen')
+		batch, digests = [], {}						# raw SDDL -> digest of the current batch
+		with self.db:
+			for path, sddl, sd in records:
+				digest = digests.get(sddl)
+				if digest is None:
+					digest = digests[sddl] = canonsddl.digest(sd, self.namespace)
+				batch.append((path, sddl, digest, sd))
+				if len(batch) >= BATCH:
+					self._apply(batch, counters)
+					if full:
+						self.db.executemany('INSERT OR IGNORE INTO seen VALUES (?)', ((b[0],) for b in batch))
+					batch, digests = [], {}
+			self._apply(batch, counters)
+			if full:
+				self.db.executemany('INSERT OR IGNORE INTO seen VALUES (?)', ((b[0],) for b in batch))
+				counters["removed"] = self.db.execute('DELETE FROM paths WHERE path NOT IN (SELECT path FROM seen)').rowcount
+			if counters["changed"] or counters["removed"]:
+				self._collect()
+		return counters
+
+	def _collect(self):
+		'''Drop descriptors (and their grants) no path refers to any more.'''
+		self.db.execute('DELETE FROM descriptors WHERE id NOT IN (SELECT DISTINCT sd_id FROM paths)')
+		self.db.execute('DELETE FROM grants WHERE sd_id NOT IN (SELECT id FROM descriptors)')
+		self.sd_ids.clear()
+
+	def query(self, sids, right=None, deny=False, conditional=False):
+		'''Yield (path, sid, mask, kind) for paths where one of the SIDs is allowed
+		(denied with deny=True) all bits of right (any right if None); grants
+		of callback ACEs (kind & KIND_CONDITIONAL) only with conditional=True.'''
+		sids = [canonsddl._sid(s) for s in sids]
+		bits = right_mask(right, self.namespace) if isinstance(right, str) else right or 0
+		kind = KIND_DENY if deny else KIND_ALLOW
+		kinds = [kind, kind | KIND_CONDITIONAL] if conditional else [kind]
+		sql = '''SELECT p.path, g.sid, g.mask, g.kind FROM grants g JOIN paths p ON p.sd_id = g.sd_id
+			WHERE g.sid IN ({}) AND g.kind IN ({}) AND g.mask & ? = ? ORDER BY p.path'''.format(
+			','.join('?' * len(sids)), ','.join('?' * len(kinds)))
+		return self.db.execute(sql, sids + kinds + [bits, bits])
+
+	def stats(self):
+		return {name: self.db.execute('SELECT COUNT(*) FROM {}'.format(name)).fetchone()[0]
+			for name in ('paths', 'descriptors', 'grants')}
+
+# ================================================== MAIN PROGRAM
+
+def main(argv):
+	import argparse, streamsddl
+	ap = argparse.ArgumentParser(add_help=False)
+	ap.add_argument('db', nargs='?')
+	ap.add_argument('--update')
+	ap.add_argument('--full', action='store_true')
+	ap.add_argument('--namespace', choices=list(rs.MASK_NAMESPACES))
+	ap.add_argument('--sid', action='append', default=[])
+	ap.add_argument('--right')
+	ap.add_argument('--deny', action='store_true')
+	ap.add_argument('--conditional', action='store_true')
+	ap.add_argument('--stats', action='store_true')
+	args = ap.parse_args(argv[1:])
+	if args.db is None or not (args.update or args.sid or args.stats):
+		print(__doc__)
+		sys.exit(0)
+	try:
+		index = SddlIndex(args.db, args.namespace)
+		if args.update:
+			stats = streamsddl.Stats()
+			records = streamsddl.read_records(streamsddl.iter_lines(args.update), stats)
+			counters = index.update(streamsddl.parse_records(records, stats, cache=index.descriptors), args.full)
+			print(stats.summary(), file=sys.stderr)
+			print("{added} added, {changed} changed, {unchanged} unchanged, {removed} removed".format(**counters), file=sys.stderr)
+		if args.sid:
+			write = sys.stdout.write
+			for path, sid, mask, kind in index.query(args.sid, args.right, args.deny, args.conditional):
+				write('{}\t{}\t{}{}\n'.format(path, sid, rs.rights_names(mask, index.namespace),
+					'\tconditional' if kind & KIND_CONDITIONAL else ''))
+		if args.stats:
+			print("{paths} paths, {descriptors} descriptors, {grants} grants".format(**index.stats()))
+		index.close()
+	except (IOError, sqlite3.Error, rs.SDDLError) as e:
+		print("ERROR: {}".format(e), file=sys.stderr)
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main(sys.argv)
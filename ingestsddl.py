@@ -0,0 +1,311 @@
+﻿#-*- coding: utf-8 -*-
+'''Usage:
+	python ingestsddl.py [--input ldif|reg|regini] [--domain S-1-5-21-x-y-z] <file|->
+
+Streaming readers for security descriptors outside of file system dumps:
+
+	ldif    LDIF exports (ldifde -l nTSecurityDescriptor, ldapsearch): one
+	        record per entry, the DN and the descriptor, binary (base64,
+	        decoded with binsddl) or SDDL text
+	reg     .reg exports (REGEDIT4 / version 5.00, UTF-16 or UTF-8): string
+	        values holding SDDL and binary values holding a self-relative
+	        descriptor (the Security value of services, for example)
+	regini  regini scripts with SDDL key ACLs ('\\Registry\\Machine\\Key [D:...]',
+	        nested keys indented); numeric ACL lists are skipped
+
+The input kind is taken from the extension (.ldf / .ldif, .reg) unless given.
+Entries are read one at a time and identical binary descriptors are decoded
+once (AD stores a few thousand distinct ones for a whole partition), so a
+full partition export is processed in one pass in bounded memory. Records
+are (line number, path, SDDL) like streamsddl.read_records(), which makes
+them usable everywhere a dump is: 'readsddl.py --bulk F --input ldif'. The
+command line prints path<TAB>SDDL lines for 'readsddl.py --bulk -'.'''
+
+import io, sys, base64
+
+import readsddl as rs
+import binsddl, streamsddl
+
+BLOB_CACHE = 4096
+SDDL_TAGS  = streamsddl.SDDL_TAGS
+INPUTS     = ('ldif', 'reg', 'regini')
+EXTENSIONS = {'.ldf': 'ldif', '.ldif': 'ldif', '.reg': 'reg'}
+
+# ================================================== Input:
+
+def open_text(source):
+	'''Text stream of a file or of stdin ('-'): UTF-16 with a BOM (regedit
+	version 5 files), UTF-8 otherwise.'''
+	raw = sys.stdin.buffer if source == '-' else open(source, 'rb')
+	head = raw.peek(2)[:2]
+	encoding = 'utf-16' if head in (b'\xff\xfe', b'\xfe\xff') else 'utf-8-sig'
+	return io.TextIOWrapper(raw, encoding, errors='replace', newline=None)
+
+def input_kind(source, kind=None):
+	if kind:
+		return kind
+	for ext, k in EXTENSIONS.items():
+		if source.lower().endswith(ext):
+			return k
+	return 'regini'
+
+class BlobDecoder(object):
+	'''Binary descriptor -> SDDL, cached by the raw bytes.'''
+
+	def __init__(self, domain=None, cache_size=BLOB_CACHE):
+		self.sids = binsddl.SidTable(domain)
+		self.cache = {}
+		self.cache_size = cache_size
+
+	def decode(self, blob):
+		sddl = self.cache.get(blob)
+		if sddl is None:
+			try:
+				sd, end = binsddl.decode_descriptor(blob, 0, self.sids)
+			except IndexError:
+				raise rs.SDDLError("Truncated binary descriptor")
+			except ValueError as e:					# struct.error
+				raise rs.SDDLError("Invalid binary descriptor: {}".format(e))
+			sddl = rs.descriptor_to_string(sd)
+			if len(self.cache) >= self.cache_size:
+				self.cache.clear()
+			self.cache[blob] = sddl
+		return sddl
+
+def looks_like_descriptor(blob):
+	return len(blob) >= 20 and blob[0] == 1 and blob[3] & 0x80	# revision 1, SE_SELF_RELATIVE
+
+# ================================================== LDIF:
+
+def ldif_entries(lines, keep, stats=None):
+	'''Yield (line number, {attribute: [values]}) per LDIF entry, attribute
+	names lower case, only those in keep; 'attr:: base64' values are bytes.'''
+	entry, start = {}, None
+	attr = value = None
+	lineno = 0
+
+	def add():
+		name, sep, v = attr.partition(':')
+		name = name.split(';', 1)[0].strip().lower()		# attribute options (;binary, ;range=...)
+		if name not in keep:
+			return
+		if v.startswith(':'):
+			try:
+				v = base64.b64decode(v[1:].strip() + ''.join(value))
+			except ValueError:						# binascii.Error
+				if stats is not None:
+					stats.errors += 1
+				return
+		elif v.startswith('<'):						# URL reference, not followed
+			return
+		else:
+			v = (v[1:] if v.startswith(' ') else v) + ''.join(value)
+		entry.setdefault(name, []).append(v)
+
+	for line in lines:
+		lineno += 1
+		if stats is not None:
+			stats.lines += 1
+			stats.bytes += len(line)
+		line = line.rstrip('\r\n')
+		if line.startswith(' '):					# folded line
+			if attr is not None:
+				value.append(line[1:])
+			continue
+		if attr is not None:
+			add()
+			attr = None
+		if not line:
+			if entry:
+				yield start, entry
+			entry, start = {}, None
+			continue
+		if line.startswith('#'):
+			continue
+		if start is None:
+			if line.startswith('version:'):				# file header
+				continue
+			start = lineno
+		if ':' in line:
+			attr, value = line, []
+	if attr is not None:
+		add()
+	if entry:
+		yield start, entry
+
+def _text(v):
+	return v.decode('utf-8', 'replace') if isinstance(v, bytes) else v
+
+SDDL_TAGS_B = tuple(t.encode('ascii') for t in SDDL_TAGS)
+
+def read_ldif(lines, stats, decoder=None, on_error=streamsddl.report_error):
+	'''Yield (line number, DN, SDDL) per entry with an nTSecurityDescriptor.'''
+	decoder = decoder or BlobDecoder()
+	for lineno, entry in ldif_entries(lines, ('dn', 'ntsecuritydescriptor'), stats):
+		values = entry.get('ntsecuritydescriptor')
+		if not values:
+			continue
+		dn = _text(entry.get('dn', [''])[0])
+		value = values[0]
+		if isinstance(value, bytes) and value[:2] not in SDDL_TAGS_B:
+			try:
+				sddl = decoder.decode(value)
+			except rs.SDDLError as e:
+				stats.errors += 1
+				on_error(lineno, e)
+				continue
+		else:
+			sddl = _text(value).strip()
+		yield lineno, dn, sddl
+
+# ================================================== Registry:
+
+def _reg_string(data):
+	'''"quoted \\"string\\"" -> string.'''
+	out, i = [], 1
+	while i < len(data):
+		c = data[i]
+		if c == '\\' and i + 1 < len(data):
+			out.append(data[i + 1])
+			i += 2
+			continue
+		if c == '"':
+			break
+		out.append(c)
+		i += 1
+	return ''.join(out)
+
+def _reg_values(lines, stats):
+	'''Yield (line number, key, value name, type, data) of a .reg file, joining
+	continued hex lines.'''
+	key = None
+	pending, start = None, 0
+	lineno = 0
+	for line in lines:
+		lineno += 1
+		stats.lines += 1
+		stats.bytes += len(line)
+		line = line.rstrip('\r\n')
+		if pending is not None:
+			pending += line.strip()
+			if pending.endswith('\\'):
+				pending = pending[:-1]
+				continue
+			line, pending = pending, None
+		else:
+			start = lineno
+			line = line.strip()
+			if line.endswith('\\') and '=hex' in line:
+				pending = line[:-1]
+				continue
+		if line.startswith('['):
+			key = line[1:line.rfind(']')] if not line.startswith('[-') else None
+			continue
+		if key is None or not (line.startswith('"') or line.startswith('@=')):
+			continue
+		if line.startswith('@='):
+			name, data = '', line[2:]
+		else:
+			end = 1
+			while end < len(line):					# closing quote of the name
+				if line[end] == '\\':
+					end += 2
+					continue
+				if line[end] == '"':
+					break
+				end += 1
+			name, data = _reg_string(line[:end + 1]), line[end + 1:].lstrip()
+			if not data.startswith('='):
+				continue
+			data = data[1:]
+		if data.startswith('"'):
+			yield start, key, name, 'sz', _reg_string(data)
+		elif data.startswith('hex:'):
+			try:
+				blob = bytes.fromhex(data[4:].replace(',', ''))
+			except ValueError:
+				continue
+			yield start, key, name, 'binary', blob
+
+def read_reg(lines, stats, decoder=None, on_error=streamsddl.report_error):
+	'''Yield (line number, key\\value, SDDL) of the descriptor values of a .reg file.'''
+	decoder = decoder or BlobDecoder()
+	for lineno, key, name, kind, data in _reg_values(lines, stats):
+		path = key + '\\' + name if name else key
+		if kind == 'sz':
+			if data[:2] in SDDL_TAGS:
+				yield lineno, path, data
+		elif looks_like_descriptor(data):
+			try:
+				yield lineno, path, decoder.decode(data)
+			except rs.SDDLError as e:
+				stats.errors += 1
+				on_error(lineno, e)
+
+def read_regini(lines, stats, decoder=None, on_error=streamsddl.report_error):
+	'''Yield (line number, key, SDDL) of the keys of a regini script that carry
+	an SDDL ACL; relative key names are resolved through their indentation.'''
+	stack = []										# (indent, absolute key)
+	lineno = 0
+	for line in lines:
+		lineno += 1
+		stats.lines += 1
+		stats.bytes += len(line)
+		text = line.rstrip('\r\n')
+		body = text.strip()
+		if not body or body.startswith(';') or '=' in body.split('[', 1)[0]:	# comments, values
+			continue
+		acl = ''
+		if body.endswith(']') and '[' in body:
+			body, _, acl = body[:-1].rpartition('[')
+			body, acl = body.rstrip(), acl.strip()
+		indent = len(text) - len(text.lstrip())
+		while stack and stack[-1][0] >= indent:
+			stack.pop()
+		if body.startswith('\\') or body.upper().startswith('HKEY_') or not stack:
+			key = body
+		else:
+			key = stack[-1][1] + '\\' + body
+		stack.append((indent, key))
+		if acl[:2] in SDDL_TAGS:
+			yield lineno, key, acl
+
+READERS = {
+	"ldif"   : read_ldif,
+	"reg"    : read_reg,
+	"regini" : read_regini,
+}
+
+def read_source(source, kind=None, stats=None, domain=None):
+	'''Records of a file or stdin: kind is ldif, reg or regini (default: from
+	the extension).'''
+	stats = stats if stats is not None else streamsddl.Stats()
+	reader = READERS[input_kind(source, kind)]
+	with open_text(source) as f:
+		yield from reader(f, stats, BlobDecoder(domain))
+
+# ================================================== MAIN PROGRAM
+
+def main(argv):
+	import argparse
+	ap = argparse.ArgumentParser(add_help=False)
+	ap.add_argument('source', nargs='?')
+	ap.add_argument('--input', choices=INPUTS)
+	ap.add_argument('--domain')
+	args = ap.parse_args(argv[1:])
+	if args.source is None:
+		print(__doc__)
+		sys.exit(0)
+	stats = streamsddl.Stats()
+	write = sys.stdout.write
+	try:
+		for lineno, path, sddl in read_source(args.source, args.input, stats, args.domain):
+			stats.records += 1
+			write('{}\t{}\n'.format(path.replace('\t', ' '), sddl))
+	except IOError as e:
+		print("ERROR: {}".format(e), file=sys.stderr)
+		sys.exit(1)
+	print(stats.summary(), file=sys.stderr)
+
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,219 @@
+﻿#-*- coding: utf-8 -*-
+'''Usage:
+	python inheritsddl.py [--sddl <root SDDL>] [--listing F] [--dump F] [--what-if <SDDL>] [--namespace NS] <root>
+
+Inheritance propagation simulator: derives the ACLs every node of a tree ends
+up with from the descriptor of its root, without one cacls / GetFileSecurity
+call per path. The nodes come from a listing (one path per line, folders end
+with '\\' or '/'), from a partial dump ('cacls /T /S' output or path<TAB>SDDL
+lines) or, without both, from walking <root> (only names are read). Nodes of
+the dump keep their explicit ACEs and their P flag; the root descriptor is
+--sddl or the dump entry of <root>. One path<TAB>SDDL line is printed per
+node, ready for 'readsddl.py --bulk -'.
+
+With --what-if the tree is computed for both the current and the new root
+descriptor and the ACE changes are printed per affected path as JSON Lines
+(see snapsddl.py).
+
+Rules (DACL and SACL alike):
+	- a folder inherits CI ACEs as effective ACEs and OI only ACEs as OI|IO
+	  ones, a file inherits OI ACEs; NP stops at the first level and IO is
+	  cleared on the inheriting node; inherited copies are marked ID
+	- an inherited copy that keeps propagating while granting generic rights
+	  or naming CREATOR OWNER / GROUP is split into an effective ACE (rights
+	  mapped, SID replaced) and an inherit-only ACE keeping the original
+	- a protected ACL (P) inherits nothing; explicit ACEs come before the
+	  inherited ones; children of an AI / AR ACL are marked AI
+Each distinct (parent ACL, node kind, explicit ACL) is computed once.'''
+
+import os, sys
+from functools import lru_cache
+
+import readsddl as rs
+import canonsddl
+
+CACHE_SIZE = 4096
+
+OBJECT_INHERIT    = rs.SDDL_FLAGS["OI"][2]
+CONTAINER_INHERIT = rs.SDDL_FLAGS["CI"][2]
+NO_PROPAGATE      = rs.SDDL_FLAGS["NP"][2]
+INHERIT_ONLY      = rs.SDDL_FLAGS["IO"][2]
+INHERITED         = rs.SDDL_FLAGS["ID"][2]
+INHERIT_FLAGS     = OBJECT_INHERIT | CONTAINER_INHERIT | NO_PROPAGATE | INHERIT_ONLY
+
+PROTECTED         = rs.SDDL_ACL_FLAGS["P"][2]
+AUTO_INHERITED    = rs.SDDL_ACL_FLAGS["AI"][2]
+AUTO_INHERIT_REQ  = rs.SDDL_ACL_FLAGS["AR"][2]
+
+# ================================================== Propagation rules:
+
+def _effective(ace, owner, group, namespace):
+	sid = canonsddl._sid(ace.sid)
+	if sid == 'CO' and owner is not None:
+		sid = owner
+	elif sid == 'CG' and group is not None:
+		sid = group
+	return rs.Ace(ace.type, (ace.flags & ~INHERIT_FLAGS) | INHERITED, canonsddl.map_generic(ace.mask, namespace),
+		ace.object_guid, ace.inherit_object_guid, sid, ace.condition)
+
+def inherited_aces(ace, container, owner=None, group=None, namespace='file'):
+	'''ACEs a child node gets from one ACE of its parent.'''
+	flags = ace.flags
+	if not container:
+		return [_effective(ace, owner, group, namespace)] if flags & OBJECT_INHERIT else []
+	if not flags & CONTAINER_INHERIT:
+		if flags & OBJECT_INHERIT and not flags & NO_PROPAGATE:		# passed on to the files below
+			return [ace._replace(flags=(flags & ~INHERIT_FLAGS) | OBJECT_INHERIT | INHERIT_ONLY | INHERITED)]
+		return []
+	effective = _effective(ace, owner, group, namespace)
+	if flags & NO_PROPAGATE:
+		return [effective]
+	if effective.mask == ace.mask and effective.sid == ace.sid:
+		return [ace._replace(flags=(flags & ~INHERIT_ONLY) | INHERITED)]
+	return [effective, ace._replace(flags=flags | INHERIT_ONLY | INHERITED)]
+
+@lru_cache(maxsize=CACHE_SIZE)
+def inherit_acl(parent, container, child=None, owner=None, group=None, namespace='file'):
+	'''ACL of a node from the ACL of its parent and its own (explicit) ACL, if any.'''
+	if child is not None and (child.flags & PROTECTED or child.aces is None):
+		return child
+	inherited = []
+	if parent is not None and parent.aces:
+		for ace in parent.aces:
+			inherited.extend(inherited_aces(ace, container, owner, group, namespace))
+	if child is None and parent is None:
+		return None
+	flags = child.flags if child is not None else 0
+	if parent is not None and parent.flags & (AUTO_INHERITED | AUTO_INHERIT_REQ):
+		flags |= AUTO_INHERITED
+	explicit = tuple(ace for ace in child.aces if not ace.flags & INHERITED) if child is not None else ()
+	return rs.Acl(flags, explicit + tuple(inherited))
+
+def inherit(parent, container, child=None, namespace='file'):
+	'''Descriptor of a node from the descriptor of its parent and its own one, if any.'''
+	owner = child.owner if child is not None and child.owner else parent.owner
+	group = child.group if child is not None and child.group else parent.group
+	return rs.Descriptor(owner, group,
+		inherit_acl(parent.dacl, container, child.dacl if child is not None else None, owner, group, namespace),
+		inherit_acl(parent.sacl, container, child.sacl if child is not None else None, owner, group, namespace))
+
+# ================================================== Trees:
+
+def _key(path):
+	return path.replace('\\', '/').rstrip('/').lower()	# Windows paths are case insensitive
+
+def tree_nodes(root, paths):
+	'''Sort (path, container or None) pairs below root parents first; the kind of
+	a node not known is container if other nodes are below it.'''
+	root_key = _key(root)
+	nodes = {}
+	for path, container in paths:
+		key = _key(path)
+		if key != root_key and not key.startswith(root_key + '/'):
+			continue
+		nodes[key] = (path, container or nodes.get(key, (None, False))[1])
+	for key in list(nodes):
+		parent = key.rpartition('/')[0]
+		while parent.startswith(root_key) and parent not in nodes:
+			nodes[parent] = (parent, True)				# implied folder
+			parent = parent.rpartition('/')[0]
+		if parent in nodes:
+			nodes[parent] = (nodes[parent][0], True)
+	return [(key,) + nodes[key] for key in sorted(nodes, key=lambda k: k.split('/'))]
+
+def propagate(root, root_sd, nodes, explicit=None, namespace='file'):
+	'''Yield (path, Descriptor) for root and every node below it; nodes are
+	(key, path, container) from tree_nodes(), explicit maps keys to the
+	Descriptors recorded for some nodes.'''
+	explicit = explicit or {}
+	root_key = _key(root)
+	folders = {root_key: root_sd}
+	for key, path, container in nodes:
+		if key == root_key:
+			yield path, root_sd
+			continue
+		parent = folders.get(key.rpartition('/')[0])
+		if parent is None:
+			continue
+		sd = inherit(parent, container, explicit.get(key), namespace)
+		if container:
+			folders[key] = sd
+		yield path, sd
+
+def what_if(root, old_sd, new_sd, nodes, explicit=None, namespace='file'):
+	'''Yield (path, DescriptorDiff) for the nodes whose descriptor changes when
+	the root descriptor goes from old_sd to new_sd.'''
+	nodes = list(nodes)
+	diffs = {}
+	for (path, a), (_, b) in zip(propagate(root, old_sd, nodes, explicit, namespace), propagate(root, new_sd, nodes, explicit, namespace)):
+		if a == b:
+			continue
+		d = diffs.get((a, b), diffs)
+		if d is diffs:
+			d = canonsddl.diff(a, b, namespace)
+			if len(diffs) >= CACHE_SIZE:
+				diffs.clear()
+			diffs[(a, b)] = d
+		if d is not None:
+			yield path, d
+
+# ================================================== MAIN PROGRAM
+
+def read_listing(listing):
+	import streamsddl
+	for raw in streamsddl.iter_lines(listing):
+		path = raw.decode('utf-8', 'replace').rstrip('\r\n')
+		if path:
+			yield path.rstrip('/\\') or path, path.endswith(('/', '\\'))
+
+def walk_tree(root):
+	yield root, True
+	for top, dirs, files in os.walk(root):
+		for name in dirs:
+			yield os.path.join(top, name), True
+		for name in files:
+			yield os.path.join(top, name), False
+
+def main(argv):
+	import argparse, json, streamsddl, snapsddl
+	ap = argparse.ArgumentParser(add_help=False)
+	ap.add_argument('root', nargs='?')
+	ap.add_argument('--sddl')
+	ap.add_argument('--listing')
+	ap.add_argument('--dump')
+	ap.add_argument('--what-if')
+	ap.add_argument('--namespace', choices=list(rs.MASK_NAMESPACES), default='file')
+	args = ap.parse_args(argv[1:])
+	if args.root is None or not (args.sddl or args.dump):
+		print(__doc__)
+		sys.exit(0)
+	try:
+		explicit, paths = {}, []
+		if args.dump:
+			stats = streamsddl.Stats()
+			for path, sddl, sd in streamsddl.parse_records(streamsddl.read_records(streamsddl.iter_lines(args.dump), stats), stats):
+				explicit[_key(path)] = sd
+				paths.append((path, None))
+		if args.listing:
+			paths.extend(read_listing(args.listing))
+		elif not args.dump:
+			paths.extend(walk_tree(args.root))
+		root_sd = rs.parse_descriptor(args.sddl) if args.sddl else explicit.get(_key(args.root))
+		if root_sd is None:
+			raise rs.SDDLError("No descriptor for the root {}".format(args.root))
+		nodes = tree_nodes(args.root, paths + [(args.root, True)])
+		write = sys.stdout.write
+		if args.what_if:
+			new_sd = rs.parse_descriptor(args.what_if)
+			for path, d in what_if(args.root, root_sd, new_sd, nodes, explicit, args.namespace):
+				write(json.dumps(snapsddl.drift_record(path, d)))
+				write('\n')
+		else:
+			for path, sd in propagate(args.root, root_sd, nodes, explicit, args.namespace):
+				write('{}\t{}\n'.format(path, rs.descriptor_to_string(sd)))
+	except (IOError, rs.SDDLError) as e:
+		print("ERROR: {}".format(e), file=sys.stderr)
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,184 @@
+﻿#-*- coding: utf-8 -*-
+'''Stage timers and counters of a run.
+
+Off unless enabled with --profile <target> (readsddl.py) or the SDDL_PROFILE
+environment variable (any tool, getsddl.py included). The target decides
+what is written at exit:
+
+	file.json     the metrics below as JSON
+	file.prof     a cProfile dump for pstats / snakeviz, plus the metrics
+	              on stderr
+	- or 1        the metrics on stderr
+
+Stages are exclusive wall clock times: time spent in a nested stage is not
+charged to the outer one. Instrumented stages: read (reading and splitting
+dump lines), cacls (waiting for the cacls process), source (waiting for
+the ACL source), GetFileSecurity (summed over the lookup threads), parse,
+decode (decoding masks and formatting a distinct descriptor), render, write
+and, with --workers, workers (waiting for the worker processes, whose own
+stages are not recorded). Counters: lines, bytes, descriptors, aces, errors,
+unknown_sids (distinct SIDs without a well known name) and the descriptor
+cache counters.
+
+When disabled, instrumented code checks the module level ENABLED flag once
+per call or per loop and iterators are not wrapped, so the cost is close to
+nothing. Hooks: add_hook(f) calls f(metrics()) at exit, add_source(name, f)
+adds the dict returned by f() to metrics() under name, and metrics() can be
+called at any time by a job runner in the same process.'''
+
+import os, sys, json, time, atexit
+
+ENABLED = False
+
+_clock    = time.perf_counter
+_stages   = {}								# name -> [seconds, calls]
+_counters = {}
+_unknown  = set()
+_sources  = {}
+_hooks    = []
+_current  = None
+_since    = 0.0
+_started  = 0.0
+_target   = None
+_profiler = None
+
+# ================================================== Recording:
+
+def switch(name):
+	'''Charge the time since the last switch to the current stage and make
+	name current; returns the previous stage.'''
+	global _current, _since
+	now = _clock()
+	prev = _current
+	if prev is not None:
+		_stages[prev][0] += now - _since
+	if name is not None and name not in _stages:
+		_stages[name] = [0.0, 0]
+	_current, _since = name, now
+	return prev
+
+class stage(object):
+	'''with stage(name): ... ; a no-op unless profiling is enabled.'''
+	__slots__ = ('name', 'prev')
+
+	def __init__(self, name):
+		self.name = name
+
+	def __enter__(self):
+		if ENABLED:
+			self.prev = switch(self.name)
+			_stages[self.name][1] += 1
+		return self
+
+	def __exit__(self, *exc):
+		if ENABLED:
+			switch(self.prev)
+
+def timed(name, iterable):
+	'''Charge the time spent producing the items of iterable to stage name.'''
+	if not ENABLED:
+		return iterable
+	return _timed(name, iter(iterable))
+
+def _timed(name, it):
+	while True:
+		prev = switch(name)
+		try:
+			item = next(it)
+		except StopIteration:
+			switch(prev)
+			return
+		switch(prev)
+		_stages[name][1] += 1
+		yield item
+
+def add_time(name, seconds, calls=1):
+	'''Add to a stage timed elsewhere, e.g. by worker threads (such stages
+	are summed over the threads, not exclusive).'''
+	if ENABLED:
+		entry = _stages.setdefault(name, [0.0, 0])
+		entry[0] += seconds
+		entry[1] += calls
+
+def count(name, n=1):
+	if ENABLED:
+		_counters[name] = _counters.get(name, 0) + n
+
+def update(counters):
+	if ENABLED:
+		for name, n in counters.items():
+			_counters[name] = _counters.get(name, 0) + n
+
+def unknown_sid(sid):
+	if ENABLED:
+		_unknown.add(sid)
+
+# ================================================== Hooks and output:
+
+def add_source(name, func):
+	_sources[name] = func
+
+def add_hook(func):
+	_hooks.append(func)
+
+def metrics():
+	if _current is not None:
+		switch(_current)					# bring the running stage up to date
+	result = {
+		"seconds"  : round(_clock() - _started, 6) if _started else 0.0,
+		"stages"   : {name: {"seconds": round(s, 6), "calls": c} for name, (s, c) in _stages.items()},
+		"counters" : dict(_counters, unknown_sids=len(_unknown)),
+	}
+	for name, func in _sources.items():
+		result[name] = func()
+	return result
+
+def format_metrics(m):
+	lines = ["profile: {:.3f} s".format(m["seconds"])]
+	for name, s in sorted(m["stages"].items(), key=lambda kv: -kv[1]["seconds"]):
+		lines.append("  {:16} {:10.3f} s {:10} calls".format(name, s["seconds"], s["calls"]))
+	for name, n in sorted(m["counters"].items()):
+		lines.append("  {:16} {:10}".format(name, n))
+	return '\n'.join(lines)
+
+def enable(target='-'):
+	'''Start recording; target is where finish() writes the results.'''
+	global ENABLED, _target, _started, _profiler
+	if ENABLED:
+		return
+	ENABLED, _target, _started = True, target, _clock()
+	if target.endswith(('.prof', '.pstats')):
+		import cProfile
+		_profiler = cProfile.Profile()
+		_profiler.enable()
+	atexit.register(finish)
+
+def enable_from_env(var='SDDL_PROFILE'):
+	target = os.environ.get(var)
+	if target:
+		enable(target)
+
+def finish():
+	global ENABLED, _profiler
+	if not ENABLED:
+		return
+	if _profiler is not None:
+		_profiler.disable()
+		_profiler.dump_stats(_target)
+		_profiler = None
+	m = metrics()
+	ENABLED = False
+	for hook in _hooks:
+		hook(m)
+	if _target.endswith('.json'):
+		with open(_target, 'w') as f:
+			json.dump(m, f, indent=1)
+	else:
+		print(format_metrics(m), file=sys.stderr)
+
+def reset():
+	global _current
+	_stages.clear()
+	_counters.clear()
+	_unknown.clear()
+	_current = None
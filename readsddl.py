@@ -4,6 +4,31 @@
     python readssdl.py [path]<filename>
   2) Parse SDDL string:
     python readssdl.py /S:<SDDL>
+  3) Parse a dump of SDDL lines or 'cacls /T /S' output ('-' reads stdin):
+    python readssdl.py --bulk <dumpfile|-> [--format jsonl|tsv|csv|human] [--quiet] [--workers N] [--chunk-size MB]
+    python readssdl.py --bulk <export> --input ldif|reg|regini [--namespace ds|registry]
+  4) Read and parse the ACLs of a whole directory tree:
+    python readssdl.py --tree <folder>
+  Options:
+    --source cacls|win32  read file ACLs with cacls or GetFileSecurity (default: cacls)
+    --dump F              read file ACLs from a recorded 'cacls /T /S' dump instead (any OS)
+    --threads N           concurrent GetFileSecurity calls for --source win32 (default: 8)
+    --workers N           parse a dump file with N processes, 0 uses every core (default: 1)
+    --chunk-size MB       size of the byte ranges handed to the workers (default: 16)
+    --cache-size N        parse each distinct SDDL once, keep up to N descriptors (default: 4096, 0 disables)
+    --cache-file F        load the descriptor cache from F and save it back at the end
+    --namespace NS        any|file|registry|ds|label, names used to decode access masks (default: any)
+    --quiet               with --bulk: print the summary line only
+    --input KIND          with --bulk: dump (default), ldif (nTSecurityDescriptor of AD objects),
+                          reg (.reg export) or regini (regini script), see ingestsddl.py
+    --snapshot F          with --bulk or --tree: save a (path, digest) snapshot to F instead of parsing
+    --resolve SRC         names of non well known SIDs from a mapping file, an SQLite db or 'win32'
+                          (LookupAccountSid), see sidsddl.py; --bulk then runs in one process;
+                          not with --snapshot (snapshots hold SDDL, not names)
+    --sid-cache F         keep resolved SID names in F between runs (entries expire after a day)
+    --profile T           stage timers and counters at exit: T.json (metrics), T.prof (cProfile dump)
+                          or '-' (summary on stderr), also set by SDDL_PROFILE=T, see profsddl.py
+    --against OLD         with --snapshot: print the ACL drift since the snapshot OLD as JSON Lines
 
 SDDL is a security descriptor definition, like this:
   D:PAI(A;;0x1301bf;;;AU)(A;;FA;;;SY)(A;;FA;;;BA)(A;;0x1301bf;;;BU)
@@ -39,7 +64,7 @@ SDDL is a security descriptor definition, like this:
         "RA"  SDDL_RESOURCE_ATTRIBUTE              SYSTEM_RESOURCE_ATTRIBUTE_ACE_TYPE 0x12
         "SP"  SDDL_SCOPED_POLICY_ID                SYSTEM_SCOPED_POLICY_ID_ACE_TYPE   0x13
         "XU"  SDDL_CALLBACK_AUDIT                  SYSTEM_AUDIT_CALLBACK_ACE_TYPE     0x0D
-        "ZA"  SDDL_CALLBACK_OBJECT_ACCESS_ALLOWED  ACCESS_ALLOWED_CALLBACK_ACE_TYPE   0x09
+        "ZA"  SDDL_CALLBACK_OBJECT_ACCESS_ALLOWED  ACCESS_ALLOWED_CALLBACK_OBJECT_ACE_TYPE 0x0B
       ace_flags:
         "CI"  SDDL_CONTAINER_INHERIT               CONTAINER_INHERIT_ACE              0x02
         "OI"  SDDL_OBJECT_INHERIT                  OBJECT_INHERIT_ACE                 0x01
@@ -146,7 +171,14 @@ SDDL is a security descriptor definition, like this:
 
 # ================================================== Initialisation
 
-import os, sys, re
+import os, sys, re, argparse
+from sys import intern
+from collections import namedtuple
+from functools import lru_cache
+
+import profsddl
+
+rendersddl = None							# imported on first use: it imports this module
 
 # debug = 1
 # debug = 2
@@ -155,32 +187,6 @@ def Usage():
 	print(__doc__)
 	sys.exit(0)
 
-if len(sys.argv) < 2:
-	if 'debug' in dict(globals()):
-		if debug == 1:
-			param = 'README.md'
-		elif debug == 2:
-			param = '/S:D:AI(A;ID;0x1301bf;;;AU)(A;ID;FA;;;SY)(A;ID;FA;;;BA)(A;ID;0x1301bf;;;BU)'
-	else:
-		Usage()
-else:
-	param = sys.argv[1]
-
-m = re.search('^/[sS]:(.+?)$', param)
-if m:
-	sddl = m.group(1)
-	case = 2
-else:
-	case = 1
-	filename = param
-	try:					# Check if file exists
-		f = open(filename)
-		f.close()
-	except IOError:
-		print("ERROR: Cannot open file: ", filename)
-		print("Terminated!")	
-		sys.exit(1)
-
 # ================================================== SSDL and ACE Constants (see Sddl.h):
 
 C_DELETE      				= 0x00010000
@@ -290,6 +296,10 @@ SDDL_TYPE = {
 	"ML": ("MANDATORY_LABEL",			"SYSTEM_MANDATORY_LABEL_ACE_TYPE",		0x11),			# Integrity label
 	"XA": ("CALLBACK_ACCESS_ALLOWED",	"ACCESS_ALLOWED_CALLBACK_ACE_TYPE",	0x09),			# Callback Access allowed
 	"XD": ("CALLBACK_ACCESS_DENIED",	"ACCESS_DENIED_CALLBACK_ACE_TYPE",		0x0A),			# Callback Access denied
+	"ZA": ("CALLBACK_OBJECT_ACCESS_ALLOWED",	"ACCESS_ALLOWED_CALLBACK_OBJECT_ACE_TYPE",	0x0B),	# Callback object access allowed
+	"XU": ("CALLBACK_AUDIT",			"SYSTEM_AUDIT_CALLBACK_ACE_TYPE",		0x0D),			# Callback audit
+	"RA": ("RESOURCE_ATTRIBUTE",		"SYSTEM_RESOURCE_ATTRIBUTE_ACE_TYPE",	0x12),			# Resource attribute
+	"SP": ("SCOPED_POLICY_ID",			"SYSTEM_SCOPED_POLICY_ID_ACE_TYPE",	0x13),			# Central access policy
 }
 
 SDDL_FLAGS = {
@@ -389,83 +399,560 @@ SDDL_SIDS = {	# Well known SIDs
 	"WD" : "EVERYONE",
 }
 
-# ================================================== Read and parse SDDL procedures:
+SDDL_SID_VALUES = {	# SID strings of the well known SIDs outside any domain
+	"AN" : "S-1-5-7",
+	"AO" : "S-1-5-32-548",
+	"AU" : "S-1-5-11",
+	"BA" : "S-1-5-32-544",
+	"BG" : "S-1-5-32-546",
+	"BO" : "S-1-5-32-551",
+	"BU" : "S-1-5-32-545",
+	"CD" : "S-1-5-32-574",
+	"CG" : "S-1-3-1",
+	"CO" : "S-1-3-0",
+	"ED" : "S-1-5-9",
+	"HI" : "S-1-16-12288",
+	"IU" : "S-1-5-4",
+	"LS" : "S-1-5-19",
+	"LW" : "S-1-16-4096",
+	"ME" : "S-1-16-8192",
+	"MU" : "S-1-5-32-558",
+	"NO" : "S-1-5-32-556",
+	"NS" : "S-1-5-20",
+	"NU" : "S-1-5-2",
+	"PO" : "S-1-5-32-550",
+	"PS" : "S-1-5-10",
+	"PU" : "S-1-5-32-547",
+	"RC" : "S-1-5-12",
+	"RD" : "S-1-5-32-555",
+	"RE" : "S-1-5-32-552",
+	"RS" : "S-1-5-32-553",
+	"RU" : "S-1-5-32-554",
+	"SI" : "S-1-16-16384",
+	"SO" : "S-1-5-32-549",
+	"SU" : "S-1-5-6",
+	"SY" : "S-1-5-18",
+	"WD" : "S-1-1-0",
+}
 
-def parse_sddl(sddl):
-	sddls = sddl.replace(')','').split('(')
-	for i in range(len(sddls)):
-		dl = sddls[i]
-		if i == 0:
-			dacl, flags = dl.split(':')
-			print("  {} :: ".format(dl), end='')
-			m = 0
-			if re.match('^P', flags):
-				print('SDDL_PROTECTED', end='')
-				flags = flags[1::]
-				m += 1
-			if re.match('AR', flags):
-				if m != 0: print(', ', end='')
-				m += 1
-				print('SDDL_AUTO_INHERIT_REQ', end='')
-			if re.match('AI', flags):
-				if m != 0: print(', ', end='')				
-				m += 1
-				print('SDDL_AUTO_INHERITED', end='')
-			if m != 0:
-				print()
+SDDL_DOMAIN_RIDS = {	# well known SIDs relative to a domain SID (S-1-5-21-x-y-z-<rid>)
+	"RO" : 498,
+	"LA" : 500,
+	"LG" : 501,
+	"DA" : 512,
+	"DU" : 513,
+	"DG" : 514,
+	"DC" : 515,
+	"DD" : 516,
+	"CA" : 517,
+	"SA" : 518,
+	"EA" : 519,
+	"PA" : 520,
+}
+
+# ================================================== Structured SDDL representation:
+
+SDDL_ACL_FLAGS = {
+	"P"  : ("PROTECTED",			"SE_DACL_PROTECTED",			0x1000),		# Protected from inheritance
+	"AR" : ("AUTO_INHERIT_REQ",	"SE_DACL_AUTO_INHERIT_REQ",	0x0100),		# Auto inherit request
+	"AI" : ("AUTO_INHERITED",		"SE_DACL_AUTO_INHERITED",		0x0400),		# Auto inherited
+}
+
+SDDL_NULL_ACL = "NO_ACCESS_CONTROL"
+
+class SDDLError(ValueError):
+	pass
+
+# Descriptors are plain tuples: cheap to build, hashable and picklable.
+# Types, flags and masks are kept as ints, SIDs and GUIDs are interned strings.
+# condition is the text of the 7th ACE field: the conditional expression of
+# callback ACEs (XA, XD, ZA, XU) or the attribute of RA ACEs, '' otherwise.
+
+Descriptor = namedtuple('Descriptor', 'owner group dacl sacl')
+Acl        = namedtuple('Acl',        'flags aces')				# aces is None for a NULL ACL
+Ace        = namedtuple('Ace',        'type flags mask object_guid inherit_object_guid sid condition', defaults=('',))
+
+ACE_TYPE_CODES = {k: v[2] for k, v in SDDL_TYPE.items()}
+ACE_TYPE_NAMES = {v[2]: k for k, v in SDDL_TYPE.items()}
+ACE_TYPE_ML    = SDDL_TYPE["ML"][2]
+
+_CACHE_LIMIT  = 4096
+_FLAGS_CACHE  = {'': 0}
+_RIGHTS_CACHE = {'': 0}
+_FLAGS_TEXT   = {}
+
+def ace_flags_value(flags):
+	value = _FLAGS_CACHE.get(flags)
+	if value is None:
+		value = 0
+		for i in range(0, len(flags), 2):
+			f = SDDL_FLAGS.get(flags[i:i+2])
+			if f is None:
+				raise SDDLError("Unknown ACE flags: {}".format(flags))
+			value |= f[2]
+		if len(_FLAGS_CACHE) < _CACHE_LIMIT:
+			_FLAGS_CACHE[flags] = value
+	return value
+
+def rights_to_mask(rights):
+	mask = _RIGHTS_CACHE.get(rights)
+	if mask is None:
+		try:
+			if rights[:2] in ('0x', '0X'):		# hexadecimal right notation
+				mask = int(rights, 16)
+			elif rights.isdigit():
+				mask = int(rights)
+			else:								# concatenated right abbreviations
+				mask = 0
+				for i in range(0, len(rights), 2):
+					mask |= SDDL_RIGHTS[rights[i:i+2]][2]
+		except (KeyError, ValueError):
+			raise SDDLError("Unknown access rights: {}".format(rights))
+		if len(_RIGHTS_CACHE) < _CACHE_LIMIT:
+			_RIGHTS_CACHE[rights] = mask
+	return mask
+
+def parse_ace(text):
+	f = text.split(';', 6)
+	if len(f) < 6 or len(f) == 7 and not (f[6].startswith('(') and f[6].endswith(')')):
+		raise SDDLError("Invalid ACE string: ({})".format(text))
+	atype = ACE_TYPE_CODES.get(f[0])
+	if atype is None:
+		raise SDDLError("Unknown ACE type: ({})".format(text))
+	if len(f) == 7:
+		return Ace(atype, ace_flags_value(f[1]), rights_to_mask(f[2]), intern(f[3]), intern(f[4]), intern(f[5]), f[6])
+	return Ace(atype, ace_flags_value(f[1]), rights_to_mask(f[2]), intern(f[3]), intern(f[4]), intern(f[5]))
+
+def _ace_end(sddl, k):
+	'''Index of the ')' closing the ACE opened at k, with nested parentheses
+	and quoted strings of conditional expressions.'''
+	e = sddl.find(')', k)
+	if e < 0 or sddl.find('(', k + 1, e) < 0:			# plain ACE
+		return e
+	depth, i, end = 0, k, len(sddl)
+	while i < end:
+		c = sddl[i]
+		if c == '"':
+			i = sddl.find('"', i + 1)
+			if i < 0:
+				return -1
+		elif c == '(':
+			depth += 1
+		elif c == ')':
+			depth -= 1
+			if depth == 0:
+				return i
+		i += 1
+	return -1
+
+def _parse_acl(sddl, pos, end):
+	k = sddl.find('(', pos)
+	if k < 0:
+		k = end
+	nxt = sddl.find(':', pos, k)				# ACL without ACEs followed by the next section
+	if nxt >= 0:
+		k = nxt - 1
+	text, flags = sddl[pos:k], 0
+	null = text.endswith(SDDL_NULL_ACL)
+	if null:
+		text = text[:-len(SDDL_NULL_ACL)]
+	while text:
+		for f in ('P', 'AR', 'AI'):
+			if text.startswith(f):
+				flags |= SDDL_ACL_FLAGS[f][2]
+				text = text[len(f):]
+				break
 		else:
-			type, flags, rights, guid, iguid, sid = dl.split(';')
-			print("  {:20}".format(dl))
-			if len(sid) > 0:
-				if sid in SDDL_SIDS: 
-					sidname = SDDL_SIDS[sid]
-				else:
-					sidname = '<<sid>>'
-				print('    {:30}'.format(sidname), end='')
-			print('{:25} '.format(SDDL_TYPE[type][0]), end='')
-			fl = ''
-			if len(flags) > 0:							# flags
-				for i in range(0, len(flags), 2):
-					if len(fl) > 0: fl += '|'
-					fl += SDDL_FLAGS[flags[i:i+2]][0]
-			print('{:35} '.format(fl), end='')			# flags
-			if len(rights) > 0:
-				if rights in SDDL_RIGHTS:		  	 	# standars right abbreviation
-					rs = SDDL_RIGHTS[rights][0]
-				elif re.match('0x[0-9A-F]',rights): 	# hexadecimal right notation 
-					toint = int(rights, 16)
-					rs = ''
-					for g in SDDL_CMPST_RIGHTS: 		# composite rights first
-						mask = SDDL_RIGHTS[g][2]
-						if (toint & mask) == mask:
-							toint -= mask
-							if len(rs) > 0:
-								rs += '|'
-							rs += SDDL_RIGHTS[g][0]
-					while toint > 0:					# then parse with bitmask
-						for r in SDDL_RIGHTS.values():
-							if (toint & r[2]) == r[2]:
-								toint -= r[2]
-								if len(rs) > 0:
-									rs += '|'
-								rs += r[0]
-				else:
-					rs = 'non standard'
-				print('{:16}'.format(rs), end='')
-			print()
+			raise SDDLError("Unknown ACL flags: {}".format(sddl[pos:k]))
+	aces = []
+	while k < end and sddl[k] == '(':
+		e = _ace_end(sddl, k)
+		if e < 0:
+			raise SDDLError("Unterminated ACE: {}".format(sddl[k:]))
+		aces.append(parse_ace(sddl[k+1:e]))
+		k = e + 1
+	if null and aces:
+		raise SDDLError("NULL ACL with ACEs: {}".format(sddl[pos:k]))
+	return Acl(flags, None if null else tuple(aces)), k
+
+def parse_descriptor(sddl):
+	if sddl[:1].isspace() or sddl[-1:].isspace():		# lines of files and cacls output
+		sddl = sddl.strip()
+	owner = group = dacl = sacl = None
+	end = len(sddl)
+	pos = 0
+	while pos < end:
+		tag = sddl[pos:pos+2]
+		pos += 2
+		if tag == 'O:' or tag == 'G:':
+			nxt = sddl.find(':', pos)
+			stop = end if nxt < 0 else nxt - 1
+			if tag == 'O:':
+				owner = intern(sddl[pos:stop])
+			else:
+				group = intern(sddl[pos:stop])
+			pos = stop
+		elif tag == 'D:':
+			dacl, pos = _parse_acl(sddl, pos, end)
+		elif tag == 'S:':
+			sacl, pos = _parse_acl(sddl, pos, end)
+		else:
+			raise SDDLError("Invalid SDDL section at {}: {}".format(pos - 2, sddl))
+	return Descriptor(owner, group, dacl, sacl)
+
+# ================================================== Back to SDDL strings:
 
-def show_file_sddl(filename): 
-	line  = os.popen("cacls %s /s" % filename).read().replace('"','').split()[1]
+_RIGHTS_ABBREV = {}
+_LABEL_ABBREV  = {}
+for k, v in SDDL_RIGHTS.items():
+	if k[0] == 'N':
+		_LABEL_ABBREV.setdefault(v[2], k)
+	else:
+		_RIGHTS_ABBREV.setdefault(v[2], k)
+
+_FLAGS_ORDER = sorted(SDDL_FLAGS.items(), key=lambda f: f[1][2])	# OI, CI, NP, IO, ID, SA, FA
+
+def flags_to_string(flags):
+	text = _FLAGS_TEXT.get(flags)
+	if text is None:
+		text = ''.join(k for k, v in _FLAGS_ORDER if flags & v[2])
+		_FLAGS_TEXT[flags] = text
+	return text
+
+def format_rights(mask, atype=None):
+	if mask == 0:
+		return ''
+	r = (_LABEL_ABBREV if atype == ACE_TYPE_ML else _RIGHTS_ABBREV).get(mask)
+	return r if r is not None else '0x{:x}'.format(mask)
+
+def acl_flags_to_string(acl):
+	text = ''.join(k for k, v in SDDL_ACL_FLAGS.items() if acl.flags & v[2])
+	return text + SDDL_NULL_ACL if acl.aces is None else text
+
+def ace_to_string(ace):
+	text = '{};{};{};{};{};{}'.format(ACE_TYPE_NAMES[ace.type], flags_to_string(ace.flags),
+		format_rights(ace.mask, ace.type), ace.object_guid, ace.inherit_object_guid, ace.sid)
+	return text + ';' + ace.condition if ace.condition else text
+
+def descriptor_to_string(sd):
+	parts = []
+	if sd.owner is not None:
+		parts.append('O:' + sd.owner)
+	if sd.group is not None:
+		parts.append('G:' + sd.group)
+	for tag, acl in (('D:', sd.dacl), ('S:', sd.sacl)):
+		if acl is not None:
+			parts.append(tag + acl_flags_to_string(acl))
+			for ace in acl.aces or ():
+				parts.append('(' + ace_to_string(ace) + ')')
+	return ''.join(parts)
+
+# ================================================== Access mask decoding:
+
+# Single bit rights of every namespace; composite rights (SDDL_CMPST_RIGHTS) are matched first.
+
+STANDARD_RIGHTS = [(SDDL_RIGHTS[k][0], SDDL_RIGHTS[k][2]) for k in ('SD', 'RC', 'WD', 'WO')]
+GENERIC_RIGHTS  = [(SDDL_RIGHTS[k][0], SDDL_RIGHTS[k][2]) for k in ('GA', 'GX', 'GW', 'GR')]
+
+FILE_RIGHTS = [
+	("READ_DATA",			C_FILE_READ_DATA),
+	("WRITE_DATA",			C_FILE_WRITE_DATA),
+	("APPEND_DATA",		C_FILE_APPEND_DATA),
+	("READ_EA",			C_FILE_READ_EA),
+	("WRITE_EA",			C_FILE_WRITE_EA),
+	("EXECUTE",			C_FILE_EXECUTE),
+	("DELETE_CHILD",		C_FILE_DELETE_CHILD),
+	("READ_ATTRIBUTES",	C_FILE_READ_ATTRIBUTES),
+	("WRITE_ATTRIBUTES",	C_FILE_WRITE_ATTRIBUTES),
+	("SYNCHRONIZE",		C_SYNCHRONIZE),
+] + STANDARD_RIGHTS + GENERIC_RIGHTS
+
+KEY_RIGHTS = [
+	("QUERY_VALUE",		C_KEY_QUERY_VALUE),
+	("SET_VALUE",			C_KEY_SET_VALUE),
+	("CREATE_SUB_KEY",		C_KEY_CREATE_SUB_KEY),
+	("ENUMERATE_SUB_KEYS",	C_KEY_ENUMERATE_SUB_KEYS),
+	("NOTIFY",				C_KEY_NOTIFY),
+	("CREATE_LINK",		C_KEY_CREATE_LINK),
+] + STANDARD_RIGHTS + GENERIC_RIGHTS
+
+DS_RIGHTS    = [(SDDL_RIGHTS[k][0], SDDL_RIGHTS[k][2]) for k in ('CC', 'DC', 'LC', 'SW', 'RP', 'WP', 'DT', 'LO', 'CR')] + STANDARD_RIGHTS + GENERIC_RIGHTS
+LABEL_RIGHTS = [(SDDL_RIGHTS[k][0], SDDL_RIGHTS[k][2]) for k in ('NR', 'NW', 'NX')]
+ANY_RIGHTS   = [(v[0], v[2]) for v in SDDL_RIGHTS.values()]		# legacy output: first name of each bit wins
+
+MASK_NAMESPACES = {
+	"any"      : (SDDL_CMPST_RIGHTS,			ANY_RIGHTS),
+	"file"     : (['FA', 'FR', 'FW', 'FX'],	FILE_RIGHTS),
+	"registry" : (['KA', 'KR', 'KW', 'KX'],	KEY_RIGHTS),
+	"ds"       : ([],							DS_RIGHTS),
+	"label"    : ([],							LABEL_RIGHTS),
+}
+
+MASK_CACHE_SIZE = 1024
+
+class MaskDecoder(object):
+	'''Per byte lookup tables over the single bit rights of one namespace.
+	decode(mask) returns (names, residual) where residual holds the unknown bits.'''
+
+	def __init__(self, composites, rights, cache_size=MASK_CACHE_SIZE):
+		self.composites = [(SDDL_RIGHTS[k][0], SDDL_RIGHTS[k][2]) for k in composites]
+		bits = {}
+		for name, mask in rights:
+			if mask and mask & (mask - 1) == 0:
+				bits.setdefault(mask, name)
+		self.tables = []
+		for shift in (0, 8, 16, 24):
+			table = []
+			for byte in range(256):
+				names, residual = [], 0
+				for i in range(8):
+					bit = (1 << i) & byte
+					if bit:
+						if (bit << shift) in bits:
+							names.append(bits[bit << shift])
+						else:
+							residual |= bit << shift
+				table.append((tuple(names), residual))
+			self.tables.append(table)
+		self.decode = lru_cache(maxsize=cache_size)(self._decode)
+
+	def _decode(self, mask):
+		names = []
+		for name, m in self.composites:			# composite rights first
+			if mask & m == m:
+				names.append(name)
+				mask &= ~m
+		t0, t1, t2, t3 = self.tables
+		n0, r0 = t0[mask & 0xFF]
+		n1, r1 = t1[mask >> 8 & 0xFF]
+		n2, r2 = t2[mask >> 16 & 0xFF]
+		n3, r3 = t3[mask >> 24 & 0xFF]
+		return tuple(names) + n0 + n1 + n2 + n3, r0 | r1 | r2 | r3 | (mask & ~0xFFFFFFFF)
+
+_MASK_DECODERS = {}
+
+def mask_decoder(namespace='any'):
+	decoder = _MASK_DECODERS.get(namespace)
+	if decoder is None:
+		if namespace not in MASK_NAMESPACES:
+			raise SDDLError("Unknown access mask namespace: {}".format(namespace))
+		decoder = _MASK_DECODERS[namespace] = MaskDecoder(*MASK_NAMESPACES[namespace])
+	return decoder
+
+def decode_mask(mask, namespace='any'):
+	return mask_decoder(namespace).decode(mask)
+
+# ================================================== Read and parse SDDL procedures:
+
+def sid_name(sid):
+	if sid in SDDL_SIDS:
+		return SDDL_SIDS[sid]
+	return '<<sid>>'
+
+def rights_names(mask, namespace='any'):
+	names, residual = mask_decoder(namespace).decode(mask)
+	if residual:
+		names += ('0x{:x}'.format(residual),)
+	return '|'.join(names)
+
+_FLAGS_NAMES = {}
+
+def flags_names(flags):
+	text = _FLAGS_NAMES.get(flags)
+	if text is None:
+		text = '|'.join(v[0] for k, v in _FLAGS_ORDER if flags & v[2])
+		_FLAGS_NAMES[flags] = text
+	return text
+
+_HUMAN_RENDERERS = {}							# (namespace, resolver) -> HumanRenderer
+
+def human_renderer(namespace='any', resolver=None):
+	'''The HumanRenderer of parse_sddl() and show_tree_sddl(), one per
+	namespace and resolver, so that repeated descriptors are decoded once.'''
+	global rendersddl
+	renderer = _HUMAN_RENDERERS.get((namespace, resolver))
+	if renderer is None:
+		if rendersddl is None:
+			import rendersddl
+		renderer = _HUMAN_RENDERERS[(namespace, resolver)] = rendersddl.HumanRenderer(namespace, resolver=resolver)
+	return renderer
+
+def parse_sddl(sddl, namespace='any', resolver=None):
+	renderer = human_renderer(namespace, resolver)
+	if profsddl.ENABLED:
+		with profsddl.stage('parse'):
+			sd = parse_descriptor(sddl)
+		with profsddl.stage('render'):
+			if resolver is not None and sddl not in renderer.cache:
+				resolver.prefetch((sd,))
+			sys.stdout.write(renderer.cached_body(sddl, sd))
+		return sd
+	sd = parse_descriptor(sddl)
+	if resolver is not None and sddl not in renderer.cache:
+		resolver.prefetch((sd,))
+	sys.stdout.write(renderer.cached_body(sddl, sd))
+	return sd
+
+def show_file_sddl(filename, namespace='any', source=None, resolver=None):
+	if source is None:
+		import sourcesddl
+		source = sourcesddl.CaclsSource()
+	with profsddl.stage('source'):
+		line  = source.get(filename)
 	print("{} :: {}".format(filename, line))
-	parse_sddl(line)
+	parse_sddl(line, namespace, resolver)
+
+def show_tree_sddl(root, namespace='any', source=None, resolver=None):
+	if source is None:
+		import sourcesddl
+		source = sourcesddl.CaclsSource()
+	render = human_renderer(namespace, resolver).format
+	write = sys.stdout.write
+	parse = parse_descriptor
+	if profsddl.ENABLED:
+		def parse(line):
+			with profsddl.stage('parse'):
+				return parse_descriptor(line)
+	for filename, line in profsddl.timed('source', source.walk(root)):
+		try:
+			write(render(filename, line, parse(line)))
+		except SDDLError as e:
+			write("{} :: {}\nERROR: {}\n".format(filename, line, e))
 
 # ================================================== MAIN PROGRAM
 
-if case == 1:
-	show_file_sddl(filename)
-elif case == 2:
-	print("+++ Parse SDDL: {}".format(sddl))
-	parse_sddl(sddl)
-else:
-	print("Something wrong.")
+def main(argv):
+	ap = argparse.ArgumentParser(add_help=False)
+	ap.add_argument('param', nargs='?')
+	ap.add_argument('-h', '--help', action='store_true')
+	ap.add_argument('--bulk')
+	ap.add_argument('--format', choices=['jsonl', 'tsv', 'csv', 'human'], default='jsonl')
+	ap.add_argument('--quiet', action='store_true')
+	ap.add_argument('--namespace', choices=list(MASK_NAMESPACES), default='any')
+	ap.add_argument('--workers', type=int, default=1)
+	ap.add_argument('--chunk-size', type=int, default=16)
+	ap.add_argument('--cache-size', type=int, default=4096)
+	ap.add_argument('--cache-file')
+	ap.add_argument('--tree', action='store_true')
+	ap.add_argument('--source', choices=['cacls', 'win32'], default='cacls')
+	ap.add_argument('--dump')
+	ap.add_argument('--input', choices=['dump', 'ldif', 'reg', 'regini'], default='dump')
+	ap.add_argument('--threads', type=int, default=8)
+	ap.add_argument('--snapshot')
+	ap.add_argument('--against')
+	ap.add_argument('--resolve')
+	ap.add_argument('--sid-cache')
+	ap.add_argument('--profile')
+	args = ap.parse_args(argv[1:])
+	if args.help:
+		Usage()
 
+	if args.profile:
+		profsddl.enable(args.profile)
+	else:
+		profsddl.enable_from_env()
+
+	if args.resolve and args.snapshot:
+		ap.error("--resolve cannot be combined with --snapshot")
+
+	resolver = None
+	if args.resolve:
+		import sidsddl
+		try:
+			resolver = sidsddl.open_resolver(args.resolve, args.sid_cache, threads=args.threads)
+		except ImportError as e:
+			print("ERROR: {} (pywin32 is required for --resolve win32)".format(e))
+			sys.exit(1)
+		except (IOError, sidsddl.sqlite3.Error) as e:
+			print("ERROR: Cannot open SID names: {}".format(e))
+			sys.exit(1)
+
+	if args.snapshot and (args.bulk or args.tree):
+		import snapsddl, sourcesddl, streamsddl
+		try:
+			if args.bulk:
+				if args.input == 'dump':
+					records = streamsddl.read_records(streamsddl.iter_lines(args.bulk), streamsddl.Stats())
+				else:
+					import ingestsddl
+					records = ingestsddl.read_source(args.bulk, args.input)
+				records = ((path, sddl) for lineno, path, sddl in records)
+			else:
+				records = sourcesddl.open_source(args.source, args.dump, args.threads).walk(args.param)
+			print(snapsddl.run(records, args.snapshot, args.against, sys.stdout, args.namespace), file=sys.stderr)
+		except ImportError as e:
+			print("ERROR: {} (pywin32 is required for --source win32)".format(e))
+			sys.exit(1)
+		except (IOError, SDDLError) as e:
+			print("ERROR: {}".format(e))
+			sys.exit(1)
+		return
+
+	if args.bulk:
+		import streamsddl, cachesddl
+		if args.quiet:
+			args.format = 'none'
+		cache = None
+		if args.cache_size > 0:
+			cache = cachesddl.DescriptorCache(args.cache_size, args.cache_file)
+		try:
+			if args.workers != 1 and args.bulk != '-' and resolver is None and args.input == 'dump':
+				stats = streamsddl.run_parallel(args.bulk, sys.stdout, args.format, args.namespace,
+					workers=args.workers, chunk_size=args.chunk_size << 20, cache=cache)
+			else:
+				stats = streamsddl.run(args.bulk, sys.stdout, args.format, args.namespace, cache=cache, resolver=resolver,
+					input=args.input if args.input != 'dump' else None)
+		except IOError as e:
+			print("ERROR: Cannot read dump: ", e, file=sys.stderr)
+			sys.exit(1)
+		if cache is not None and args.cache_file:
+			cache.save()
+		if resolver is not None:
+			resolver.close()
+		print(stats.summary(), file=sys.stderr)
+		return
+
+	param = args.param
+	if param is None:
+		if 'debug' in dict(globals()):
+			if debug == 1:
+				param = 'README.md'
+			elif debug == 2:
+				param = '/S:D:AI(A;ID;0x1301bf;;;AU)(A;ID;FA;;;SY)(A;ID;FA;;;BA)(A;ID;0x1301bf;;;BU)'
+		else:
+			Usage()
+
+	m = re.search('^/[sS]:(.+?)$', param)
+	if m:
+		sddl = m.group(1)
+		print("+++ Parse SDDL: {}".format(sddl))
+		try:
+			parse_sddl(sddl, args.namespace, resolver)
+		except SDDLError as e:
+			print("ERROR: {}".format(e))
+			sys.exit(1)
+	else:
+		import sourcesddl
+		filename = param
+		if args.dump is None and not os.path.exists(filename):	# Check if file exists
+			print("ERROR: Cannot open file: ", filename)
+			print("Terminated!")
+			sys.exit(1)
+		try:
+			source = sourcesddl.open_source(args.source, args.dump, args.threads)
+			if args.tree:
+				show_tree_sddl(filename, args.namespace, source, resolver)
+			else:
+				show_file_sddl(filename, args.namespace, source, resolver)
+		except ImportError as e:
+			print("ERROR: {} (pywin32 is required for --source win32)".format(e))
+			sys.exit(1)
+		except (IOError, SDDLError) as e:
+			print("ERROR: {}".format(e))
+			sys.exit(1)
+	if resolver is not None:
+		resolver.close()
+
+if __name__ == '__main__':
+	import readsddl							# the module the other *sddl modules import, with the same SDDLError
+	readsddl.main(sys.argv)
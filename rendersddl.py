@@ -0,0 +1,299 @@
+﻿#-*- coding: utf-8 -*-
+'''Output formats for parsed descriptors, separate from parsing.
+
+	human   the readsddl table ('path :: SDDL' then one block per ACE)
+	jsonl   one JSON object per descriptor
+	csv     one row per ACE, with a header
+	tsv     one tab separated row per ACE, with a header
+	none    nothing, for summary-only runs (--quiet)
+
+A renderer formats one (path, SDDL, Descriptor) record into a string. The
+part that does not depend on the path is formatted once per distinct SDDL
+string and cached, format strings are bound once, and write_records() joins
+the records into writes of BUFFER_SIZE characters instead of one print()
+per field.
+
+With a SID resolver (see sidsddl.py) SIDs missing from the well known table
+get account names; write_records() resolves the SIDs of RESOLVE_BATCH records
+at a time, each distinct SID once.'''
+
+import json
+from itertools import islice
+
+import readsddl as rs
+import guidsddl, profsddl
+
+BUFFER_SIZE = 1 << 20
+CACHE_SIZE  = 4096
+RESOLVE_BATCH = 65536
+
+COLUMNS = ('path', 'acl', 'type', 'flags', 'mask', 'rights', 'sid', 'sid_name', 'object_guid', 'inherit_object_guid')
+
+# ================================================== Human readable table:
+
+_OWNER_LINE  = "  O:{} :: {}\n".format
+_GROUP_LINE  = "  G:{} :: {}\n".format
+_ACL_LINE    = "  {}:{} :: {}\n".format
+_ACE_LINE    = "  {:20}\n".format
+_SID_FIELD   = '    {:30}'.format
+_TYPE_FIELDS = '{:25} {:35} '.format
+_RIGHTS_FIELD = '{:16}'.format
+_GUID_FIELD  = ' {}:{}'.format
+
+_ACE_TEXT = {}							# (Ace, namespace) -> lines, well known SID names only
+
+def _format_ace(ace, namespace, sid_name):
+	parts = [_ACE_LINE(rs.ace_to_string(ace))]
+	if len(ace.sid) > 0:
+		parts.append(_SID_FIELD(sid_name(ace.sid)))
+	parts.append(_TYPE_FIELDS(rs.SDDL_TYPE[rs.ACE_TYPE_NAMES[ace.type]][0], rs.flags_names(ace.flags)))
+	if ace.mask:
+		parts.append(_RIGHTS_FIELD(rs.rights_names(ace.mask, 'label' if ace.type == rs.ACE_TYPE_ML else namespace)))
+	if ace.object_guid or ace.inherit_object_guid:
+		parts.extend(_guid_fields(ace))
+	parts.append('\n')
+	return ''.join(parts)
+
+def format_acl(tag, acl, namespace='any', sid_name=rs.sid_name):
+	names = ['SDDL_' + v[0] for v in rs.SDDL_ACL_FLAGS.values() if acl.flags & v[2]]
+	if acl.aces is None:
+		names.append('SSDL_NULL_ACL')
+	parts = [_ACL_LINE(tag, rs.acl_flags_to_string(acl), ', '.join(names))]
+	if sid_name is not rs.sid_name:				# resolved names: not cached
+		parts.extend(_format_ace(ace, namespace, sid_name) for ace in acl.aces or ())
+		return ''.join(parts)
+	cache = _ACE_TEXT
+	for ace in acl.aces or ():					# distinct descriptors mostly share their ACEs
+		text = cache.get((ace, namespace))
+		if text is None:
+			text = _format_ace(ace, namespace, sid_name)
+			if len(cache) >= rs._CACHE_LIMIT:
+				cache.clear()
+			cache[(ace, namespace)] = text
+		parts.append(text)
+	return ''.join(parts)
+
+def _guid_fields(ace):
+	'''OBJECT:name and INHERIT:name of an object ACE, for the GUIDs with a known name.'''
+	for tag, guid in (('OBJECT', ace.object_guid), ('INHERIT', ace.inherit_object_guid)):
+		name = guid and guidsddl.guid_name(guid)
+		if name:
+			yield _GUID_FIELD(tag, name)
+
+def format_descriptor(sd, namespace='any', sid_name=rs.sid_name):
+	parts = []
+	if sd.owner is not None:
+		parts.append(_OWNER_LINE(sd.owner, sid_name(sd.owner)))
+	if sd.group is not None:
+		parts.append(_GROUP_LINE(sd.group, sid_name(sd.group)))
+	if sd.dacl is not None:
+		parts.append(format_acl('D', sd.dacl, namespace, sid_name))
+	if sd.sacl is not None:
+		parts.append(format_acl('S', sd.sacl, namespace, sid_name))
+	return ''.join(parts)
+
+# ================================================== Renderers:
+
+def resolved_name(resolver):
+	'''sid_name() for format_descriptor(): well known names, then the resolver.'''
+	def sid_name(sid):
+		return rs.SDDL_SIDS.get(sid) or resolver.name(sid) or '<<sid>>'
+	return sid_name
+
+class Renderer(object):
+	header = ''
+	uses_names = True
+
+	def __init__(self, namespace='any', cache_size=CACHE_SIZE, resolver=None):
+		self.namespace = namespace
+		self.cache_size = cache_size
+		self.cache = {}							# SDDL -> body
+		self.resolver = resolver
+
+	def sid_name(self, sid):
+		name = rs.SDDL_SIDS.get(sid)
+		if name is None and self.resolver is not None:
+			name = self.resolver.name(sid)
+		return name
+
+	def prefetched(self, records, batch=RESOLVE_BATCH):
+		'''Pass records through, resolving the SIDs of the descriptors not
+		rendered yet once per batch of records.'''
+		records = iter(records)
+		cache = self.cache
+		while True:
+			chunk = list(islice(records, batch))
+			if not chunk:
+				return
+			self.resolver.prefetch(sd for path, sddl, sd in chunk if sddl not in cache)
+			yield from chunk
+
+	def body(self, sd):
+		raise NotImplementedError
+
+	def cached_body(self, sddl, sd):
+		body = self.cache.get(sddl)
+		if body is None:
+			with profsddl.stage('decode'):
+				body = self.body(sd)
+			if len(self.cache) >= self.cache_size:
+				self.cache.clear()
+			self.cache[sddl] = body
+		return body
+
+	def format(self, path, sddl, sd):
+		raise NotImplementedError
+
+class HumanRenderer(Renderer):
+	_head = "{} :: {}\n".format
+
+	def body(self, sd):
+		if self.resolver is None:
+			return format_descriptor(sd, self.namespace)
+		return format_descriptor(sd, self.namespace, resolved_name(self.resolver))
+
+	def format(self, path, sddl, sd):
+		return self._head(path, sddl) + self.cached_body(sddl, sd)
+
+def acl_to_dict(acl, namespace, sid_name=rs.SDDL_SIDS.get):
+	if acl is None:
+		return None
+	aces = None
+	if acl.aces is not None:
+		aces = []
+		for ace in acl.aces:
+			names, residual = rs.decode_mask(ace.mask, 'label' if ace.type == rs.ACE_TYPE_ML else namespace)
+			item = {
+				"type"                : rs.ACE_TYPE_NAMES[ace.type],
+				"flags"               : rs.flags_to_string(ace.flags),
+				"mask"                : ace.mask,
+				"rights"              : names,
+				"residual"            : residual,
+				"object_guid"         : ace.object_guid,
+				"inherit_object_guid" : ace.inherit_object_guid,
+				"sid"                 : ace.sid,
+				"sid_name"            : sid_name(ace.sid),
+			}
+			if ace.condition:
+				item["condition"] = ace.condition
+			if ace.object_guid or ace.inherit_object_guid:
+				for key, guid in (("object_name", ace.object_guid), ("inherit_object_name", ace.inherit_object_guid)):
+					name = guid and guidsddl.guid_name(guid)
+					if name:
+						item[key] = name
+			aces.append(item)
+	return {"flags": rs.acl_flags_to_string(acl), "aces": aces}
+
+class JsonlRenderer(Renderer):
+	_encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+	def body(self, sd):
+		return self._encode({
+			"owner" : sd.owner,
+			"group" : sd.group,
+			"dacl"  : acl_to_dict(sd.dacl, self.namespace, self.sid_name),
+			"sacl"  : acl_to_dict(sd.sacl, self.namespace, self.sid_name),
+		})[1:] + '\n'
+
+	def format(self, path, sddl, sd):
+		encode = self._encode
+		return '{"path":' + encode(path) + ',"sddl":' + encode(sddl) + ',' + self.cached_body(sddl, sd)
+
+class TsvRenderer(Renderer):
+	header = '\t'.join(COLUMNS) + '\n'
+	_row = '\t{}\t{}\t{}\t0x{:08x}\t{}\t{}\t{}\t{}\t{}\n'.format
+
+	def fields(self, sd):
+		for tag, acl in (('D', sd.dacl), ('S', sd.sacl)):
+			if acl is None or not acl.aces:
+				continue
+			for ace in acl.aces:
+				yield (tag, rs.ACE_TYPE_NAMES[ace.type], rs.flags_to_string(ace.flags), ace.mask,
+					rs.rights_names(ace.mask, 'label' if ace.type == rs.ACE_TYPE_ML else self.namespace),
+					ace.sid, self.sid_name(ace.sid) or '', ace.object_guid, ace.inherit_object_guid)
+
+	def body(self, sd):
+		return tuple(self._row(*f) for f in self.fields(sd))
+
+	def path(self, path):
+		return path.replace('\t', ' ')
+
+	def format(self, path, sddl, sd):
+		rows = self.cached_body(sddl, sd)
+		if len(rows) == 1:
+			return self.path(path) + rows[0]
+		path = self.path(path)
+		return ''.join([path + row for row in rows])
+
+def _csv(value):
+	value = str(value)
+	if any(c in value for c in ',"\r\n'):
+		return '"' + value.replace('"', '""') + '"'
+	return value
+
+class CsvRenderer(TsvRenderer):
+	header = ','.join(COLUMNS) + '\r\n'
+	_row = ',{},{},{},0x{:08x},{},{},{},{},{}\r\n'.format
+
+	def body(self, sd):
+		return tuple(self._row(*[_csv(v) if isinstance(v, str) else v for v in f]) for f in self.fields(sd))
+
+	def path(self, path):
+		return _csv(path)
+
+class NullRenderer(Renderer):
+	uses_names = False
+
+	def format(self, path, sddl, sd):
+		return ''
+
+FORMATS = {
+	"human" : HumanRenderer,
+	"jsonl" : JsonlRenderer,
+	"csv"   : CsvRenderer,
+	"tsv"   : TsvRenderer,
+	"none"  : NullRenderer,
+}
+
+# ================================================== Output:
+
+def renderer(fmt='jsonl', namespace='any', resolver=None):
+	try:
+		return FORMATS[fmt](namespace, resolver=resolver)
+	except KeyError:
+		raise rs.SDDLError("Unknown output format: {}".format(fmt))
+
+def render(records, fmt='jsonl', namespace='any', header=True, resolver=None):
+	'''Text of (path, sddl, Descriptor) records as one string.'''
+	r = renderer(fmt, namespace, resolver)
+	if resolver is not None and r.uses_names:
+		records = r.prefetched(records)
+	text = ''.join([r.format(path, sddl, sd) for path, sddl, sd in records])
+	return r.header + text if header else text
+
+def _timed_write(write):
+	def timed_write(text):
+		with profsddl.stage('write'):
+			write(text)
+	return timed_write
+
+def write_records(records, out, fmt='jsonl', namespace='any', header=True, buffer_size=BUFFER_SIZE, resolver=None):
+	'''Render (path, sddl, Descriptor) records to out in writes of about buffer_size characters.'''
+	r = renderer(fmt, namespace, resolver)
+	if resolver is not None and r.uses_names:
+		records = r.prefetched(records)
+	fmt_record = r.format
+	write = out.write if not profsddl.ENABLED else _timed_write(out.write)
+	parts, size = [], 0
+	if header and r.header:
+		parts.append(r.header)
+	with profsddl.stage('render'):
+		for path, sddl, sd in records:
+			text = fmt_record(path, sddl, sd)
+			parts.append(text)
+			size += len(text)
+			if size >= buffer_size:
+				write(''.join(parts))
+				parts, size = [], 0
+		if parts:
+			write(''.join(parts))
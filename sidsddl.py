@@ -0,0 +1,299 @@
+﻿#-*- coding: utf-8 -*-
+'''Usage:
+	python sidsddl.py <mapping file | SQLite db | win32> [--cache F] [--ttl HOURS] [--dump F | <SID> ...]
+
+Account names of the SIDs missing from readsddl.SDDL_SIDS (domain users and
+groups, S-1-5-21-...), which are otherwise shown as <<sid>>.
+
+	MappingBackend  a mapping file of SID<TAB>name or SID,name lines (an export
+	                of Get-ADObject, for example) or an SQLite database with a
+	                sids(sid, name) table; works offline on any OS
+	Win32Backend    LookupAccountSid (Windows, pywin32)
+
+SidResolver deduplicates the SIDs of a whole batch, answers well known SIDs
+from the tables and the others from its cache, and hands only the rest to the
+backend, LookupAccountSid calls running on a bounded thread pool. SidCache is
+an LRU of the answers (unknown SIDs included) with a time to live, saved to a
+file, so a later run does not look them up again either: a report over
+millions of ACEs makes at most one lookup per distinct SID.
+
+The command line prints SID<TAB>name for the SIDs given or for every distinct
+SID of a dump, which is also the format of a mapping file.'''
+
+import os, sys, time, pickle, sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import readsddl as rs
+import canonsddl
+
+THREADS       = 8
+CACHE_SIZE    = 65536
+CACHE_TTL     = 24 * 3600
+CACHE_VERSION = 1
+SQL_BATCH     = 500
+
+# ================================================== Backends:
+
+class SidBackend(object):
+	threads = THREADS
+
+	def lookup(self, sid):
+		'''Account name of sid, None if the SID is unknown.'''
+		raise NotImplementedError
+
+	def lookup_many(self, sids):
+		'''{sid: name or None} of the SIDs that could be looked up; failed lookups
+		are left out, so that they are not cached.'''
+		def get(sid):
+			try:
+				return sid, self.lookup(sid), True
+			except Exception:					# pywintypes.error, sqlite3.Error ...
+				return sid, None, False
+		if self.threads <= 1 or len(sids) <= 1:
+			results = map(get, sids)
+		else:
+			pool = ThreadPoolExecutor(min(self.threads, len(sids)))
+			results = pool.map(get, sids)
+			pool.shutdown()
+		return {sid: name for sid, name, ok in results if ok}
+
+class MappingBackend(SidBackend):
+	threads = 1
+
+	def __init__(self, path):
+		self.path = path
+		self.db = None
+		self.names = {}
+		with open(path, 'rb') as f:
+			sqlite = f.read(16) == b'SQLite format 3\x00'
+		if sqlite:
+			self.db = sqlite3.connect(path)
+		else:
+			self._load(path)
+
+	def _load(self, path):
+		import csv
+		with open(path, encoding='utf-8-sig') as f:
+			for line in f:
+				line = line.rstrip('\r\n')
+				if '\t' in line:
+					row = line.split('\t')
+				else:
+					row = next(csv.reader([line]), [])
+				if len(row) >= 2 and row[0].upper().startswith('S-'):	# header lines are skipped
+					self.names[row[0].upper()] = row[1]
+
+	def lookup(self, sid):
+		return self.lookup_many([sid]).get(sid)
+
+	def lookup_many(self, sids):
+		if self.db is None:
+			return {sid: self.names.get(sid.upper()) for sid in sids}
+		found = dict.fromkeys(sids)
+		sids = list(sids)
+		for i in range(0, len(sids), SQL_BATCH):
+			batch = sids[i:i + SQL_BATCH]
+			found.update(self.db.execute('SELECT sid, name FROM sids WHERE sid IN ({})'.format(
+				','.join('?' * len(batch))), batch))
+		return found
+
+class Win32Backend(SidBackend):
+	def __init__(self, threads=THREADS, server=None):
+		import win32security, pywintypes			# needs pywin32
+		self.win32security = win32security
+		self.error = pywintypes.error
+		self.threads = threads
+		self.server = server
+
+	def lookup(self, sid):
+		ws = self.win32security
+		try:
+			name, domain, kind = ws.LookupAccountSid(self.server, ws.ConvertStringSidToSid(sid))
+		except self.error as e:
+			if e.winerror == 1332:					# ERROR_NONE_MAPPED
+				return None
+			raise
+		return '{}\\{}'.format(domain, name) if domain else name
+
+def open_backend(spec, threads=THREADS):
+	if spec == 'win32':
+		return Win32Backend(threads)
+	return MappingBackend(spec)
+
+# ================================================== Cache:
+
+class SidCache(object):
+	'''LRU of SID -> name (None for unknown SIDs) whose entries expire after ttl seconds.'''
+
+	def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL, path=None):
+		self.maxsize   = maxsize
+		self.ttl       = ttl
+		self.path      = path
+		self.entries   = OrderedDict()				# sid -> (name, expiry time)
+		self.hits      = 0
+		self.misses    = 0
+		self.expired   = 0
+		if path and os.path.exists(path):
+			self.load(path)
+
+	def __len__(self):
+		return len(self.entries)
+
+	def get(self, sid):
+		'''(True, name) for a live entry, (False, None) otherwise.'''
+		entry = self.entries.get(sid)
+		if entry is not None:
+			if entry[1] > time.time():
+				self.hits += 1
+				self.entries.move_to_end(sid)
+				return True, entry[0]
+			del self.entries[sid]
+			self.expired += 1
+		self.misses += 1
+		return False, None
+
+	def put(self, sid, name):
+		self.entries[sid] = (name, time.time() + self.ttl)
+		self.entries.move_to_end(sid)
+		if len(self.entries) > self.maxsize:
+			self.entries.popitem(last=False)
+
+	def counters(self):
+		return {
+			"hits"    : self.hits,
+			"misses"  : self.misses,
+			"expired" : self.expired,
+			"size"    : len(self.entries),
+		}
+
+	def load(self, path):
+		try:
+			with open(path, 'rb') as f:
+				version, items = pickle.load(f)
+		except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+			return False
+		if version != CACHE_VERSION:
+			return False
+		now = time.time()
+		for sid, entry in items[-self.maxsize:]:
+			if entry[1] > now:
+				self.entries[sid] = entry
+		return True
+
+	def save(self, path=None):
+		path = path or self.path
+		tmp = path + '.tmp'
+		with open(tmp, 'wb') as f:
+			pickle.dump((CACHE_VERSION, list(self.entries.items())), f, pickle.HIGHEST_PROTOCOL)
+		os.replace(tmp, path)
+
+# ================================================== Resolver:
+
+def _well_known(sid):
+	return rs.SDDL_SIDS.get(canonsddl._sid(sid))
+
+def descriptor_sids(sd):
+	if sd.owner:
+		yield sd.owner
+	if sd.group:
+		yield sd.group
+	for acl in (sd.dacl, sd.sacl):
+		if acl is not None and acl.aces:
+			for ace in acl.aces:
+				yield ace.sid
+
+class SidResolver(object):
+	def __init__(self, backend, cache=None):
+		self.backend = backend
+		self.cache   = cache if cache is not None else SidCache()
+		self.names   = {}							# answers of this run
+		self.lookups = 0
+
+	def resolve_many(self, sids):
+		'''{sid: name or None} for sids; only SIDs neither well known, nor seen in
+		this run, nor cached are passed to the backend, each of them once.'''
+		names, cache = self.names, self.cache
+		sids = set(sids)
+		todo = []
+		for sid in sids:
+			if sid in names:
+				continue
+			name = _well_known(sid)
+			if name is not None or not sid.upper().startswith('S-'):
+				names[sid] = name
+				continue
+			found, name = cache.get(sid)
+			if found:
+				names[sid] = name
+			else:
+				todo.append(sid)
+		if todo:
+			self.lookups += len(todo)
+			found = self.backend.lookup_many(todo)
+			for sid in todo:
+				name = names[sid] = found.get(sid)
+				if sid in found:
+					cache.put(sid, name)
+		return {sid: names[sid] for sid in sids}
+
+	def prefetch(self, descriptors):
+		'''Resolve every SID of the descriptors in one batch.'''
+		sids = set()
+		for sd in descriptors:
+			sids.update(descriptor_sids(sd))
+		self.resolve_many(sids)
+
+	def name(self, sid):
+		try:
+			return self.names[sid]
+		except KeyError:
+			return self.resolve_many((sid,))[sid]
+
+	def close(self):
+		if self.cache.path:
+			self.cache.save()
+
+def open_resolver(spec, cache_file=None, ttl=CACHE_TTL, threads=THREADS):
+	return SidResolver(open_backend(spec, threads), SidCache(CACHE_SIZE, ttl, cache_file))
+
+# ================================================== MAIN PROGRAM
+
+def main(argv):
+	import argparse, streamsddl
+	ap = argparse.ArgumentParser(add_help=False)
+	ap.add_argument('backend', nargs='?')
+	ap.add_argument('sids', nargs='*')
+	ap.add_argument('--cache')
+	ap.add_argument('--ttl', type=float, default=CACHE_TTL / 3600)
+	ap.add_argument('--dump')
+	ap.add_argument('--threads', type=int, default=THREADS)
+	args = ap.parse_args(argv[1:])
+	if args.backend is None or not (args.sids or args.dump):
+		print(__doc__)
+		sys.exit(0)
+	try:
+		resolver = open_resolver(args.backend, args.cache, args.ttl * 3600, args.threads)
+		if args.dump:
+			stats = streamsddl.Stats()
+			sids = set()
+			for path, sddl, sd in streamsddl.parse_records(streamsddl.read_records(streamsddl.iter_lines(args.dump), stats), stats):
+				sids.update(descriptor_sids(sd))
+		else:
+			sids = [sid.upper() for sid in args.sids]
+		names = resolver.resolve_many(sids)
+		write = sys.stdout.write
+		for sid in sorted(names):
+			if sid.upper().startswith('S-'):
+				write('{}\t{}\n'.format(sid, names[sid] if names[sid] is not None else ''))
+		resolver.close()
+	except ImportError as e:
+		print("ERROR: {} (pywin32 is required for win32)".format(e), file=sys.stderr)
+		sys.exit(1)
+	except (IOError, sqlite3.Error) as e:
+		print("ERROR: {}".format(e), file=sys.stderr)
+		sys.exit(1)
+	print("{} SIDs, {} lookups".format(len(names), resolver.lookups), file=sys.stderr)
+
+if __name__ == '__main__':
+	main(sys.argv)
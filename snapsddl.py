@@ -0,0 +1,242 @@
+﻿#-*- coding: utf-8 -*-
+'''Usage:
+	python snapsddl.py --save <snapshot> <dumpfile|->
+	python snapsddl.py [--namespace NS] <old snapshot> <new snapshot>
+
+Snapshots for ACL drift detection. A snapshot holds one (path, digest) line
+per path, sorted by path, after a section with the SDDL string of every
+distinct digest. The digest is a BLAKE2b of the raw SDDL text, so saving a
+snapshot parses nothing; paths are sorted with an external merge sort (runs
+of RUN_SIZE lines spilled to temporary files) and any number of paths is
+written in bounded memory. A '.gz' file name compresses the snapshot.
+
+Two snapshots are compared with a sorted merge of their path sections, one
+JSON Lines drift record is printed per added, removed or changed path; only
+the descriptors of changed paths are parsed, and a change that is not a
+semantic one (canonsddl) is not reported:
+
+	{"path": ..., "status": "added", "sddl": ...}
+	{"path": ..., "status": "changed", "owner": [old, new], "dacl": {"added": [...], "removed": [...]}}
+
+'readsddl.py --bulk <dump> --snapshot new.snap --against old.snap' saves and
+compares in one run.'''
+
+import os, sys, gzip, heapq, hashlib, tempfile
+from json import dumps
+
+import readsddl as rs
+import canonsddl
+
+RUN_SIZE   = 1000000					# (path, digest) lines sorted in memory per run
+DIFF_CACHE = 4096
+MAGIC      = 'SDDLSNAP'
+VERSION    = 1
+
+def raw_digest(sddl):
+	return hashlib.blake2b(sddl.encode('utf-8', 'replace'), digest_size=16).hexdigest()
+
+def _open(path, mode='r', name=None):
+	if (name or path).endswith('.gz'):
+		return gzip.open(path, mode + 't', encoding='utf-8')
+	return open(path, mode, encoding='utf-8')
+
+# ================================================== Writing:
+
+class SnapshotWriter(object):
+	def __init__(self, path, run_size=RUN_SIZE):
+		self.path = path
+		self.run_size = run_size
+		self.descriptors = {}					# digest -> SDDL
+		self.digests = {}						# SDDL -> digest, bounded
+		self.lines = []						# (path, sequence number, digest)
+		self.runs = []
+		self.seq = 0
+
+	def add(self, path, sddl):
+		digest = self.digests.get(sddl)
+		if digest is None:
+			digest = raw_digest(sddl)
+			if len(self.digests) >= rs._CACHE_LIMIT:
+				self.digests.clear()
+			self.digests[sddl] = digest
+			self.descriptors.setdefault(digest, sddl)
+		self.seq += 1
+		self.lines.append((path, self.seq, digest))
+		if len(self.lines) >= self.run_size:
+			self._spill()
+
+	def _spill(self):
+		self.lines.sort()
+		f = tempfile.TemporaryFile('w+', encoding='utf-8')
+		f.writelines('{}\t{}\t{}\n'.format(*rec) for rec in self.lines)
+		f.seek(0)
+		self.runs.append(f)
+		self.lines = []
+
+	@staticmethod
+	def _read_run(f):
+		for line in f:
+			path, seq, digest = line[:-1].rsplit('\t', 2)
+			yield path, int(seq), digest
+
+	def close(self):
+		self.lines.sort()
+		streams = [self._read_run(f) for f in self.runs] + [iter(self.lines)]
+		tmp = self.path + '.tmp'
+		count = 0
+		try:
+			with _open(tmp, 'w', self.path) as out:
+				out.write('{}\t{}\t{}\n'.format(MAGIC, VERSION, len(self.descriptors)))
+				out.writelines('{}\t{}\n'.format(d, s) for d, s in self.descriptors.items())
+				pending = None
+				for rec in heapq.merge(*streams):		# equal paths come in recording order: the last one wins
+					if pending is not None and rec[0] != pending[0]:
+						out.write('{}\t{}\n'.format(pending[0], pending[2]))
+						count += 1
+					pending = rec
+				if pending is not None:
+					out.write('{}\t{}\n'.format(pending[0], pending[2]))
+					count += 1
+			os.replace(tmp, self.path)
+		finally:
+			for f in self.runs:
+				f.close()
+			if os.path.exists(tmp):
+				os.remove(tmp)
+		return count
+
+def save_snapshot(path, records, run_size=RUN_SIZE):
+	'''Write a snapshot of (path, sddl) records, return the number of paths.'''
+	writer = SnapshotWriter(path, run_size)
+	for p, sddl in records:
+		writer.add(p, sddl)
+	return writer.close()
+
+# ================================================== Reading and comparing:
+
+class Snapshot(object):
+	'''Descriptor section loaded at open, path section streamed by iteration.'''
+
+	def __init__(self, path):
+		self.path = path
+		self.descriptors = {}
+		with _open(path) as f:
+			head = f.readline().rstrip('\n').split('\t')
+			if len(head) != 3 or head[0] != MAGIC:
+				raise rs.SDDLError("Not a snapshot: {}".format(path))
+			if head[1] != str(VERSION):
+				raise rs.SDDLError("Unsupported snapshot version {}".format(head[1]))
+			self.count = int(head[2])
+			for i in range(self.count):
+				digest, sddl = f.readline().rstrip('\n').split('\t', 1)
+				self.descriptors[digest] = sddl
+
+	def __iter__(self):
+		with _open(self.path) as f:
+			for i in range(self.count + 1):
+				f.readline()
+			for line in f:
+				path, digest = line[:-1].rsplit('\t', 1)
+				yield path, digest
+
+def _acl_drift(acl):
+	drift = {"added": [rs.ace_to_string(a) for a in acl.added], "removed": [rs.ace_to_string(a) for a in acl.removed]}
+	if acl.flags is not None:
+		drift["flags"] = list(acl.flags)
+	return drift
+
+def drift_record(path, d):
+	rec = {"path": path, "status": "changed"}
+	for name in ('owner', 'group'):
+		if getattr(d, name) is not None:
+			rec[name] = list(getattr(d, name))
+	for name in ('dacl', 'sacl'):
+		if getattr(d, name) is not None:
+			rec[name] = _acl_drift(getattr(d, name))
+	return rec
+
+def diff_snapshots(old, new, namespace='file', counters=None):
+	'''Yield a drift record (dict) per added, removed or changed path of two
+	Snapshots, with a sorted merge of their path sections.'''
+	if counters is None:
+		counters = {}
+	for k in ('added', 'removed', 'changed', 'unchanged'):
+		counters[k] = 0
+	diffs = {}									# (old digest, new digest) -> DescriptorDiff
+	a, b = iter(old), iter(new)
+	x, y = next(a, None), next(b, None)
+	while x is not None or y is not None:
+		if y is None or (x is not None and x[0] < y[0]):
+			counters["removed"] += 1
+			yield {"path": x[0], "status": "removed", "sddl": old.descriptors[x[1]]}
+			x = next(a, None)
+		elif x is None or y[0] < x[0]:
+			counters["added"] += 1
+			yield {"path": y[0], "status": "added", "sddl": new.descriptors[y[1]]}
+			y = next(b, None)
+		else:
+			if x[1] != y[1]:
+				key = (x[1], y[1])
+				if key in diffs:
+					d = diffs[key]
+				else:
+					try:
+						d = canonsddl.diff(old.descriptors[x[1]], new.descriptors[y[1]], namespace)
+					except rs.SDDLError as e:
+						d = e
+					if len(diffs) >= DIFF_CACHE:
+						diffs.clear()
+					diffs[key] = d
+				if isinstance(d, rs.SDDLError):
+					counters["changed"] += 1
+					yield {"path": y[0], "status": "changed", "error": str(d)}
+				elif d is not None:
+					counters["changed"] += 1
+					yield drift_record(y[0], d)
+				else:
+					counters["unchanged"] += 1
+			else:
+				counters["unchanged"] += 1
+			x, y = next(a, None), next(b, None)
+
+def write_drift(old, new, out, namespace='file'):
+	counters = {}
+	write = out.write
+	for rec in diff_snapshots(Snapshot(old), Snapshot(new), namespace, counters):
+		write(dumps(rec))
+		write('\n')
+	return "{added} added, {removed} removed, {changed} changed, {unchanged} unchanged paths".format(**counters)
+
+def run(records, snapshot, against=None, out=sys.stdout, namespace='file'):
+	'''Save (path, sddl) records as snapshot, then print the drift against the
+	older snapshot if given. Return a summary line.'''
+	count = save_snapshot(snapshot, records)
+	summary = "{} paths in {}".format(count, snapshot)
+	if against is not None:
+		summary += "; " + write_drift(against, snapshot, out, namespace)
+	return summary
+
+# ================================================== MAIN PROGRAM
+
+def main(argv):
+	args = argv[1:]
+	namespace = 'file'
+	if len(args) > 1 and args[0] == '--namespace':
+		namespace, args = args[1], args[2:]
+	try:
+		if len(args) == 3 and args[0] == '--save':
+			import streamsddl
+			stats = streamsddl.Stats()
+			records = streamsddl.read_records(streamsddl.iter_lines(args[2]), stats)
+			print(run(((path, sddl) for lineno, path, sddl in records), args[1]), file=sys.stderr)
+		elif len(args) == 2:
+			print(write_drift(args[0], args[1], sys.stdout, namespace), file=sys.stderr)
+		else:
+			print(__doc__)
+			sys.exit(0)
+	except (IOError, rs.SDDLError) as e:
+		print("ERROR: {}".format(e), file=sys.stderr)
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main(sys.argv)
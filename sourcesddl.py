@@ -0,0 +1,138 @@
+﻿#-*- coding: utf-8 -*-
+'''Pluggable ACL sources: where the SDDL of a path comes from.
+
+	CaclsSource   cacls <path> /S for single paths, one 'cacls <root>\\* /T /S'
+	              process streamed for a whole tree (Windows)
+	Win32Source   GetFileSecurity through getsddl.get_sddl() (Windows, pywin32)
+	DumpSource    a recorded dump of 'cacls /T /S' output or path<TAB>SDDL lines,
+	              works on any OS
+
+Every source has get(path) -> SDDL and walk(root) -> (path, SDDL) pairs.
+fetch() runs get() over many paths on a bounded thread pool and keeps the
+order of the paths.'''
+
+import os, sys, time, subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import streamsddl, profsddl
+
+THREADS        = 8
+CACLS_ENCODING = 'oem' if os.name == 'nt' else 'utf-8'
+
+# ================================================== Sources:
+
+class AclSource(object):
+	threads = THREADS
+
+	def get(self, path):
+		raise NotImplementedError
+
+	def walk(self, root):
+		for path, sddl, error in fetch(self, iter_tree(root), self.threads):
+			if error is None:
+				yield path, sddl
+			else:
+				print("ERROR: {}: {}".format(path, error), file=sys.stderr)
+
+class CaclsSource(AclSource):
+	def _run(self, target, tree=False):
+		args = ['cacls', target, '/T', '/S'] if tree else ['cacls', target, '/S']
+		proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+		try:
+			for raw in profsddl.timed('cacls', proc.stdout):
+				rec = streamsddl.split_record(raw.decode(CACLS_ENCODING, 'replace'))
+				if rec is not None:
+					yield rec
+		finally:
+			proc.stdout.close()
+			proc.wait()
+
+	def get(self, path):
+		for rec in self._run(path):
+			return rec[1]
+		raise IOError("cacls returned no SDDL for {}".format(path))
+
+	def walk(self, root):
+		if not os.path.isdir(root):
+			yield from self._run(root, tree=True)
+			return
+		yield from self._run(root)				# 'cacls dir\* /T' lists the children only
+		yield from self._run(os.path.join(root, '*'), tree=True)
+
+class Win32Source(AclSource):
+	def __init__(self, threads=THREADS):
+		import getsddl							# needs pywin32
+		self.get_sddl = getsddl.get_sddl
+		self.threads  = threads
+
+	def get(self, path):
+		if not profsddl.ENABLED:
+			return self.get_sddl(path)
+		t0 = time.perf_counter()
+		try:
+			return self.get_sddl(path)
+		finally:
+			profsddl.add_time('GetFileSecurity', time.perf_counter() - t0)
+
+class DumpSource(AclSource):
+	def __init__(self, dump, encoding='utf-8'):
+		self.entries = {}
+		stats = streamsddl.Stats()
+		for lineno, path, sddl in streamsddl.read_records(streamsddl.iter_lines(dump), stats, encoding):
+			self.entries[self._key(path)] = (path, sddl)
+
+	@staticmethod
+	def _key(path):
+		return path.replace('\\', '/').rstrip('/').lower()		# Windows paths are case insensitive
+
+	def get(self, path):
+		try:
+			return self.entries[self._key(path)][1]
+		except KeyError:
+			raise IOError("No SDDL recorded for {}".format(path))
+
+	def walk(self, root):
+		root = self._key(root)
+		for key, entry in self.entries.items():
+			if key == root or key.startswith(root + '/'):
+				yield entry
+
+# ================================================== Scheduler:
+
+def iter_tree(root):
+	yield root
+	for top, dirs, files in os.walk(root):
+		for name in dirs + files:
+			yield os.path.join(top, name)
+
+def fetch(source, paths, threads=THREADS):
+	'''Yield (path, sddl, error) in the order of paths, with at most
+	2 * threads lookups in flight.'''
+	def get(path):
+		try:
+			return path, source.get(path), None
+		except Exception as e:					# IOError, pywintypes.error ...
+			return path, None, e
+	paths = iter(paths)
+	with ThreadPoolExecutor(threads) as pool:
+		pending = deque(pool.submit(get, p) for p in islice(paths, 2 * threads))
+		while pending:
+			result = pending.popleft().result()
+			p = next(paths, None)
+			if p is not None:
+				pending.append(pool.submit(get, p))
+			yield result
+
+SOURCES = {
+	"cacls" : CaclsSource,
+	"win32" : Win32Source,
+}
+
+def open_source(name='cacls', dump=None, threads=THREADS):
+	if dump is not None:
+		return DumpSource(dump)
+	if name == 'win32':
+		return Win32Source(threads)
+	return SOURCES[name]()
@@ -0,0 +1,241 @@
+﻿#-*- coding: utf-8 -*-
+'''Streaming bulk parser for SDDL and cacls dumps.
+
+Input lines may be:
+	D:AI(A;ID;FA;;;SY)...                   plain SDDL
+	C:\\some dir\\file.txt "D:AI(...)"        output of cacls /T /S
+	C:\\some dir\\file.txt<TAB>D:AI(...)      path and SDDL separated by a tab
+
+Files are memory-mapped and read line by line, stdin ("-") is read as a stream,
+so memory use stays constant whatever the size of the dump. Pure Python,
+works on any OS.'''
+
+import os, sys, mmap, time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import readsddl as rs
+import rendersddl, profsddl
+
+MMAP_THRESHOLD = 1 << 20						# smaller files are simply read
+SDDL_TAGS      = ('O:', 'G:', 'D:', 'S:')
+
+# ================================================== Input:
+
+def _mmap_lines(mm, pos=0, end=None):
+	if end is None:
+		end = len(mm)
+	find = mm.find
+	while pos < end:
+		nl = find(b'\n', pos, end)
+		if nl < 0:
+			nl = end
+		yield mm[pos:nl+1]
+		pos = nl + 1
+
+def iter_lines(source):
+	if source == '-':
+		yield from sys.stdin.buffer
+		return
+	with open(source, 'rb') as f:
+		if os.fstat(f.fileno()).st_size < MMAP_THRESHOLD:
+			yield from f
+			return
+		with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+			yield from _mmap_lines(mm)
+
+def split_record(line):
+	line = line.strip()
+	if not line:
+		return None
+	if line.endswith('"'):						# cacls: path "SDDL"
+		q = line.rfind('"', 0, len(line) - 1)
+		if q >= 0:
+			return line[:q].rstrip(), line[q+1:-1]
+	if '\t' in line:
+		path, sddl = line.rsplit('\t', 1)
+		return path, sddl
+	if line[:2] in SDDL_TAGS:
+		return '', line
+	return None
+
+# ================================================== Pipeline:
+
+class Stats(object):
+	def __init__(self):
+		self.lines = self.records = self.aces = self.errors = self.bytes = 0
+		self.cache = None							# counters of the descriptor cache, if any
+		self.start = time.perf_counter()
+
+	def summary(self):
+		dt = max(time.perf_counter() - self.start, 1e-9)
+		text = "{} records, {} ACEs, {} errors, {} bytes in {:.2f} s: {:.0f} records/s, {:.2f} MB/s".format(
+			self.records, self.aces, self.errors, self.bytes, dt, self.records / dt, self.bytes / dt / 1e6)
+		if self.cache is not None:
+			text += "; cache: {hits} hits, {misses} misses, {evictions} evictions".format(**self.cache)
+		return text
+
+def read_records(lines, stats, encoding='utf-8', first=True):
+	for raw in lines:
+		stats.lines += 1
+		stats.bytes += len(raw)
+		line = raw.decode(encoding, 'replace')
+		if first and stats.lines == 1:
+			line = line.lstrip('\ufeff')
+		rec = split_record(line)
+		if rec is not None:
+			yield stats.lines, rec[0], rec[1]
+
+def report_error(lineno, error):
+	print("ERROR: line {}: {}".format(lineno, error), file=sys.stderr)
+
+def parse_records(records, stats, on_error=report_error, cache=None):
+	parse = rs.parse_descriptor if cache is None else cache.parse
+	profile = profsddl.ENABLED
+	for lineno, path, sddl in records:
+		try:
+			sd = parse(sddl)
+		except rs.SDDLError as e:
+			stats.errors += 1
+			on_error(lineno, e)
+			continue
+		stats.records += 1
+		for acl in (sd.dacl, sd.sacl):
+			if acl is not None and acl.aces:
+				stats.aces += len(acl.aces)
+		if profile:
+			_unknown_sids(sd)
+		yield path, sddl, sd
+
+def _unknown_sids(sd):
+	known = rs.SDDL_SIDS
+	for sid in (sd.owner, sd.group):
+		if sid and sid not in known:
+			profsddl.unknown_sid(sid)
+	for acl in (sd.dacl, sd.sacl):
+		if acl is not None and acl.aces:
+			for ace in acl.aces:
+				if ace.sid not in known:
+					profsddl.unknown_sid(ace.sid)
+
+def profile_stats(stats):
+	'''Add the counters of a finished run to the profile, if enabled.'''
+	profsddl.update({"lines": stats.lines, "bytes": stats.bytes, "descriptors": stats.records,
+		"aces": stats.aces, "errors": stats.errors})
+	if stats.cache is not None:
+		profsddl.update({"cache_" + k: v for k, v in stats.cache.items() if k != 'size'})
+
+# ================================================== Output:
+
+def run(source, out, fmt='jsonl', namespace='any', encoding='utf-8', cache=None, resolver=None, input=None):
+	'''Parse and render a dump; input ldif, reg or regini reads other sources
+	through ingestsddl.'''
+	stats = Stats()
+	if input is None:
+		records = read_records(iter_lines(source), stats, encoding)
+	else:
+		import ingestsddl
+		records = ingestsddl.read_source(source, input, stats)
+	records = profsddl.timed('read', records)
+	records = profsddl.timed('parse', parse_records(records, stats, cache=cache))
+	rendersddl.write_records(records, out, fmt, namespace, resolver=resolver)
+	out.flush()
+	if cache is not None:
+		stats.cache = cache.counters()
+	profile_stats(stats)
+	return stats
+
+# ================================================== Parallel parsing:
+
+# The input file is split into newline aligned byte ranges. Each worker maps
+# the file itself, parses its range and sends back the rendered output as one
+# UTF-8 blob plus a tuple of counters, so nothing but bytes crosses the pool.
+# Results are written in input order; at most 2 * workers chunks are in flight.
+# Every worker keeps its own descriptor cache across chunks; with a cache file
+# the workers start warm from it and report the SDDL strings they had to parse,
+# which are added to the cache of the calling process.
+
+CHUNK_SIZE = 16 << 20
+
+def split_ranges(source, chunk_size=CHUNK_SIZE):
+	with open(source, 'rb') as f:
+		size = os.fstat(f.fileno()).st_size
+		if size == 0:
+			return []
+		ranges = []
+		with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+			start = 0
+			while start < size:
+				end = min(start + chunk_size, size)
+				if end < size:
+					nl = mm.find(b'\n', end - 1)
+					end = size if nl < 0 else nl + 1
+				ranges.append((start, end))
+				start = end
+		return ranges
+
+_worker_cache = None
+
+def parse_chunk(task):
+	global _worker_cache
+	source, start, end, fmt, namespace, encoding, cache_size, cache_file = task
+	cache = None
+	if cache_size:
+		if _worker_cache is None:
+			import cachesddl
+			_worker_cache = cachesddl.DescriptorCache(cache_size, cache_file, track=bool(cache_file))
+		cache = _worker_cache
+		before = (cache.hits, cache.misses, cache.evictions)
+	stats, errors = Stats(), []
+	with open(source, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+		records = read_records(_mmap_lines(mm, start, end), stats, encoding, start == 0)
+		records = parse_records(records, stats, lambda lineno, e: errors.append((lineno, str(e))), cache)
+		text = rendersddl.render(records, fmt, namespace, False)
+	counters = (stats.lines, stats.records, stats.aces, stats.errors, stats.bytes)
+	new = []
+	if cache is not None:
+		counters += (cache.hits - before[0], cache.misses - before[1], cache.evictions - before[2])
+		if cache.new:
+			new, cache.new = cache.new, []
+	return text.encode('utf-8'), counters, errors, new
+
+def run_parallel(source, out, fmt='jsonl', namespace='any', encoding='utf-8', workers=None, chunk_size=CHUNK_SIZE, cache=None):
+	workers = workers or os.cpu_count() or 1
+	stats = Stats()
+	out.flush()
+	write = getattr(out, 'buffer', out).write
+	write(rendersddl.renderer(fmt, namespace).header.encode('utf-8'))
+	lines = 0
+	cache_size, cache_file = (cache.maxsize, cache.path) if cache is not None else (0, None)
+	if cache is not None:
+		stats.cache = {"hits": 0, "misses": 0, "evictions": 0}
+	tasks = iter([(source, start, end, fmt, namespace, encoding, cache_size, cache_file)
+		for start, end in split_ranges(source, chunk_size)])
+	with ProcessPoolExecutor(workers) as pool:
+		pending = deque(pool.submit(parse_chunk, t) for t in islice(tasks, 2 * workers))
+		while pending:
+			with profsddl.stage('workers'):
+				data, counters, errors, new = pending.popleft().result()
+			t = next(tasks, None)
+			if t is not None:
+				pending.append(pool.submit(parse_chunk, t))
+			for lineno, e in errors:
+				report_error(lines + lineno, e)
+			with profsddl.stage('write'):
+				write(data)
+			lines += counters[0]
+			stats.records += counters[1]
+			stats.aces    += counters[2]
+			stats.errors  += counters[3]
+			stats.bytes   += counters[4]
+			if cache is not None:
+				stats.cache["hits"]      += counters[5]
+				stats.cache["misses"]    += counters[6]
+				stats.cache["evictions"] += counters[7]
+				for sddl in new:
+					cache.parse(sddl)
+	stats.lines = lines
+	out.flush()
+	profile_stats(stats)
+	return stats
@@ -0,0 +1,24 @@
+﻿#-*- coding: utf-8 -*-
+'''Tests of accesssddl.py (python -m pytest).'''
+
+import pytest
+
+import readsddl as rs
+import accesssddl
+
+OWNER = rs.C_READ_CONTROL | rs.C_WRITE_DAC
+
+@pytest.mark.parametrize('use_numpy', [False, True])
+@pytest.mark.parametrize('sddl, expected', [
+	('O:BUD:(D;;WD;;;BU)', OWNER),						# a deny ACE does not take the owner rights
+	('O:BUD:(D;;RCWD;;;BU)(A;;FR;;;BU)', OWNER | (rs.C_FILE_GENERIC_READ & ~rs.C_READ_CONTROL)),
+	('O:BUD:(A;;FR;;;BU)', rs.C_FILE_GENERIC_READ | rs.C_WRITE_DAC),
+	('O:BUD:(A;;FR;;;OW)', 0),							# OWNER RIGHTS replaces them
+	('O:SYD:(D;;WD;;;BU)', 0),
+])
+def test_owner_rights(sddl, expected, use_numpy):
+	if use_numpy and accesssddl.np is None:
+		pytest.skip('numpy is not installed')
+	evaluator = accesssddl.AccessEvaluator(['BU'], 'file', use_numpy=use_numpy)
+	assert evaluator.evaluate_many([sddl]) == [expected]
+	assert evaluator.evaluate(sddl) == expected
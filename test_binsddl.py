@@ -0,0 +1,46 @@
+﻿#-*- coding: utf-8 -*-
+'''Tests of binsddl.py (python -m pytest).'''
+
+import struct
+
+import pytest
+
+import readsddl as rs
+import binsddl
+
+def _string(token, text):
+	raw = text.encode('utf-16-le')
+	return bytes([token]) + struct.pack('<I', len(raw)) + raw
+
+def _callback_descriptor(appdata):
+	'''O:BA D:(XA;;FA;;;WD;<appdata>) as a self-relative blob.'''
+	sid = binsddl.encode_sid('WD')
+	body = sid + appdata
+	body += b'\0' * (-len(body) % 4)
+	ace = struct.pack('<BBHI', rs.SDDL_TYPE['XA'][2], 0, 8 + len(body), rs.rights_to_mask('FA')) + body
+	acl = struct.pack('<BBHHH', 2, 0, 8 + len(ace), 1, 0) + ace
+	owner = binsddl.encode_sid('BA')
+	header = struct.pack('<BBHIIII', 1, 0, binsddl.SE_SELF_RELATIVE | binsddl.SE_DACL_PRESENT, 20 + len(acl), 0, 0, 20)
+	return header + acl + owner
+
+def test_condition():
+	ba = binsddl.encode_sid('BA')
+	code = (binsddl.CONDITION_MAGIC
+		+ _string(0xf9, 'dept') + _string(0x10, 'Eng') + b'\x80'
+		+ b'\x50' + struct.pack('<I', 5 + len(ba)) + b'\x51' + struct.pack('<I', len(ba)) + ba + b'\x89'
+		+ b'\xa0'
+		+ _string(0xfb, 'level') + b'\x03' + struct.pack('<qBB', 16, 3, 3) + b'\x85'
+		+ b'\xa1')
+	sd, end = binsddl.decode_descriptor(_callback_descriptor(code))
+	condition = sd.dacl.aces[0].condition
+	assert condition == '(((@User.dept == "Eng") && (Member_of {SID(BA)})) || (@Device.level >= 0x10))'
+	assert rs.descriptor_to_string(sd) == 'O:BAD:(XA;;FA;;;WD;{})'.format(condition)
+	assert rs.parse_descriptor(rs.descriptor_to_string(sd)) == sd
+
+def test_callback_without_condition():
+	sd, end = binsddl.decode_descriptor(_callback_descriptor(b''))
+	assert sd.dacl.aces[0].condition == ''
+
+def test_unknown_application_data():
+	with pytest.raises(rs.SDDLError):
+		binsddl.decode_descriptor(_callback_descriptor(b'\x01\x02\x03\x04'))
@@ -0,0 +1,32 @@
+﻿#-*- coding: utf-8 -*-
+'''Tests of canonsddl.py (python -m pytest).'''
+
+import readsddl as rs
+import canonsddl
+
+def test_inherited_order_is_kept():
+	deny_first = 'D:(D;ID;FA;;;WD)(A;ID;FA;;;WD)'
+	allow_first = 'D:(A;ID;FA;;;WD)(D;ID;FA;;;WD)'
+	assert canonsddl.digest_sddl(deny_first) != canonsddl.digest_sddl(allow_first)
+	d = canonsddl.diff(deny_first, allow_first)
+	assert d is not None and d.dacl.added and d.dacl.removed
+
+def test_explicit_order():
+	sd = rs.parse_descriptor('D:(A;;GA;;;WD)(A;ID;FA;;;SY)(D;;FA;;;BA)(A;;FR;;;WD)')
+	assert canonsddl.canonical_string(sd) == 'D:(D;;FA;;;BA)(A;;FA;;;WD)(A;ID;FA;;;SY)'
+
+def test_adjacent_inherited_merge():
+	assert canonsddl.canonical_string(rs.parse_descriptor('D:(A;ID;FR;;;WD)(A;ID;FW;;;WD)')) == \
+		canonsddl.canonical_string(rs.parse_descriptor('D:(A;ID;FRFW;;;WD)'))
+	separated = rs.parse_descriptor('D:(A;ID;FR;;;WD)(D;ID;FW;;;WD)(A;ID;FW;;;WD)')
+	assert len(canonsddl.canonicalize(separated).dacl.aces) == 3
+
+def test_equivalent_spellings():
+	a = 'O:S-1-5-32-544D:(A;;GA;;;S-1-1-0)(A;;0;;;SY)'
+	b = 'O:BAD:(A;;FA;;;WD)'
+	assert canonsddl.digest_sddl(a) == canonsddl.digest_sddl(b)
+	assert canonsddl.diff(a, b) is None
+	assert list(canonsddl.diff_many([(a, b), (b, 'O:BAD:(A;;FR;;;WD)')])) == [(1, canonsddl.diff(b, 'O:BAD:(A;;FR;;;WD)'))]
+
+def test_digest_is_stable():
+	assert canonsddl.digest_sddl('D:(A;;FA;;;WD)').hex() == '176bdbc689bb4f7267f4f086a11a311f'
@@ -0,0 +1,53 @@
+﻿#-*- coding: utf-8 -*-
+'''Tests of condsddl.py (python -m pytest).'''
+
+import pytest
+
+import readsddl as rs
+import condsddl
+
+ENG = condsddl.Claims(user={"Department": "eng", "level": 3}, device={"managed": True}, sids=['S-1-5-32-544'])
+NONE = condsddl.Claims()
+
+@pytest.mark.parametrize('text, eng, none', [
+	('(@User.Department == "Eng")', True, None),			# case insensitive; missing attribute is UNKNOWN
+	('(@User.Department != "Eng")', False, None),
+	('(@User.level >= 2)', True, None),
+	('(Exists @User.level)', True, False),
+	('(Not_Exists @User.level)', False, True),
+	('(!(@User.level < 2))', True, None),
+	('(Member_of {SID(BA)})', True, False),
+	('(@User.Department Any_of {"eng", "ops"})', True, None),
+	# && / || over UNKNOWN: False && UNKNOWN is False, True || UNKNOWN is True
+	('((Member_of {SID(BA)}) && (@User.Department == "Eng"))', True, False),
+	('((Member_of {SID(BA)}) || (@User.Department == "Eng"))', True, None),
+	('((Not_Exists @User.level) || (@User.level == 9))', False, True),
+	('((Exists @User.level) && (@User.level == 9))', False, False),
+	('(@Device.managed)', True, None),
+])
+def test_three_valued(text, eng, none):
+	f = condsddl.compile_condition(text)
+	assert f(ENG) is eng
+	assert f(NONE) is none
+
+def test_ace_applies():
+	allow = rs.parse_ace('XA;;FA;;;WD;(@User.clearance == "high")')
+	deny = rs.parse_ace('XD;;FA;;;WD;(@User.clearance == "high")')
+	assert not condsddl.ace_applies(allow, NONE)				# UNKNOWN: allow ACEs do not apply ...
+	assert condsddl.ace_applies(deny, NONE)					# ... deny ACEs do
+	low = condsddl.Claims(user={"clearance": "low"})
+	assert not condsddl.ace_applies(deny, low)
+
+def test_evaluate_batch():
+	assert condsddl.evaluate_batch(['(@User.level == 3)', '(Exists @User.x)'], [ENG, NONE]) == [[True, None], [False, False]]
+
+@pytest.mark.parametrize('text', ['(@User.level ==)', '((@User.level == 1)', '(@User.x == "a" &&)'])
+def test_invalid(text):
+	with pytest.raises(rs.SDDLError):
+		condsddl.compile_condition(text)
+
+def test_claims_from_dict():
+	with pytest.raises(rs.SDDLError):
+		condsddl.Claims.from_dict({"user": "x"})
+	claims = condsddl.Claims.from_dict({"user": {"Level": [1, 2]}, "sids": ["S-1-1-0"]})
+	assert condsddl.evaluate('((@User.level Contains 2) && (Member_of {SID(WD)}))', claims) is True
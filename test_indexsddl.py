@@ -0,0 +1,51 @@
+﻿#-*- coding: utf-8 -*-
+'''Tests of indexsddl.py (python -m pytest).'''
+
+import pytest
+
+import readsddl as rs
+import indexsddl
+
+GUID = 'bf9679c0-0de6-11d0-a285-00aa003049e2'
+
+def _records(pairs):
+	return [(path, sddl, rs.parse_descriptor(sddl)) for path, sddl in pairs]
+
+@pytest.fixture
+def index(tmp_path):
+	index = indexsddl.SddlIndex(str(tmp_path / 'index.db'))
+	index.update(_records([
+		('C:/a', 'D:(A;;FA;;;WD)'),
+		('C:/b', 'D:(A;;FR;;;WD)(D;;FW;;;BU)'),
+		('C:/c', 'D:(XA;;FA;;;WD;(@User.x == 1))(XD;;FW;;;BU;(@User.x == 1))'),
+		('C:/d', 'D:(A;OICIIO;FA;;;WD)'),
+		('C:/e', 'D:(OA;;WP;{0};;WD)(OD;;WP;{0};;BU)(OA;;FA;;{0};BA)'.format(GUID)),
+	]))
+	yield index
+	index.close()
+
+def _paths(rows):
+	return [(path, sid, mask) for path, sid, mask, kind in rows]
+
+def test_query(index):
+	fa, fw = rs.rights_to_mask('FA'), indexsddl.right_mask('FW')
+	assert _paths(index.query(['WD'], 'FW')) == [('C:/a', 'WD', fa)]
+	assert [p for p, sid, mask in _paths(index.query(['S-1-1-0']))] == ['C:/a', 'C:/b']
+	assert _paths(index.query(['BU'], deny=True)) == [('C:/b', 'BU', fw)]
+
+def test_conditional_rows(index):
+	assert 'C:/c' not in [p for p, sid, mask in _paths(index.query(['WD']))]
+	rows = [row for row in index.query(['WD'], conditional=True) if row[0] == 'C:/c']
+	assert [kind for path, sid, mask, kind in rows] == [indexsddl.KIND_ALLOW | indexsddl.KIND_CONDITIONAL]
+	rows = list(index.query(['BU'], deny=True, conditional=True))
+	assert [(path, kind) for path, sid, mask, kind in rows] == [('C:/b', indexsddl.KIND_DENY), ('C:/c', indexsddl.KIND_DENY | indexsddl.KIND_CONDITIONAL)]
+
+def test_object_aces():
+	sd = rs.parse_descriptor('D:(OA;;WP;{0};;WD)(OD;;WP;{0};;BU)(OA;;RP;;{0};BA)'.format(GUID))
+	assert indexsddl.descriptor_grants(sd, 'ds') == {('BA', indexsddl.KIND_ALLOW): rs.rights_to_mask('RP')}
+
+def test_update(index):
+	counters = index.update(_records([('C:/a', 'D:(A;;GA;;;WD)'), ('C:/b', 'D:(A;;FA;;;SY)')]), full=True)
+	assert counters == {"added": 0, "changed": 1, "unchanged": 1, "removed": 3}
+	assert _paths(index.query(['SY'])) == [('C:/b', 'SY', rs.rights_to_mask('FA'))]
+	assert index.stats() == {"paths": 2, "descriptors": 2, "grants": 2}
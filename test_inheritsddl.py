@@ -0,0 +1,43 @@
+﻿#-*- coding: utf-8 -*-
+'''Tests of inheritsddl.py (python -m pytest).'''
+
+import readsddl as rs
+import inheritsddl
+
+ROOT = rs.parse_descriptor('O:BAG:SYD:AI(A;OICI;FA;;;SY)(A;OICIIO;GA;;;CO)(A;CINP;FR;;;BU)(A;OI;FX;;;WD)')
+
+def _sddl(sd):
+	return rs.descriptor_to_string(sd)
+
+def test_folder():
+	assert _sddl(inheritsddl.inherit(ROOT, True)) == ('O:BAG:SYD:AI(A;OICIID;FA;;;SY)'
+		'(A;ID;FA;;;BA)(A;OICIIOID;GA;;;CO)'				# CREATOR OWNER split: effective + inherit-only
+		'(A;ID;FR;;;BU)'									# NP: effective here, not passed on
+		'(A;OIIOID;FX;;;WD)')								# OI only: kept for the files below
+
+def test_file():
+	assert _sddl(inheritsddl.inherit(ROOT, False)) == 'O:BAG:SYD:AI(A;ID;FA;;;SY)(A;ID;FA;;;BA)(A;ID;FX;;;WD)'
+
+def test_second_level():
+	folder = inheritsddl.inherit(ROOT, True)
+	assert _sddl(inheritsddl.inherit(folder, True)) == 'O:BAG:SYD:AI(A;OICIID;FA;;;SY)(A;ID;FA;;;BA)(A;OICIIOID;GA;;;CO)(A;OIIOID;FX;;;WD)'
+	assert _sddl(inheritsddl.inherit(folder, False)) == 'O:BAG:SYD:AI(A;ID;FA;;;SY)(A;ID;FA;;;BA)(A;ID;FX;;;WD)'
+
+def test_child_owner_and_explicit_aces():
+	child = rs.parse_descriptor('O:BUD:(A;;FA;;;BA)(A;ID;FR;;;WD)')		# stale inherited ACEs are replaced
+	assert _sddl(inheritsddl.inherit(ROOT, True, child)) == ('O:BUG:SYD:AI(A;;FA;;;BA)(A;OICIID;FA;;;SY)'
+		'(A;ID;FA;;;BU)(A;OICIIOID;GA;;;CO)(A;ID;FR;;;BU)(A;OIIOID;FX;;;WD)')
+
+def test_protected():
+	child = rs.parse_descriptor('D:P(A;;FA;;;BA)')
+	assert _sddl(inheritsddl.inherit(ROOT, True, child)) == 'O:BAG:SYD:P(A;;FA;;;BA)'
+
+def test_propagate_and_what_if():
+	nodes = inheritsddl.tree_nodes('C:/r', [('C:/r', True), ('C:/r/d/f.txt', False), ('C:/r/g.txt', False)])
+	assert [(key, container) for key, path, container in nodes] == [('c:/r', True), ('c:/r/d', True), ('c:/r/d/f.txt', False), ('c:/r/g.txt', False)]
+	tree = dict(inheritsddl.propagate('C:/r', ROOT, nodes))
+	assert _sddl(tree['C:/r/d/f.txt']) == _sddl(inheritsddl.inherit(inheritsddl.inherit(ROOT, True), False))
+	new = rs.parse_descriptor('O:BAG:SYD:AI(A;OICI;FA;;;SY)(A;OICIIO;GA;;;CO)(A;CINP;FR;;;BU)')
+	changes = dict(inheritsddl.what_if('C:/r', ROOT, new, nodes))
+	assert sorted(changes) == ['C:/r', 'C:/r/d/f.txt', 'C:/r/g.txt', 'c:/r/d']		# implied folders are named by key
+	assert [rs.ace_to_string(a) for a in changes['C:/r/g.txt'].dacl.removed] == ['A;ID;FX;;;WD']
@@ -0,0 +1,24 @@
+﻿#-*- coding: utf-8 -*-
+'''Tests of readsddl.py (python -m pytest).'''
+
+import pytest
+
+import readsddl as rs
+
+@pytest.mark.parametrize('sddl', [
+	'O:BAG:SYD:AI(A;ID;FA;;;SY)',
+	'O:BAG:SYD:AI(A;ID;FA;;;SY)\n',
+	'O:BAG:SYD:AI(A;ID;FA;;;SY) \r\n',
+	'  O:BAG:SYD:AI(A;ID;FA;;;SY)\t',
+])
+def test_surrounding_whitespace(sddl):
+	sd = rs.parse_descriptor(sddl)
+	assert sd == rs.parse_descriptor('O:BAG:SYD:AI(A;ID;FA;;;SY)')
+	assert rs.descriptor_to_string(sd) == 'O:BAG:SYD:AI(A;ID;FA;;;SY)'
+
+def test_trailing_owner_whitespace():
+	assert rs.parse_descriptor('D:(A;;FA;;;SY)O:BA\n').owner == 'BA'
+
+def test_invalid_section():
+	with pytest.raises(rs.SDDLError):
+		rs.parse_descriptor('D:(A;;FA;;;SY) X')
@@ -0,0 +1,67 @@
+﻿#-*- coding: utf-8 -*-
+'''Tests of sidsddl.py (python -m pytest).'''
+
+import sidsddl
+
+USER = 'S-1-5-21-1-2-3-1000'
+GONE = 'S-1-5-21-1-2-3-1001'
+
+class CountingBackend(sidsddl.SidBackend):
+	threads = 1
+
+	def __init__(self, names, failing=()):
+		self.names = names
+		self.failing = set(failing)
+		self.calls = []
+
+	def lookup(self, sid):
+		self.calls.append(sid)
+		if sid in self.failing:
+			raise IOError("lookup failed")
+		return self.names.get(sid)
+
+def test_cache_ttl(monkeypatch):
+	now = [1000.0]
+	monkeypatch.setattr(sidsddl.time, 'time', lambda: now[0])
+	cache = sidsddl.SidCache(ttl=60)
+	cache.put(USER, 'DOM\\alice')
+	cache.put(GONE, None)									# unknown SIDs are cached too
+	assert cache.get(USER) == (True, 'DOM\\alice')
+	assert cache.get(GONE) == (True, None)
+	now[0] += 61
+	assert cache.get(USER) == (False, None)
+	assert cache.counters() == {"hits": 2, "misses": 1, "expired": 1, "size": 1}
+
+def test_cache_lru():
+	cache = sidsddl.SidCache(maxsize=2)
+	for sid in ('S-1-5-21-1', 'S-1-5-21-2', 'S-1-5-21-3'):
+		cache.put(sid, sid)
+	assert cache.get('S-1-5-21-1') == (False, None)
+	assert len(cache) == 2
+
+def test_cache_file(tmp_path, monkeypatch):
+	path = str(tmp_path / 'sids.cache')
+	cache = sidsddl.SidCache(ttl=60, path=path)
+	cache.put(USER, 'DOM\\alice')
+	cache.save()
+	assert sidsddl.SidCache(path=path).get(USER) == (True, 'DOM\\alice')
+	real = sidsddl.time.time
+	monkeypatch.setattr(sidsddl.time, 'time', lambda: real() + 120)
+	assert len(sidsddl.SidCache(path=path)) == 0				# expired entries are not loaded
+
+def test_resolver_looks_up_once():
+	backend = CountingBackend({USER: 'DOM\\alice'}, failing=[GONE])
+	resolver = sidsddl.SidResolver(backend)
+	names = resolver.resolve_many([USER, USER, 'BA', 'S-1-5-32-544', GONE])
+	assert names == {USER: 'DOM\\alice', 'BA': 'BUILTIN_ADMINISTRATORS', 'S-1-5-32-544': 'BUILTIN_ADMINISTRATORS', GONE: None}
+	assert sorted(backend.calls) == [USER, GONE]				# well known SIDs never reach the backend
+	resolver.resolve_many([USER, GONE])
+	assert sorted(backend.calls) == [USER, GONE]				# answers of this run are kept
+	assert resolver.cache.get(USER) == (True, 'DOM\\alice')
+	assert resolver.cache.get(GONE) == (False, None)			# failed lookups are not cached
+
+def test_mapping_file(tmp_path):
+	path = tmp_path / 'names.tsv'
+	path.write_text('sid\tname\n{}\tDOM\\alice\n'.format(USER.lower()))
+	backend = sidsddl.MappingBackend(str(path))
+	assert backend.lookup_many([USER, GONE]) == {USER: 'DOM\\alice', GONE: None}
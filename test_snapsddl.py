@@ -0,0 +1,48 @@
+﻿#-*- coding: utf-8 -*-
+'''Tests of snapsddl.py (python -m pytest).'''
+
+import pytest
+
+import readsddl as rs
+import snapsddl
+
+OLD = [
+	('C:/a', 'D:(A;;FA;;;SY)'),
+	('C:/b', 'D:(A;;FA;;;BA)'),
+	('C:/c', 'D:(A;;FR;;;WD)'),
+	('C:/d', 'D:(A;;GA;;;WD)'),
+]
+NEW = [
+	('C:/d', 'D:(A;;FA;;;WD)'),							# same policy, other spelling
+	('C:/b', 'D:(A;;FA;;;BA)(A;;FR;;;BU)'),
+	('C:/a', 'D:(A;;FA;;;SY)'),
+	('C:/e', 'D:(A;;FA;;;SY)'),
+]
+
+@pytest.mark.parametrize('run_size', [1, 1000])
+def test_drift(tmp_path, run_size):
+	old, new = str(tmp_path / 'old.snap'), str(tmp_path / 'new.snap.gz')
+	assert snapsddl.save_snapshot(old, OLD, run_size) == 4
+	assert snapsddl.save_snapshot(new, NEW, run_size) == 4
+	assert [path for path, digest in snapsddl.Snapshot(new)] == ['C:/a', 'C:/b', 'C:/d', 'C:/e']
+	counters = {}
+	drift = list(snapsddl.diff_snapshots(snapsddl.Snapshot(old), snapsddl.Snapshot(new), counters=counters))
+	assert counters == {"added": 1, "removed": 1, "changed": 1, "unchanged": 2}
+	assert drift == [
+		{"path": 'C:/b', "status": "changed", "dacl": {"added": ['A;;FR;;;BU'], "removed": []}},
+		{"path": 'C:/c', "status": "removed", "sddl": 'D:(A;;FR;;;WD)'},
+		{"path": 'C:/e', "status": "added", "sddl": 'D:(A;;FA;;;SY)'},
+	]
+
+@pytest.mark.parametrize('run_size', [1, 1000])
+def test_last_record_wins(tmp_path, run_size):
+	path = str(tmp_path / 'x.snap')
+	snapsddl.save_snapshot(path, [('C:/a', 'D:(A;;FA;;;BA)'), ('C:/a', 'D:(A;;FA;;;WD)')], run_size)
+	snap = snapsddl.Snapshot(path)
+	assert [snap.descriptors[digest] for p, digest in snap] == ['D:(A;;FA;;;WD)']
+
+def test_not_a_snapshot(tmp_path):
+	path = tmp_path / 'bad.snap'
+	path.write_text('junk\n')
+	with pytest.raises(rs.SDDLError):
+		snapsddl.Snapshot(str(path))